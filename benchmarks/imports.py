@@ -0,0 +1,63 @@
+""" Benchmarks of the time taken to import the package and its parts.
+
+Each import runs in a fresh interpreter, repeated to smooth out noise::
+
+    python -m benchmarks.imports --repeat 20
+
+Pass ``--output`` to store the results and ``--compare`` to print the
+change relative to results stored from another commit.
+"""
+import argparse
+import subprocess
+import sys
+
+from benchmarks import utils
+
+SCENARIOS = {
+    'baseline.sqlalchemy': 'import sqlalchemy',
+    'package': 'import nameko_sqlalchemy',
+    'constants': 'from nameko_sqlalchemy import DB_URIS_KEY',
+    'transaction_retry': 'from nameko_sqlalchemy import transaction_retry',
+    'database': 'from nameko_sqlalchemy import Database',
+    'pytest_fixtures': 'import nameko_sqlalchemy.pytest_fixtures',
+}
+
+TIMER = '''
+import time
+start = time.perf_counter()
+{}
+print(time.perf_counter() - start)
+'''
+
+COLUMNS = ('mean_us', 'p50_us', 'max_us')
+
+
+def time_import(statement):
+    output = subprocess.check_output(
+        [sys.executable, '-W', 'ignore', '-c', TIMER.format(statement)])
+    return float(output)
+
+
+def run(repeat=10, only=None):
+    results = {}
+    for name, statement in SCENARIOS.items():
+        if only and only not in name:
+            continue
+        timings = [time_import(statement) for _ in range(repeat)]
+        results[name] = utils.summarize(timings, sum(timings))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument(
+        '--only', help='only run scenarios containing this string')
+    utils.add_common_arguments(parser)
+    args = parser.parse_args(argv)
+
+    utils.report(run(args.repeat, args.only), args, COLUMNS)
+
+
+if __name__ == '__main__':
+    main()
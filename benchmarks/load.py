@@ -0,0 +1,225 @@
+""" Load generator running many concurrent workers against a real container.
+
+Starts a :class:`~nameko.containers.ServiceContainer` hosting a service that
+uses either the ``Database`` or the ``DatabaseSession`` provider, fires
+entrypoint calls with a configurable read/write mix and reports
+throughput, tail latency and the time workers spent waiting for a pooled
+connection::
+
+    python -m benchmarks.load --calls 5000 --concurrency 100 \\
+        --read-ratio 0.9 --pool-size 5 --max-overflow 10
+
+Use it to validate pool sizing and ``transaction_retry`` settings before
+rolling them out.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from eventlet import GreenPool
+from eventlet.event import Event
+from nameko.constants import MAX_WORKERS_CONFIG_KEY
+from nameko.containers import ServiceContainer
+from nameko.testing.services import dummy
+from sqlalchemy import Column, Integer, String, func, select
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import QueuePool
+
+from benchmarks import utils
+from nameko_sqlalchemy import DB_URIS_KEY, Database, DatabaseSession, transaction_retry
+
+COLUMNS = ('ops_per_sec', 'p50_us', 'p90_us', 'p99_us', 'max_us', 'errors')
+
+DeclBase = declarative_base(name='loadbase')
+
+
+class LoadModel(DeclBase):
+    __tablename__ = 'load'
+    id = Column(Integer, primary_key=True)
+    data = Column(String(100))
+
+
+def make_service(provider, engine_options, retry_options):
+    """ Build a service class using ``provider`` with the given settings.
+    """
+    retry = transaction_retry(**retry_options)
+
+    if provider == 'database':
+
+        class LoadService(object):
+            name = 'loadservice'
+
+            db = Database(DeclBase, engine_options=engine_options)
+
+            @dummy
+            @retry
+            def read(self):
+                with self.db.get_session() as session:
+                    return session.execute(
+                        select(func.count(LoadModel.id))).scalar()
+
+            @dummy
+            @retry
+            def write(self, data):
+                with self.db.get_session() as session:
+                    session.add(LoadModel(data=data))
+
+    else:
+
+        class LoadService(object):  # type: ignore[no-redef]
+            name = 'loadservice'
+
+            db = DatabaseSession(DeclBase, engine_options=engine_options)
+
+            @dummy
+            @retry
+            def read(self):
+                return self.db.execute(
+                    select(func.count(LoadModel.id))).scalar()
+
+            @dummy
+            @retry
+            def write(self, data):
+                self.db.add(LoadModel(data=data))
+                self.db.commit()
+
+    return LoadService
+
+
+def instrument_pool(pool, waits):
+    """ Record how long each connection checkout from ``pool`` takes, which
+    is the time a worker waits for a pooled connection (including
+    connecting, when the pool has to open a new one).
+    """
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            waits.append(time.perf_counter() - start)
+
+    pool.connect = timed_connect
+
+
+def run(db_uri=None, provider='database', calls=1000, concurrency=50,
+        read_ratio=0.8, pool_size=None, max_overflow=10, pool_timeout=30,
+        retry_total=1, retry_backoff=0):
+    tmpdir = None
+    if db_uri is None:
+        tmpdir = tempfile.mkdtemp()
+        db_uri = 'sqlite:///{}'.format(os.path.join(tmpdir, 'load.db'))
+
+    engine_options = {}
+    if pool_size is not None:
+        engine_options.update(
+            poolclass=QueuePool, pool_size=pool_size,
+            max_overflow=max_overflow, pool_timeout=pool_timeout)
+    service_cls = make_service(
+        provider, engine_options,
+        {'total': retry_total, 'backoff_factor': retry_backoff})
+
+    config = {
+        DB_URIS_KEY: {'loadservice:loadbase': db_uri},
+        MAX_WORKERS_CONFIG_KEY: concurrency,
+    }
+    container = ServiceContainer(service_cls, config)
+    container.start()
+
+    waits = []
+    latencies = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+
+    try:
+        provider = next(iter(container.dependencies))
+        DeclBase.metadata.create_all(provider.engine)
+        instrument_pool(provider.engine.pool, waits)
+
+        # spread the writes evenly between the reads
+        kinds = [
+            'read' if int((index + 1) * read_ratio) > int(index * read_ratio)
+            else 'write'
+            for index in range(calls)
+        ]
+
+        entrypoints = {
+            entrypoint.method_name: entrypoint
+            for entrypoint in container.entrypoints
+        }
+        arguments = {'read': (), 'write': ('x' * 50,)}
+
+        def call(kind):
+            done = Event()
+
+            def handle_result(worker_ctx, result, exc_info):
+                done.send(exc_info)
+                return result, exc_info
+
+            start = time.perf_counter()
+            container.spawn_worker(
+                entrypoints[kind], arguments[kind], {},
+                handle_result=handle_result)
+            if done.wait() is not None:
+                errors[kind] += 1
+            latencies[kind].append(time.perf_counter() - start)
+
+        green_pool = GreenPool(concurrency)
+        start = time.perf_counter()
+        for _ in green_pool.imap(call, kinds):
+            pass
+        elapsed = time.perf_counter() - start
+    finally:
+        container.stop()
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+    results = {}
+    for kind in ('read', 'write'):
+        if latencies[kind]:
+            results[kind] = utils.summarize(latencies[kind], elapsed)
+            results[kind]['errors'] = errors[kind]
+    results['all'] = utils.summarize(
+        latencies['read'] + latencies['write'], elapsed)
+    results['all']['errors'] = errors['read'] + errors['write']
+    if waits:
+        results['pool_wait'] = utils.summarize(waits, elapsed)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--db-uri', help='defaults to a temporary SQLite database file')
+    parser.add_argument(
+        '--provider', choices=['database', 'database_session'],
+        default='database')
+    parser.add_argument('--calls', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument(
+        '--read-ratio', type=float, default=0.8,
+        help='fraction of calls that only read')
+    parser.add_argument(
+        '--pool-size', type=int,
+        help='use a QueuePool of this size instead of the dialect default')
+    parser.add_argument('--max-overflow', type=int, default=10)
+    parser.add_argument('--pool-timeout', type=float, default=30)
+    parser.add_argument('--retry-total', type=int, default=1)
+    parser.add_argument('--retry-backoff', type=float, default=0)
+    utils.add_common_arguments(parser)
+    args = parser.parse_args(argv)
+
+    results = run(
+        db_uri=args.db_uri, provider=args.provider, calls=args.calls,
+        concurrency=args.concurrency, read_ratio=args.read_ratio,
+        pool_size=args.pool_size, max_overflow=args.max_overflow,
+        pool_timeout=args.pool_timeout, retry_total=args.retry_total,
+        retry_backoff=args.retry_backoff,
+    )
+    utils.report(results, args, columns=COLUMNS)
+
+
+if __name__ == '__main__':
+    main()
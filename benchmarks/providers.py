@@ -0,0 +1,258 @@
+""" Benchmarks of the per-worker overhead added by the dependency providers.
+
+Runs against an in-memory SQLite database by default::
+
+    python -m benchmarks.providers --iterations 20000 --concurrency 50
+
+Pass ``--output`` to store the results and ``--compare`` to print the
+change relative to results stored from another commit.
+"""
+import argparse
+import operator
+
+import wrapt
+from nameko.containers import ServiceContainer, WorkerContext
+from sqlalchemy import Column, Integer, String, text
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import StaticPool
+
+from benchmarks import utils
+from nameko_sqlalchemy import DB_URIS_KEY, Database, DatabaseSession, transaction_retry
+from nameko_sqlalchemy.database import DatabaseWrapper
+
+DeclBase = declarative_base(name='benchbase')
+
+
+class BenchModel(DeclBase):
+    __tablename__ = 'bench'
+    id = Column(Integer, primary_key=True)
+    data = Column(String(100))
+
+
+class BenchService(object):
+    name = 'benchservice'
+
+    db = Database(DeclBase)
+    session = DatabaseSession(DeclBase)
+
+
+def make_providers(db_uri):
+    container = ServiceContainer(BenchService, {
+        DB_URIS_KEY: {'benchservice:benchbase': db_uri}
+    })
+    database = Database(DeclBase).bind(container, 'db')
+    database_session = DatabaseSession(DeclBase).bind(container, 'session')
+    database.setup()
+    database_session.setup()
+    DeclBase.metadata.create_all(database.engine)
+    return container, database, database_session
+
+
+def make_scenarios(db_uri):
+    """ Return a mapping of scenario name to a callable exercising it.
+    """
+    container, database, database_session = make_providers(db_uri)
+    # with a single connection, so that every green thread sees the rows
+    # of an in-memory SQLite database
+    engine_options = {'poolclass': StaticPool}
+    read_session = DatabaseSession(
+        DeclBase, engine_options=engine_options).bind(container, 'session')
+    read_only_session = DatabaseSession(
+        DeclBase, engine_options=engine_options, read_only=True,
+    ).bind(container, 'session')
+    for provider in (read_session, read_only_session):
+        provider.setup()
+        engine = provider.engine
+        DeclBase.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(BenchModel.__table__.insert(), [
+                {'id': n, 'data': 'data {}'.format(n)} for n in range(20)])
+
+    def new_worker_ctx():
+        return WorkerContext(container, None, None)
+
+    def database_get_dependency():
+        worker_ctx = new_worker_ctx()
+        database.get_dependency(worker_ctx)
+        database.worker_teardown(worker_ctx)
+
+    def database_wrapper_construction():
+        # the wrapper alone, without registering a worker to tear down
+        DatabaseWrapper(
+            database.Session, database.statements, database.queries,
+            database.committer, database.engine.connect,
+            fan_out_concurrency=database.fan_out_concurrency).close()
+
+    def database_lazy_session():
+        worker_ctx = new_worker_ctx()
+        db = database.get_dependency(worker_ctx)
+        db.session
+        database.worker_teardown(worker_ctx)
+
+    def database_context_session():
+        worker_ctx = new_worker_ctx()
+        db = database.get_dependency(worker_ctx)
+        with db.get_session(close_on_exit=True) as session:
+            session.execute(text('SELECT 1'))
+        database.worker_teardown(worker_ctx)
+
+    def database_worker_query():
+        worker_ctx = new_worker_ctx()
+        db = database.get_dependency(worker_ctx)
+        db.session.execute(text('SELECT 1'))
+        database.worker_teardown(worker_ctx)
+
+    def database_session_worker():
+        worker_ctx = new_worker_ctx()
+        database_session.get_dependency(worker_ctx)
+        database_session.worker_teardown(worker_ctx)
+
+    def database_session_worker_query():
+        worker_ctx = new_worker_ctx()
+        session = database_session.get_dependency(worker_ctx)
+        session.execute(text('SELECT 1'))
+        database_session.worker_teardown(worker_ctx)
+
+    def database_session_orm_read():
+        worker_ctx = new_worker_ctx()
+        session = read_session.get_dependency(worker_ctx)
+        session.query(BenchModel).all()
+        read_session.worker_teardown(worker_ctx)
+
+    def read_only_session_orm_read():
+        worker_ctx = new_worker_ctx()
+        session = read_only_session.get_dependency(worker_ctx)
+        session.query(BenchModel).all()
+        read_only_session.worker_teardown(worker_ctx)
+
+    def read_only_session_rows():
+        worker_ctx = new_worker_ctx()
+        session = read_only_session.get_dependency(worker_ctx)
+        session.rows(BenchModel)
+        read_only_session.worker_teardown(worker_ctx)
+
+    def plain_call():
+        return None
+
+    @wrapt.decorator
+    def passthrough(wrapped, instance, args, kwargs):
+        return wrapped(*args, **kwargs)
+
+    @passthrough
+    def wrapt_call():
+        return None
+
+    @transaction_retry
+    def retry_call():
+        return None
+
+    class Service(object):
+        session = database_session.Session()
+
+        @transaction_retry(session=operator.attrgetter('session'), total=3)
+        def retry_method(self):
+            return None
+
+    service = Service()
+
+    return {
+        'database.get_dependency+teardown': database_get_dependency,
+        'database.wrapper_construction': database_wrapper_construction,
+        'database.lazy_session': database_lazy_session,
+        'database.context_session_query': database_context_session,
+        'database.worker_session_query': database_worker_query,
+        'database_session.get_dependency+teardown': database_session_worker,
+        'database_session.query': database_session_worker_query,
+        'database_session.orm_read_20_rows': database_session_orm_read,
+        'database_session.read_only_orm_read_20_rows': (
+            read_only_session_orm_read),
+        'database_session.read_only_rows_20_rows': read_only_session_rows,
+        'transaction_retry.baseline_plain_call': plain_call,
+        'transaction_retry.baseline_wrapt_decorator': wrapt_call,
+        'transaction_retry.function': retry_call,
+        'transaction_retry.method_with_session': service.retry_method,
+    }
+
+
+def make_memory_scenarios(db_uri, live_workers):
+    """ Return a mapping of scenario name to a callable starting a worker
+    that is kept alive in ``live_workers``.
+
+    The memory retained per call is the footprint of one in-flight worker;
+    compare with ``memory.baseline_worker_context`` for the share added by
+    the providers.
+    """
+    container, database, database_session = make_providers(db_uri)
+
+    def new_worker_ctx():
+        worker_ctx = WorkerContext(container, None, None)
+        live_workers.append(worker_ctx)
+        return worker_ctx
+
+    def baseline_worker_context():
+        new_worker_ctx()
+
+    def database_worker():
+        database.get_dependency(new_worker_ctx())
+
+    def database_worker_with_session():
+        database.get_dependency(new_worker_ctx()).session
+
+    def database_worker_session_loop():
+        db = database.get_dependency(new_worker_ctx())
+        for _ in range(20):
+            with db.get_session(close_on_exit=True):
+                pass
+
+    def database_session_worker():
+        database_session.get_dependency(new_worker_ctx())
+
+    return {
+        'memory.baseline_worker_context': baseline_worker_context,
+        'memory.database_worker': database_worker,
+        'memory.database_worker_with_session': database_worker_with_session,
+        'memory.database_worker_20_closed_sessions': (
+            database_worker_session_loop),
+        'memory.database_session_worker': database_session_worker,
+    }
+
+
+def run(db_uri='sqlite://', iterations=10000, concurrency=10,
+        allocation_iterations=None, only=None):
+    allocation_iterations = allocation_iterations or min(iterations, 1000)
+
+    scenarios = make_scenarios(db_uri)
+    results = {}
+    for name, fn in scenarios.items():
+        if only and only not in name:
+            continue
+        results[name] = utils.run_scenario(
+            fn, iterations, concurrency, allocation_iterations)
+
+    live_workers = []
+    memory_scenarios = make_memory_scenarios(db_uri, live_workers)
+    for name, fn in memory_scenarios.items():
+        if only and only not in name:
+            continue
+        results[name] = utils.measure_allocations(fn, allocation_iterations)
+        del live_workers[:]
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db-uri', default='sqlite://')
+    parser.add_argument('--iterations', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument(
+        '--only', help='only run scenarios containing this string')
+    utils.add_common_arguments(parser)
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.db_uri, args.iterations, args.concurrency, only=args.only)
+    utils.report(results, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+""" Helpers shared by the benchmark scripts.
+
+Each benchmark produces a dictionary of results keyed by scenario name,
+which can be written to a JSON file and compared against the results of a
+previous run, e.g. one taken on another commit.
+"""
+import gc
+import json
+import subprocess
+import time
+import tracemalloc
+
+from eventlet import GreenPool
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(
+        int(round(fraction * (len(sorted_values) - 1))),
+        len(sorted_values) - 1
+    )
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'calls': len(latencies),
+        'ops_per_sec': len(latencies) / elapsed if elapsed else 0.0,
+        'mean_us': 1e6 * sum(latencies) / len(latencies),
+        'p50_us': 1e6 * percentile(latencies, 0.50),
+        'p90_us': 1e6 * percentile(latencies, 0.90),
+        'p99_us': 1e6 * percentile(latencies, 0.99),
+        'max_us': 1e6 * latencies[-1],
+    }
+
+
+def measure_allocations(fn, iterations):
+    """ Run ``fn`` ``iterations`` times under tracemalloc.
+
+    Returns the bytes and blocks still allocated per call afterwards, which
+    exposes per-call leaks, and the peak traced memory during the run.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        start_size, _ = tracemalloc.get_traced_memory()
+        for _ in range(iterations):
+            fn()
+        _, peak = tracemalloc.get_traced_memory()
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    stats = after.compare_to(before, 'filename')
+    return {
+        'retained_bytes_per_call': (
+            sum(stat.size_diff for stat in stats) / iterations),
+        'retained_blocks_per_call': (
+            sum(stat.count_diff for stat in stats) / iterations),
+        'peak_bytes': peak - start_size,
+    }
+
+
+def run_scenario(fn, iterations, concurrency, allocation_iterations=None):
+    """ Call ``fn`` ``iterations`` times from ``concurrency`` green threads.
+
+    Returns throughput and latency percentiles, plus allocation figures
+    measured in a separate, untimed run.
+    """
+    latencies = []
+
+    def timed_call(_):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+
+    # warm up caches and lazily initialised state
+    for _ in range(min(iterations, 100)):
+        fn()
+
+    pool = GreenPool(concurrency)
+    start = time.perf_counter()
+    for _ in pool.imap(timed_call, range(iterations)):
+        pass
+    elapsed = time.perf_counter() - start
+
+    result = summarize(latencies, elapsed)
+    result.update(measure_allocations(
+        fn, allocation_iterations or min(iterations, 1000)))
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except Exception:
+        # once monkey patched, failures raise the CalledProcessError of
+        # eventlet's green subprocess module rather than the stdlib's
+        return None
+
+
+def save(results, path):
+    with open(path, 'w') as output:
+        json.dump(
+            {'revision': git_revision(), 'results': results},
+            output, indent=2, sort_keys=True
+        )
+
+
+def load(path):
+    with open(path) as baseline:
+        return json.load(baseline)
+
+
+COLUMNS = ('ops_per_sec', 'p50_us', 'p99_us', 'retained_bytes_per_call')
+
+
+def format_results(results, baseline=None, columns=COLUMNS):
+    """ Render ``results`` as a table, with the relative change against
+    ``baseline`` results next to each figure when given.
+    """
+    baseline = baseline or {}
+    name_width = max([len(name) for name in results] + [8])
+    lines = ['{:<{}}  {}'.format('scenario', name_width, '  '.join(
+        '{:>24}'.format(column) for column in columns))]
+    for name, figures in sorted(results.items()):
+        cells = []
+        for column in columns:
+            value = figures.get(column, 0.0)
+            cell = '{:.1f}'.format(value)
+            previous = baseline.get(name, {}).get(column)
+            if previous:
+                cell += ' ({:+.1f}%)'.format(
+                    100.0 * (value - previous) / previous)
+            cells.append('{:>24}'.format(cell))
+        lines.append('{:<{}}  {}'.format(name, name_width, '  '.join(cells)))
+    return '\n'.join(lines)
+
+
+def add_common_arguments(parser):
+    parser.add_argument(
+        '--output', help='write results as JSON to this file')
+    parser.add_argument(
+        '--compare', help='JSON results of a previous run to compare with')
+
+
+def report(results, args, columns=COLUMNS):
+    baseline = load(args.compare)['results'] if args.compare else None
+    print(format_results(results, baseline, columns))
+    if args.output:
+        save(results, args.output)
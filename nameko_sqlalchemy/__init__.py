@@ -1,8 +1,60 @@
-from nameko_sqlalchemy.database import (  # noqa: F401
-    DB_ENGINE_OPTIONS_KEY,
-    DB_SESSION_OPTIONS_KEY,
-    DB_URIS_KEY,
-    Database,
-)
-from nameko_sqlalchemy.database_session import DatabaseSession  # noqa: F401
-from nameko_sqlalchemy.transaction_retry import transaction_retry  # noqa: F401
+import importlib
+from typing import TYPE_CHECKING
+
+from nameko_sqlalchemy.constants import DB_ENGINE_OPTIONS_KEY as DB_ENGINE_OPTIONS_KEY
+from nameko_sqlalchemy.constants import DB_SESSION_OPTIONS_KEY as DB_SESSION_OPTIONS_KEY
+from nameko_sqlalchemy.constants import DB_URIS_KEY as DB_URIS_KEY
+from nameko_sqlalchemy.transaction_retry import transaction_retry as transaction_retry
+
+if TYPE_CHECKING:
+    from nameko_sqlalchemy.database import Database as Database
+    from nameko_sqlalchemy.database import SchemaNotFound as SchemaNotFound
+    from nameko_sqlalchemy.database_session import DatabaseSession as DatabaseSession
+    from nameko_sqlalchemy.profiler import StatementProfiler as StatementProfiler
+    from nameko_sqlalchemy.sharding import ShardNotFound as ShardNotFound
+    from nameko_sqlalchemy.tracing import InMemoryTracer as InMemoryTracer
+    from nameko_sqlalchemy.tracing import NoopTracer as NoopTracer
+    from nameko_sqlalchemy.tracing import Tracer as Tracer
+
+# imported when first used, so that importing the constants or
+# transaction_retry doesn't import nameko and the ORM
+LAZY_EXPORTS = {
+    'Database': 'nameko_sqlalchemy.database',
+    'DatabaseSession': 'nameko_sqlalchemy.database_session',
+    'InMemoryTracer': 'nameko_sqlalchemy.tracing',
+    'NoopTracer': 'nameko_sqlalchemy.tracing',
+    'SchemaNotFound': 'nameko_sqlalchemy.database',
+    'ShardNotFound': 'nameko_sqlalchemy.sharding',
+    'StatementProfiler': 'nameko_sqlalchemy.profiler',
+    'Tracer': 'nameko_sqlalchemy.tracing',
+}
+
+__all__ = [
+    'DB_ENGINE_OPTIONS_KEY',
+    'DB_SESSION_OPTIONS_KEY',
+    'DB_URIS_KEY',
+    'Database',
+    'DatabaseSession',
+    'InMemoryTracer',
+    'NoopTracer',
+    'SchemaNotFound',
+    'ShardNotFound',
+    'StatementProfiler',
+    'Tracer',
+    'transaction_retry',
+]
+
+
+def __getattr__(name):
+    try:
+        module_name = LAZY_EXPORTS[name]
+    except KeyError:
+        raise AttributeError(
+            'module {!r} has no attribute {!r}'.format(__name__, name))
+    value = globals()[name] = getattr(
+        importlib.import_module(module_name), name)
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(LAZY_EXPORTS))
@@ -0,0 +1,41 @@
+from eventlet import Timeout
+from eventlet.queue import LightQueue
+
+STOP = object()
+
+
+class BatchQueue(LightQueue):
+    """ A queue read a batch at a time by a single consumer, e.g. the green
+    thread of :class:`~nameko_sqlalchemy.group_commit.GroupCommit`.
+
+    :meth:`get_batch` waits for an item, then collects those put within
+    ``window`` seconds of it, up to ``max_batch`` of them. Once
+    :meth:`stop` is called, the items put before are still returned, and
+    then an empty batch.
+    """
+
+    def __init__(self, maxsize=None):
+        super(BatchQueue, self).__init__(maxsize)
+        self.stopped = False
+
+    def stop(self):
+        self.put(STOP)
+
+    def get_batch(self, window, max_batch):
+        if self.stopped:
+            return []
+        item = self.get()
+        if item is STOP:
+            self.stopped = True
+            return []
+
+        batch = [item]
+        with Timeout(window, exception=False):
+            while len(batch) < max_batch:
+                item = self.get()
+                if item is STOP:
+                    # return this batch first
+                    self.stopped = True
+                    break
+                batch.append(item)
+        return batch
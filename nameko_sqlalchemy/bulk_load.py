@@ -0,0 +1,281 @@
+import json
+import os
+import tempfile
+from collections.abc import Mapping
+from itertools import islice
+
+from sqlalchemy.sql import sqltypes
+from sqlalchemy.types import TypeDecorator
+
+DEFAULT_BATCH_SIZE = 1000
+
+# bytes read from the rows at a time while streaming them to COPY
+COPY_BUFFER_SIZE = 64 * 1024
+
+COPY_DRIVERS = frozenset(['psycopg2', 'psycopg2cffi'])
+LOAD_DATA_DRIVERS = frozenset(['pymysql', 'mysqldb'])
+
+ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+
+# types whose values the text formats can't express without the bind
+# processing of SQLAlchemy, loaded with executemany instead
+TEXT_UNSUPPORTED_TYPES = (sqltypes.ARRAY, TypeDecorator)
+
+# warnings of LOAD DATA quoted in the error raised for them
+MAX_REPORTED_WARNINGS = 5
+
+
+class BulkLoadError(Exception):
+    """ Raised when ``LOAD DATA`` skips or converts rows rather than
+    failing, as it does with duplicate keys and invalid values. The rows
+    it loaded are still part of the transaction, which should be rolled
+    back.
+    """
+
+
+def bulk_load(connection, table, rows, columns=None,
+              batch_size=DEFAULT_BATCH_SIZE):
+    """ Inserts ``rows`` into ``table``, a ``Table`` or mapped class, within
+    the current transaction of ``connection`` and returns the number of rows
+    loaded.
+
+    ``rows`` is an iterable of sequences of values, in the order of
+    ``columns``, or of mappings of column keys to values. ``columns`` are
+    column keys too, and default to all the columns of the table.
+
+    Rows are streamed through ``COPY ... FROM STDIN`` with psycopg2 and
+    written to a temporary file loaded with ``LOAD DATA LOCAL INFILE`` with
+    PyMySQL and mysqlclient, which requires ``local_infile`` to be enabled.
+    Other drivers, and tables with ``ARRAY`` or ``TypeDecorator`` columns,
+    insert them with an ``executemany`` of ``batch_size`` rows at a time.
+    Column defaults of the table are only applied by the latter; with COPY
+    and LOAD DATA, values are sent as text, binary columns hex encoded,
+    JSON columns serialised with :func:`json.dumps` and enum members as
+    their name, or value with ``values_callable``. LOAD DATA raises
+    :class:`BulkLoadError` after skipping duplicate keys or converting
+    invalid values, which it only warns about.
+    """
+    table = getattr(table, '__table__', table)
+    if columns is None:
+        columns = list(table.columns)
+    else:
+        columns = [table.c[name] for name in columns]
+
+    dialect = connection.dialect
+    if any(
+        isinstance(column.type, TEXT_UNSUPPORTED_TYPES) for column in columns
+    ):
+        return insert_many(connection, table, rows, columns, batch_size)
+    if dialect.name == 'postgresql' and dialect.driver in COPY_DRIVERS:
+        return copy_from(connection, table, rows, columns)
+    if (
+        dialect.name in ('mysql', 'mariadb') and
+        dialect.driver in LOAD_DATA_DRIVERS
+    ):
+        return load_data(connection, table, rows, columns)
+    return insert_many(connection, table, rows, columns, batch_size)
+
+
+def insert_many(connection, table, rows, columns, batch_size):
+    keys = [column.key for column in columns]
+    statement = table.insert()
+    rows = iter(rows)
+    loaded = 0
+    while True:
+        batch = [
+            dict(zip(keys, row_values(row, keys)))
+            for row in islice(rows, batch_size)
+        ]
+        if not batch:
+            return loaded
+        connection.execute(statement, batch)
+        loaded += len(batch)
+
+
+def copy_from(connection, table, rows, columns):
+    sql = 'COPY {} ({}) FROM STDIN'.format(
+        table_name(connection, table), column_names(connection, columns))
+    stream = RowStream(
+        rows, [column.key for column in columns],
+        encoders=[column_encoder(column, hex_bytea) for column in columns])
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(sql, stream, size=COPY_BUFFER_SIZE)
+    finally:
+        cursor.close()
+    return stream.rows
+
+
+def load_data(connection, table, rows, columns):
+    # the drivers only read local files by name
+    stream = RowStream(
+        rows, [column.key for column in columns], true='1', false='0',
+        encoders=[column_encoder(column, hex_bytes) for column in columns])
+    data = tempfile.NamedTemporaryFile(suffix='.tsv', delete=False)
+    try:
+        # removed below even if reading the rows fails, as it holds them
+        with data:
+            while True:
+                chunk = stream.read(COPY_BUFFER_SIZE)
+                if not chunk:
+                    break
+                data.write(chunk)
+        sql = (
+            "LOAD DATA LOCAL INFILE %s INTO TABLE {} CHARACTER SET utf8mb4 "
+            "{}".format(
+                table_name(connection, table),
+                load_data_columns(connection, columns)))
+        cursor = connection.connection.cursor()
+        try:
+            cursor.execute(sql, (data.name,))
+            loaded = cursor.rowcount
+            # duplicate keys and invalid values only raise warnings
+            cursor.execute('SHOW WARNINGS')
+            warnings = cursor.fetchall()
+        finally:
+            cursor.close()
+    finally:
+        os.unlink(data.name)
+
+    if warnings or loaded != stream.rows:
+        raise BulkLoadError('LOAD DATA loaded {} of {} rows: {}'.format(
+            loaded, stream.rows, '; '.join(
+                '{} {}: {}'.format(*warning)
+                for warning in warnings[:MAX_REPORTED_WARNINGS]
+            ) or 'no warnings'))
+    return loaded
+
+
+def load_data_columns(connection, columns):
+    # binary columns are read hex encoded into variables and decoded
+    preparer = connection.dialect.identifier_preparer
+    targets = []
+    decoded = []
+    for index, column in enumerate(columns):
+        name = preparer.quote(column.name)
+        if is_binary(column):
+            targets.append('@column_{}'.format(index))
+            decoded.append('{} = UNHEX(@column_{})'.format(name, index))
+        else:
+            targets.append(name)
+    sql = '({})'.format(', '.join(targets))
+    if decoded:
+        sql += ' SET {}'.format(', '.join(decoded))
+    return sql
+
+
+def table_name(connection, table):
+    preparer = connection.dialect.identifier_preparer
+    schema = table.schema
+    schema_map = connection.get_execution_options().get(
+        'schema_translate_map')
+    if schema_map and schema in schema_map:
+        schema = schema_map[schema]
+    name = preparer.quote(table.name)
+    if schema is None:
+        return name
+    return '{}.{}'.format(preparer.quote_schema(schema), name)
+
+
+def column_names(connection, columns):
+    preparer = connection.dialect.identifier_preparer
+    return ', '.join(preparer.quote(column.name) for column in columns)
+
+
+def row_values(row, keys):
+    if isinstance(row, Mapping):
+        return [row[key] for key in keys]
+    return row
+
+
+def is_binary(column):
+    return isinstance(column.type, sqltypes._Binary)
+
+
+def column_encoder(column, binary):
+    """ Returns the function turning the values of ``column`` into strings
+    before they are formatted by :func:`text_value`, ``binary`` for binary
+    columns, or ``None``.
+    """
+    if isinstance(column.type, sqltypes.JSON):
+        return json.dumps
+    if isinstance(column.type, sqltypes.Enum):
+        # the name or value of enum members, as stored by the bind processor
+        return column.type._db_value_for_elem
+    if is_binary(column):
+        return binary
+    return None
+
+
+def hex_bytea(value):
+    # the hex input format of PostgreSQL's bytea
+    return '\\x' + bytes(value).hex()
+
+
+def hex_bytes(value):
+    return bytes(value).hex()
+
+
+def text_value(value, true='t', false='f'):
+    """ Formats ``value`` for the text format shared by PostgreSQL's COPY
+    and MySQL's LOAD DATA: tab separated, backslash escaped, ``\\N`` for
+    NULL. Raises ``TypeError`` for values without a text representation
+    of their own, like bytes outside binary columns.
+    """
+    if value is None:
+        return '\\N'
+    if value is True:
+        return true
+    if value is False:
+        return false
+    if isinstance(value, (bytes, bytearray, memoryview, Mapping, list)):
+        raise TypeError(
+            'Cannot load {} value {!r} as text'.format(
+                type(value).__name__, value))
+    return str(value).translate(ESCAPES)
+
+
+class RowStream(object):
+    """ A file-like object reading ``rows`` as text formatted lines, encoded
+    as UTF-8, consuming only as many rows as each :meth:`read` needs.
+    """
+
+    def __init__(self, rows, keys, true='t', false='f', encoders=None):
+        self.rows = 0
+        self._rows = iter(rows)
+        self._keys = keys
+        self._encoders = encoders or [None] * len(keys)
+        self._true = true
+        self._false = false
+        self._buffer = bytearray()
+        self._exhausted = False
+
+    def read(self, size=-1):
+        while not self._exhausted and (size < 0 or len(self._buffer) < size):
+            try:
+                row = next(self._rows)
+            except StopIteration:
+                self._exhausted = True
+                break
+            self._buffer += self._line(row)
+            self.rows += 1
+
+        if size < 0:
+            size = len(self._buffer)
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return chunk
+
+    def _line(self, row):
+        return ('\t'.join(
+            text_value(
+                encode(value) if encode and value is not None else value,
+                self._true, self._false)
+            for value, encode in zip(
+                row_values(row, self._keys), self._encoders)
+        ) + '\n').encode('utf-8')
@@ -0,0 +1,96 @@
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def fetch_chunks(connection, statement, params=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Executes ``statement`` and yields its column names, then its rows
+    ``chunk_size`` at a time, each chunk a list of column value tuples.
+
+    Results are streamed with a server side cursor where the driver supports
+    it, so that only one chunk of rows is held in memory at a time.
+    """
+    result = connection.execution_options(stream_results=True).execute(
+        statement, params or {})
+    try:
+        yield list(result.keys())
+        for rows in result.partitions(chunk_size):
+            yield list(zip(*rows))
+    finally:
+        result.close()
+
+
+def fetch_columns(connection, statement, params=None,
+                  chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Returns the result of ``statement`` as a dict of column names to
+    lists of values, without creating an object per row beyond the row
+    tuples fetched by SQLAlchemy.
+    """
+    chunks = fetch_chunks(connection, statement, params, chunk_size)
+    names = next(chunks)
+    columns = [[] for _ in names]
+    for chunk in chunks:
+        for column, values in zip(columns, chunk):
+            column.extend(values)
+    return dict(zip(names, columns))
+
+
+def fetch_record_batches(connection, statement, params=None,
+                         chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Yields the result of ``statement`` as ``pyarrow.RecordBatch``
+    objects of up to ``chunk_size`` rows. Requires pyarrow.
+
+    Column types are inferred from each chunk, so a column whose values are
+    all null in a chunk has the null type in that batch.
+    """
+    pyarrow = import_pyarrow()
+    chunks = fetch_chunks(connection, statement, params, chunk_size)
+    names = next(chunks)
+    for chunk in chunks:
+        yield pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array(values) for values in chunk], names=names)
+
+
+def fetch_arrow(connection, statement, params=None,
+                chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Returns the result of ``statement`` as a ``pyarrow.Table`` of
+    chunks of up to ``chunk_size`` rows. Requires pyarrow.
+    """
+    pyarrow = import_pyarrow()
+    chunks = fetch_chunks(connection, statement, params, chunk_size)
+    names = next(chunks)
+    columns = [[] for _ in names]
+    for chunk in chunks:
+        for column, values in zip(columns, chunk):
+            column.append(pyarrow.array(values))
+    return pyarrow.table(
+        [chunked_array(pyarrow, arrays) for arrays in columns], names=names)
+
+
+def chunked_array(pyarrow, arrays):
+    # the type of each chunk is inferred from its values, e.g. decimals of
+    # different precisions, or the null type for chunks of nulls only
+    type_ = common_type(pyarrow, [array.type for array in arrays])
+    return pyarrow.chunked_array(
+        [array.cast(type_) for array in arrays], type=type_)
+
+
+def common_type(pyarrow, types):
+    """ Returns the type all of ``types`` can be cast to, widening numbers
+    and decimals as needed. Raises ``pyarrow.ArrowTypeError`` for types
+    that can't be combined, such as numbers and strings.
+    """
+    if not types:
+        return pyarrow.null()
+    schema = pyarrow.unify_schemas(
+        [pyarrow.schema([('value', type_)]) for type_ in types],
+        promote_options='permissive')
+    return schema.field('value').type
+
+
+def import_pyarrow():
+    # imported when needed, it takes longer to import than the package
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('Arrow results require pyarrow to be installed')
+    return pyarrow
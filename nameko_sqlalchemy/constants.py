@@ -0,0 +1,3 @@
+DB_URIS_KEY = 'DB_URIS'
+DB_ENGINE_OPTIONS_KEY = 'DB_ENGINE_OPTIONS'
+DB_SESSION_OPTIONS_KEY = 'DB_SESSION_OPTIONS'
@@ -1,21 +1,84 @@
-from weakref import WeakKeyDictionary
+import functools
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from weakref import WeakKeyDictionary, WeakSet
 
+from eventlet import Timeout
+from eventlet.event import Event
 from nameko.extensions import DependencyProvider
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import Session as BaseSession
 from sqlalchemy.orm import sessionmaker
 
-DB_URIS_KEY = 'DB_URIS'
-DB_ENGINE_OPTIONS_KEY = 'DB_ENGINE_OPTIONS'
-DB_SESSION_OPTIONS_KEY = 'DB_SESSION_OPTIONS'
+from nameko_sqlalchemy import columnar, tracing
+from nameko_sqlalchemy.bulk_load import DEFAULT_BATCH_SIZE, bulk_load
+from nameko_sqlalchemy.constants import DB_ENGINE_OPTIONS_KEY as DB_ENGINE_OPTIONS_KEY
+from nameko_sqlalchemy.constants import DB_SESSION_OPTIONS_KEY as DB_SESSION_OPTIONS_KEY
+from nameko_sqlalchemy.constants import DB_URIS_KEY as DB_URIS_KEY
+from nameko_sqlalchemy.eager_loading import LOADING_INFO_KEY, EagerLoading
+from nameko_sqlalchemy.failover import FailoverDetector
+from nameko_sqlalchemy.fan_out import DEFAULT_CONCURRENCY, FanOut, execute
+from nameko_sqlalchemy.group_commit import GroupCommit
+from nameko_sqlalchemy.pool_maintenance import PoolMaintenance
+from nameko_sqlalchemy.queries import QueryRegistry
+from nameko_sqlalchemy.read_only import ReadOnlyMixin
+from nameko_sqlalchemy.sharding import DEFAULT_CONNECTION_TIMEOUT, ShardRouter
+from nameko_sqlalchemy.statement_cache import CompiledCacheStats, StatementRegistry
+from nameko_sqlalchemy.watchdog import SessionWatchdog
+from nameko_sqlalchemy.write_behind import WriteBehind
+
+logger = logging.getLogger(__name__)
+
+
+# translates tables without an explicit schema, leaving others untouched
+DEFAULT_SCHEMA = None
+
+DEFAULT_MAX_SCHEMA_ENGINES = 100
+
+
+class SchemaNotFound(LookupError):
+    """ Raised when a worker is routed to a schema that isn't allowed.
+    """
+
+
+def engine_options_with_cache_size(engine_options, compiled_cache_size):
+    if compiled_cache_size is None:
+        return engine_options
+    return dict(engine_options, query_cache_size=compiled_cache_size)
 
 
 class Session(BaseSession):
 
     def __init__(self, *args, **kwargs):
         self.close_on_exit = kwargs.pop('close_on_exit', False)
+        self.tracked_in = kwargs.pop('tracked_in', None)
+        # connection shared with the other sessions of the worker, used by
+        # one transaction at a time
+        self.pin = kwargs.pop('pin', None)
+        # whether the current transaction uses the pinned connection,
+        # decided when it first needs a connection
+        self.pin_owned = None
         super(Session, self).__init__(*args, **kwargs)
 
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if self.pin is not None and bind is None:
+            if self.pin_owned is None:
+                self.pin_owned = self.pin.acquire(self)
+            if self.pin_owned:
+                return self.pin.connection
+        return super(Session, self).get_bind(
+            mapper, clause=clause, bind=bind, **kwargs)
+
+    def release_pin(self):
+        if self.pin_owned:
+            self.pin.release(self)
+        self.pin_owned = None
+
+    def close(self):
+        super(Session, self).close()
+        self.release_pin()
+
     def __enter__(self):
         return self
 
@@ -32,71 +95,654 @@ class Session(BaseSession):
         finally:
             if self.close_on_exit:
                 self.close()
+                # nothing is left to close on teardown, stop tracking it
+                # until it is used again
+                if self.tracked_in is not None:
+                    self.tracked_in.discard(self)
+
+
+class ReadOnlySession(ReadOnlyMixin, Session):
+    pass
+
+
+@event.listens_for(Session, 'after_transaction_create')
+def _track_reused_session(session, transaction):
+    if session.tracked_in is not None and transaction.parent is None:
+        session.tracked_in.add(session)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _release_pinned_connection(session, transaction):
+    if transaction.parent is None:
+        session.release_pin()
+
+
+class ConnectionPin(object):
+    """ A connection shared by the sessions of a worker.
+
+    Transactions of the sessions don't interleave on it: the session that
+    acquires the connection owns it until its transaction ends, and the
+    sessions beginning transactions meanwhile use connections of their own.
+    """
+
+    __slots__ = ('connect', 'connection', 'owner')
+
+    def __init__(self, connect):
+        self.connect = connect
+        self.connection = None
+        self.owner = None
+
+    def acquire(self, session):
+        if self.owner is not None:
+            return False
+        if self.connection is None:
+            self.connection = self.connect()
+        self.owner = session
+        return True
+
+    def release(self, session):
+        if self.owner is session:
+            self.owner = None
+
+    def close(self):
+        self.owner = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
 
 
 class DatabaseWrapper(object):
 
-    def __init__(self, Session):
+    __slots__ = (
+        'Session', 'statements', 'queries', 'committer', 'connect', 'pin',
+        'loading', 'writer', 'fan_out_concurrency', 'concurrent',
+        '_worker_session', '_context_sessions',
+    )
+
+    def __init__(
+        self, Session, statements=None, queries=None, committer=None,
+        connect=None, loading=None, writer=None, pin_connection=False,
+        fan_out_concurrency=DEFAULT_CONCURRENCY
+    ):
         self.Session = Session
+        self.statements = (
+            statements if statements is not None else StatementRegistry())
+        self.queries = queries if queries is not None else QueryRegistry()
+        self.committer = committer
+        self.connect = connect
+        self.pin = (
+            ConnectionPin(connect)
+            if pin_connection and connect is not None else None
+        )
+        self.loading = loading
+        self.writer = writer
+        self.fan_out_concurrency = fan_out_concurrency
+        # created by the first fan_out, as most workers never call it
+        self.concurrent = None
         self._worker_session = None
-        self._context_sessions = []
+        self._context_sessions = set()
+
+    def _session_options(self):
+        options = {}
+        if self.pin is not None:
+            options['pin'] = self.pin
+        if self.loading is not None:
+            options['info'] = {LOADING_INFO_KEY: self.loading}
+        return options
 
     def get_session(self, close_on_exit=False):
-        session = self.Session(close_on_exit=close_on_exit)
-        self._context_sessions.append(session)
+        session = self.Session(
+            close_on_exit=close_on_exit, tracked_in=self._context_sessions,
+            **self._session_options())
+        self._context_sessions.add(session)
         return session
 
     @property
     def session(self):
         if self._worker_session is None:
-            self._worker_session = self.Session()
+            self._worker_session = self.Session(**self._session_options())
         return self._worker_session
 
+    def open_sessions(self):
+        """ Returns the sessions of the worker that haven't been closed.
+        """
+        sessions = list(self._context_sessions)
+        if self._worker_session is not None:
+            sessions.append(self._worker_session)
+        return sessions
+
+    def execute_statement(self, name, params=None):
+        """ Execute the statement registered as ``name`` on the provider,
+        within the transaction of the worker scoped :attr:`session`.
+        """
+        return self.statements.execute(
+            self.session.connection(), name, params)
+
+    def run_query(self, name, **params):
+        """ Run the query registered as ``name`` on the provider with the
+        given parameters, within the transaction of the worker scoped
+        :attr:`session`.
+        """
+        return self.queries.execute(self.session.connection(), name, params)
+
+    def fetch_columns(
+        self, statement, params=None, chunk_size=columnar.DEFAULT_CHUNK_SIZE
+    ):
+        """ Execute ``statement``, a Core select or textual SQL, within the
+        transaction of the worker scoped :attr:`session` and return its
+        result as a dict of column names to lists of values, fetched
+        ``chunk_size`` rows at a time.
+        """
+        return columnar.fetch_columns(
+            self.session.connection(), statement, params, chunk_size)
+
+    def fetch_arrow(
+        self, statement, params=None, chunk_size=columnar.DEFAULT_CHUNK_SIZE
+    ):
+        """ Like :meth:`fetch_columns`, returning a ``pyarrow.Table`` made of
+        record batches of up to ``chunk_size`` rows. Requires pyarrow.
+        """
+        return columnar.fetch_arrow(
+            self.session.connection(), statement, params, chunk_size)
+
+    def bulk_load(
+        self, table, rows, columns=None, batch_size=DEFAULT_BATCH_SIZE
+    ):
+        """ Load ``rows`` into ``table`` within the transaction of the worker
+        scoped :attr:`session`, using ``COPY`` or ``LOAD DATA`` where the
+        driver supports them, and return the number of rows loaded. See
+        :func:`nameko_sqlalchemy.bulk_load.bulk_load`.
+
+        Objects pending in the session aren't flushed first, and the rows
+        loaded aren't committed until the session is.
+        """
+        return bulk_load(
+            self.session.connection(), table, rows, columns, batch_size)
+
+    @contextmanager
+    def eager_loading(self, profile):
+        """ Apply the eager loading profile named ``profile`` to the queries
+        of the enclosed block, in place of the entrypoint's. Does nothing
+        unless the provider has ``eager_loading`` configured.
+        """
+        if self.loading is None:
+            yield
+            return
+        previous, self.loading.profile = self.loading.profile, profile
+        try:
+            yield
+        finally:
+            self.loading.profile = previous
+
+    def fan_out(self, statements):
+        """ Execute ``statements``, each a statement or a ``(statement,
+        params)`` tuple, concurrently on separate pooled connections and
+        return their results in order: all rows of those returning rows,
+        the number of rows matched by the others. See
+        :class:`nameko_sqlalchemy.fan_out.FanOut`.
+
+        The statements run outside of the transaction of the worker's
+        sessions, so they don't see its uncommitted changes, and are meant
+        for independent reads. Without a provider to take connections from,
+        they run one after the other within the worker scoped
+        :attr:`session`.
+        """
+        if self.connect is None:
+            connection = self.session.connection()
+            return [execute(connection, statement) for statement in statements]
+        if self.concurrent is None:
+            self.concurrent = FanOut(self.connect, self.fan_out_concurrency)
+        return self.concurrent.run(statements)
+
+    def group_commit(self, unit):
+        """ Call ``unit`` with a session and commit it, returning the result
+        of ``unit`` once committed.
+
+        If the provider batches commits, ``unit`` shares the transaction of
+        the units submitted by other workers at about the same time and may
+        be called again if that transaction fails, so it should only act
+        through the session it is given. Otherwise it runs in a session of
+        its own.
+        """
+        if self.committer is not None:
+            return self.committer.submit(unit)
+        with self.get_session(close_on_exit=True) as session:
+            return unit(session)
+
+    def write_behind(self, statement, params=None):
+        """ Queue ``statement``, e.g. an audit log insert or a counter
+        update, to be executed with ``params`` after the worker returns, in
+        a batch with the writes of other workers, and committed outside of
+        the worker's transactions.
+
+        Blocks while the queue is full, and raises
+        :class:`~nameko_sqlalchemy.write_behind.WriteBehindFull` if it stays
+        so for the configured ``timeout``. Unless the provider has
+        ``write_behind`` configured, the statement is executed and committed
+        at once in a session of its own.
+        """
+        if self.writer is not None:
+            self.writer.write(statement, params)
+            return
+        with self.get_session(close_on_exit=True) as session:
+            session.execute(statement, params or {})
+
     def close(self):
         if self._worker_session:
             self._worker_session.close()
         for session in self._context_sessions:
             session.close()
+        self._context_sessions.clear()
+        if self.pin is not None:
+            self.pin.close()
+        if self.concurrent is not None:
+            self.concurrent.close()
 
 
 class Database(DependencyProvider):
 
     def __init__(
-        self, declarative_base, session_options=None, engine_options=None
+        self, declarative_base, session_options=None, engine_options=None,
+        pool_maintenance=None,
+        compiled_cache_size=None, statements=None, queries=None,
+        prepare_queries=False, shard_key=None, max_shard_connections=None,
+        schema_key=None, schemas=None,
+        max_schema_engines=DEFAULT_MAX_SCHEMA_ENGINES, group_commit=None,
+        pin_connection=False,
+        session_watchdog=None, tracer=None, profiler=None, failover=None,
+        read_only=False, eager_loading=None,
+        fan_out_concurrency=DEFAULT_CONCURRENCY, write_behind=None
     ):
         self.declarative_base = declarative_base
         self.dbs = WeakKeyDictionary()
         self.session_options = session_options or {}
         self.engine_options = engine_options or {}
+        self.compiled_cache_size = compiled_cache_size
+        self.statements = StatementRegistry(statements)
+        self.queries = QueryRegistry(queries, prepare=prepare_queries)
+        self.pool_maintenance = pool_maintenance
+        self.maintenance = None
+        self.maintenance_gt = None
+        self.maintenance_should_stop = Event()
+        self.shard_key = shard_key
+        self.max_shard_connections = max_shard_connections
+        self.shards = None
+        self.schema_key = schema_key
+        self.schemas = schemas
+        self.max_schema_engines = max_schema_engines
+        self.schema_engines = OrderedDict()
+        self.group_commit = group_commit
+        self.committer = None
+        self.committer_gt = None
+        self.pin_connection = pin_connection
+        self.session_watchdog = session_watchdog
+        self.watchdog = None
+        self.watchdog_gt = None
+        self.watchdog_should_stop = Event()
+        self.tracer = tracer if tracer is not None else tracing.NoopTracer()
+        self.profiler = profiler
+        self.failover = failover
+        self.failover_detector = None
+        self.reload_uri = None
+        self.retired_engines = {}
+        self.read_only = read_only
+        self.eager_loading = eager_loading
+        self.eager_loader = None
+        self.fan_out_concurrency = fan_out_concurrency
+        self.write_behind = write_behind
+        self.writer = None
+        self.writer_gt = None
 
     def setup(self):
         service_name = self.container.service_name
         declarative_base_name = self.declarative_base.__name__
-        uri_key = '{}:{}'.format(service_name, declarative_base_name)
-
-        db_uris = self.container.config[DB_URIS_KEY]
-        self.db_uri = db_uris[uri_key].format({
+        self.uri_key = '{}:{}'.format(service_name, declarative_base_name)
+        self.uri_params = {
             'service_name': service_name,
             'declarative_base_name': declarative_base_name,
-        })
+        }
 
-        self.engine = create_engine(self.db_uri, **self.engine_options)
-        self.Session = sessionmaker(
-            bind=self.engine, class_=Session, **self.session_options)
+        if self.schema_key is not None and self.schemas is None:
+            raise ValueError(
+                'schema_key requires the allowed schemas, or a callable '
+                'resolving them')
+        if self.schema_key is not None and self.queries.prepare:
+            raise ValueError(
+                'Queries prepared server side cannot follow the schema of '
+                'each worker, prepare_queries and schema_key are exclusive')
+        if self.group_commit is not None and self.schema_key is not None:
+            raise ValueError(
+                'Group commit is not supported with a schema_key')
+        if self.group_commit is not None and self.read_only:
+            raise ValueError('Group commit cannot write with read_only')
+        if self.write_behind is not None and self.schema_key is not None:
+            raise ValueError(
+                'Write-behind is not supported with a schema_key')
+        if self.write_behind is not None and self.read_only:
+            raise ValueError('Write-behind cannot write with read_only')
+
+        if self.session_watchdog is not None:
+            self.watchdog = SessionWatchdog(**self.session_watchdog)
+        if self.failover is not None:
+            options = dict(self.failover)
+            self.reload_uri = options.pop('reload_uri', None)
+            self.failover_detector = FailoverDetector(
+                self.handle_failover, **options)
+        if self.eager_loading is not None:
+            self.eager_loader = EagerLoading(**self.eager_loading)
+
+        db_uris = self.container.config[DB_URIS_KEY]
+        if isinstance(db_uris[self.uri_key], dict):
+            self.setup_shards(db_uris[self.uri_key], self.uri_params)
+            return
+
+        self.db_uri = self.configured_uri()
+        self.engine = self.create_engine(self.db_uri)
+        self.compiled_cache = CompiledCacheStats(self.engine)
+        self.Session = self.create_sessionmaker(self.engine)
+
+    def setup_shards(self, shard_uris, uri_params):
+        if self.shard_key is None:
+            raise ValueError(
+                'A shard map is configured for {}, but no shard_key to route '
+                'workers with'.format(self))
+        if self.pool_maintenance is not None:
+            raise ValueError(
+                'Pool maintenance is not supported with a shard map')
+        if self.group_commit is not None:
+            raise ValueError('Group commit is not supported with a shard map')
+        if self.write_behind is not None:
+            raise ValueError('Write-behind is not supported with a shard map')
+
+        self.shards = ShardRouter(
+            {
+                shard_id: uri.format(uri_params)
+                for shard_id, uri in shard_uris.items()
+            },
+            self.create_engine, self.create_sessionmaker,
+            max_connections=self.max_shard_connections,
+            timeout=self.engine_options.get(
+                'pool_timeout', DEFAULT_CONNECTION_TIMEOUT),
+        )
+
+    def create_engine(self, db_uri):
+        engine = create_engine(
+            db_uri, **engine_options_with_cache_size(
+                self.engine_options, self.compiled_cache_size))
+        if self.schema_key is not None:
+            # leave the schema to be translated when executed
+            compile_options = {
+                'schema_translate_map': {DEFAULT_SCHEMA: DEFAULT_SCHEMA}}
+        else:
+            compile_options = {}
+        self.statements.compile(engine.dialect, **compile_options)
+        self.queries.compile(engine.dialect, **compile_options)
+        self.queries.listen(engine)
+        if self.watchdog is not None:
+            self.watchdog.watch_engine(engine)
+        if not tracing.is_noop(self.tracer):
+            tracing.instrument_engine(engine, self)
+        if self.profiler is not None:
+            self.profiler.listen(engine)
+        if self.failover_detector is not None:
+            self.failover_detector.listen(engine)
+        return engine
+
+    def create_sessionmaker(self, engine):
+        factory = sessionmaker(
+            bind=engine,
+            class_=ReadOnlySession if self.read_only else Session,
+            **self.session_options)
+        if self.watchdog is not None:
+            self.watchdog.watch_sessions(factory)
+        if self.eager_loader is not None:
+            self.eager_loader.watch_sessions(factory)
+        return factory
+
+    def start(self):
+        if self.pool_maintenance is not None:
+            self.maintenance = PoolMaintenance(
+                self.engine.pool, **self.pool_maintenance)
+            self.maintenance_gt = self.container.spawn_managed_thread(
+                self._run_pool_maintenance)
+        if self.group_commit is not None:
+            self.committer = GroupCommit(self.Session, **self.group_commit)
+            self.committer_gt = self.container.spawn_managed_thread(
+                self.committer.run)
+        if self.write_behind is not None:
+            self.writer = WriteBehind(self.Session, **self.write_behind)
+            self.writer_gt = self.container.spawn_managed_thread(
+                self.writer.run)
+        if self.watchdog is not None:
+            self.watchdog_gt = self.container.spawn_managed_thread(
+                self._run_watchdog)
 
     def stop(self):
-        self.engine.dispose()
-        del self.engine
+        # the container stops dependencies once all workers have ended
+        if self.committer_gt is not None:
+            # commits whatever the workers left queued
+            self.committer.stop()
+            self.committer_gt.wait()
+            logger.info(
+                '%s group commit: %s', self, self.committer.as_dict())
+        if self.writer_gt is not None:
+            # executes the writes the workers left queued
+            self.writer.stop()
+            self.writer_gt.wait()
+            logger.info('%s write-behind: %s', self, self.writer.as_dict())
+
+        if self.maintenance_gt is not None:
+            self.maintenance_should_stop.send(True)
+            self.maintenance_gt.wait()
+        if self.watchdog_gt is not None:
+            self.watchdog_should_stop.send(True)
+            self.watchdog_gt.wait()
+        if self.shards is None:
+            logger.info(
+                '%s compiled cache: %s', self, self.compiled_cache.as_dict())
+        if self.profiler is not None:
+            logger.info(
+                '%s statement profile:\n%s', self,
+                self.profiler.format_report())
+        if self.eager_loader is not None and self.eager_loader.auto_tune:
+            logger.info(
+                '%s learned eager loading: %s', self,
+                self.eager_loader.as_dict())
+        self.dispose()
 
     def kill(self):
-        self.engine.dispose()
-        del self.engine
+        if self.maintenance_gt is not None:
+            self.maintenance_gt.kill()
+        if self.committer_gt is not None:
+            self.committer_gt.kill()
+        if self.writer_gt is not None:
+            self.writer_gt.kill()
+            pending = self.writer.queue.qsize()
+            if pending:
+                logger.warning(
+                    '%s killed with %d write-behind writes pending', self,
+                    pending)
+        if self.watchdog_gt is not None:
+            self.watchdog_gt.kill()
+        self.dispose()
+
+    def configured_uri(self):
+        return self.container.config[DB_URIS_KEY][self.uri_key].format(
+            self.uri_params)
+
+    def handle_failover(self, engine):
+        """ Disposes of the pool of ``engine`` after a failover. If the
+        ``reload_uri`` callable returns a URI other than the current one,
+        workers started from now on use a new engine connected to it.
+        """
+        if (
+            self.reload_uri is not None and self.shards is None and
+            engine is self.engine
+        ):
+            db_uri = self.reload_uri()
+            if db_uri is not None:
+                db_uri = db_uri.format(self.uri_params)
+            if db_uri is not None and db_uri != self.db_uri:
+                self.rebuild_engine(db_uri)
+        engine.dispose()
+
+        if self.maintenance is not None:
+            # disposing replaces the pool
+            self.maintenance.pool = self.engine.pool
+
+    def rebuild_engine(self, db_uri):
+        # disposed of once the workers that may still use it have ended
+        workers = WeakSet(self.dbs)
+        if workers:
+            self.retired_engines[self.engine] = workers
+        self.db_uri = db_uri
+        self.engine = self.create_engine(db_uri)
+        logger.warning('%s reconnecting to %r', self, self.engine.url)
+        self.compiled_cache = CompiledCacheStats(self.engine)
+        self.Session = self.create_sessionmaker(self.engine)
+        self.schema_engines.clear()
+        if self.committer is not None:
+            self.committer.Session = self.Session
+        if self.writer is not None:
+            self.writer.Session = self.Session
+
+    def dispose_drained_engines(self, worker_ctx):
+        for engine, workers in list(self.retired_engines.items()):
+            workers.discard(worker_ctx)
+            if not workers:
+                del self.retired_engines[engine]
+                engine.dispose()
+
+    def dispose(self):
+        self.schema_engines.clear()
+        for engine in self.retired_engines:
+            engine.dispose()
+        self.retired_engines.clear()
+        if self.shards is not None:
+            self.shards.dispose()
+        else:
+            self.engine.dispose()
+            del self.engine
+
+    def _run_pool_maintenance(self):
+        while True:
+            # sleep for the interval, unless `maintenance_should_stop` fires,
+            # in which case we leave the loop and stop entirely
+            with Timeout(self.maintenance.interval, exception=False):
+                self.maintenance_should_stop.wait()
+                break
+
+            try:
+                stats = self.maintenance.run_once()
+            except Exception:
+                logger.exception('Error maintaining connection pool')
+            else:
+                logger.debug('Pool maintenance: %s', stats)
+
+    def _run_watchdog(self):
+        while True:
+            # sleep for the interval, unless `watchdog_should_stop` fires,
+            # in which case we leave the loop and stop entirely
+            with Timeout(self.watchdog.interval, exception=False):
+                self.watchdog_should_stop.wait()
+                break
+
+            try:
+                self.watchdog.check(self.dbs)
+            except Exception:
+                logger.exception('Error checking worker sessions')
 
     def worker_teardown(self, worker_ctx):
         db = self.dbs.pop(worker_ctx)
         db.close()
+        if db.loading is not None:
+            self.eager_loader.finish_worker(db.loading)
+        if self.retired_engines:
+            self.dispose_drained_engines(worker_ctx)
+        if not tracing.is_noop(self.tracer):
+            tracing.deactivate(self)
 
     def get_dependency(self, worker_ctx):
-        db = DatabaseWrapper(self.Session)
+        if not tracing.is_noop(self.tracer):
+            # dependencies are injected in the worker's green thread
+            tracing.activate(self.tracer, worker_ctx.call_id, self)
+
+        if self.shards is not None or self.schema_key is not None:
+            # resolved when the worker first uses a session, so that an
+            # unknown shard or schema fails the worker rather than the
+            # container
+            route = (
+                worker_ctx.data.get(self.shard_key),
+                worker_ctx.data.get(self.schema_key, DEFAULT_SCHEMA),
+            )
+            Session = functools.partial(self.route_session, *route)
+            connect = functools.partial(self.route_connect, *route)
+        else:
+            Session = self.Session
+            connect = self.engine.connect
+
+        if self.eager_loader is not None:
+            loading = self.eager_loader.start_worker(worker_ctx)
+        else:
+            loading = None
+
+        db = DatabaseWrapper(
+            Session, self.statements, self.queries, self.committer, connect,
+            loading, self.writer, self.pin_connection,
+            self.fan_out_concurrency)
         self.dbs[worker_ctx] = db
         return db
+
+    def route_engine(self, shard_id, schema):
+        if self.shards is not None:
+            engine = self.shards.engine(shard_id)
+        else:
+            engine = self.engine
+        if self.schema_key is not None:
+            engine = self.schema_engine(engine, schema)
+        return engine
+
+    def route_session(self, shard_id, schema, **kwargs):
+        if self.shards is not None:
+            Session = self.shards.sessionmaker(shard_id)
+        else:
+            Session = self.Session
+        kwargs.setdefault('bind', self.route_engine(shard_id, schema))
+        return Session(**kwargs)
+
+    def route_connect(self, shard_id, schema):
+        return self.route_engine(shard_id, schema).connect()
+
+    def resolve_schema(self, value):
+        """ Returns the schema for ``value``, taken from the worker context
+        data, which callers control. Raises :class:`SchemaNotFound` unless
+        it is one of ``schemas``, or ``schemas`` is a callable resolving it.
+        """
+        if value == DEFAULT_SCHEMA:
+            return DEFAULT_SCHEMA
+        if callable(self.schemas):
+            schema = self.schemas(value)
+        elif value in self.schemas:
+            schema = value
+        else:
+            schema = None
+        if schema is None:
+            raise SchemaNotFound('Schema {!r} is not allowed'.format(value))
+        return schema
+
+    def schema_engine(self, engine, value):
+        """ Returns ``engine`` with tables of the default schema translated
+        to the schema resolved from ``value``, sharing its connection pool and
+        compiled cache. The ``max_schema_engines`` used most recently are
+        kept.
+        """
+        key = (engine, value)
+        try:
+            self.schema_engines.move_to_end(key)
+        except KeyError:
+            schema = self.resolve_schema(value)
+            self.schema_engines[key] = engine.execution_options(
+                schema_translate_map={DEFAULT_SCHEMA: schema})
+            if len(self.schema_engines) > self.max_schema_engines:
+                self.schema_engines.popitem(last=False)
+        return self.schema_engines[key]
@@ -1,20 +1,31 @@
+import logging
 from weakref import WeakKeyDictionary
 
 from nameko.extensions import DependencyProvider
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
-from nameko_sqlalchemy.database import DB_URIS_KEY
+from nameko_sqlalchemy import tracing
+from nameko_sqlalchemy.constants import DB_URIS_KEY
+from nameko_sqlalchemy.database import engine_options_with_cache_size
+from nameko_sqlalchemy.read_only import ReadOnlySession
+from nameko_sqlalchemy.statement_cache import CompiledCacheStats
+
+logger = logging.getLogger(__name__)
 
 
 class DatabaseSession(DependencyProvider):
     def __init__(
-        self, declarative_base, session_options=None, engine_options=None
+        self, declarative_base, session_options=None, engine_options=None,
+        compiled_cache_size=None, tracer=None, read_only=False
     ):
         self.declarative_base = declarative_base
         self.sessions = WeakKeyDictionary()
         self.session_options = session_options or {}
         self.engine_options = engine_options or {}
+        self.compiled_cache_size = compiled_cache_size
+        self.tracer = tracer if tracer is not None else tracing.NoopTracer()
+        self.read_only = read_only
 
     def setup(self):
         service_name = self.container.service_name
@@ -27,10 +38,20 @@ class DatabaseSession(DependencyProvider):
             'declarative_base_name': decl_base_name,
         })
 
-        self.engine = create_engine(self.db_uri, **self.engine_options)
-        self.Session = sessionmaker(bind=self.engine, **self.session_options)
+        self.engine = create_engine(
+            self.db_uri, **engine_options_with_cache_size(
+                self.engine_options, self.compiled_cache_size))
+        self.compiled_cache = CompiledCacheStats(self.engine)
+        if not tracing.is_noop(self.tracer):
+            tracing.instrument_engine(self.engine, self)
+        session_options = dict(self.session_options)
+        if self.read_only:
+            session_options['class_'] = ReadOnlySession
+        self.Session = sessionmaker(bind=self.engine, **session_options)
 
     def stop(self):
+        logger.info(
+            '%s compiled cache: %s', self, self.compiled_cache.as_dict())
         self.engine.dispose()
         del self.engine
 
@@ -39,6 +60,10 @@ class DatabaseSession(DependencyProvider):
         del self.engine
 
     def get_dependency(self, worker_ctx):
+        if not tracing.is_noop(self.tracer):
+            # dependencies are injected in the worker's green thread
+            tracing.activate(self.tracer, worker_ctx.call_id, self)
+
         session = self.Session()
         self.sessions[worker_ctx] = session
         return session
@@ -46,6 +71,8 @@ class DatabaseSession(DependencyProvider):
     def worker_teardown(self, worker_ctx):
         session = self.sessions.pop(worker_ctx)
         session.close()
+        if not tracing.is_noop(self.tracer):
+            tracing.deactivate(self)
 
 
 # backwards compat
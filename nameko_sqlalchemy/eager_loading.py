@@ -0,0 +1,143 @@
+import logging
+from collections import Counter
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import defaultload, selectinload
+
+logger = logging.getLogger(__name__)
+
+LOADING_INFO_KEY = 'nameko_sqlalchemy.eager_loading'
+
+# lazy loads of one relationship in a worker counted as an N+1
+DEFAULT_THRESHOLD = 3
+# workers showing the same N+1 before the relationship is eager loaded
+DEFAULT_MIN_WORKERS = 3
+
+
+class WorkerLoading(object):
+    """ The profile applied to the queries of a worker, shared by all of
+    its sessions, and the lazy loads counted for it.
+    """
+
+    __slots__ = ('profile', 'lazy_loads')
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.lazy_loads = Counter()
+
+
+class EagerLoading(object):
+    """ Applies eager loading options to the ORM selects of each worker,
+    according to a profile named after the worker's entrypoint method.
+
+    ``profiles`` maps profile names to dicts of mapped classes to loader
+    options, e.g. ``{'get_order': {Order: [selectinload(Order.items)]}}``.
+    The options of a class are added to selects of that class, including
+    the selects loading relationships to it.
+
+    With ``auto_tune``, lazy loads are counted by relationship for each
+    worker. A relationship lazily loaded at least ``threshold`` times by
+    each of ``min_workers`` workers of the same profile is added to that
+    profile with ``selectinload``.
+    """
+
+    def __init__(
+        self, profiles=None, auto_tune=False, threshold=DEFAULT_THRESHOLD,
+        min_workers=DEFAULT_MIN_WORKERS
+    ):
+        self.profiles = {
+            name: {
+                inspect(class_): list(options)
+                for class_, options in profile.items()
+            }
+            for name, profile in (profiles or {}).items()
+        }
+        self.auto_tune = auto_tune
+        self.threshold = threshold
+        self.min_workers = min_workers
+        self.n_plus_ones = Counter()
+        self.learned = {}
+        self._options = {}
+
+    def watch_sessions(self, Session):
+        event.listen(Session, 'do_orm_execute', self._do_orm_execute)
+
+    def start_worker(self, worker_ctx):
+        entrypoint = getattr(worker_ctx, 'entrypoint', None)
+        return WorkerLoading(getattr(entrypoint, 'method_name', None))
+
+    def finish_worker(self, loading):
+        for (profile, mapper, key), count in loading.lazy_loads.items():
+            if count < self.threshold:
+                continue
+            self.n_plus_ones[profile, mapper, key] += 1
+            if self.n_plus_ones[profile, mapper, key] == self.min_workers:
+                self.learn(profile, mapper, key)
+
+    def learn(self, profile, mapper, key):
+        logger.info(
+            'Eager loading %s.%s in profile %s', mapper.class_.__name__, key,
+            profile)
+        learned = self.learned.setdefault(profile, {})
+        learned.setdefault(mapper, []).append(
+            selectinload(getattr(mapper.class_, key)))
+        self._options.clear()
+
+    def options(self, profile, mappers, path=()):
+        """ Returns the loader options of ``profile`` for a select of
+        ``mappers``. Those of a relationship load, along ``path``, are
+        relative to the relationships it follows.
+        """
+        cache_key = (profile, tuple(mappers), path)
+        try:
+            return self._options[cache_key]
+        except KeyError:
+            pass
+
+        options = []
+        for source in (self.profiles, self.learned):
+            for mapper, mapper_options in source.get(profile, {}).items():
+                if any(selected.isa(mapper) for selected in mappers):
+                    options.extend(mapper_options)
+        if options and path:
+            # the path alternates mappers and the relationships between them
+            options = [defaultload(*[
+                relationship.class_attribute for relationship in path[1::2]
+            ]).options(*options)]
+        self._options[cache_key] = options
+        return options
+
+    def as_dict(self):
+        """ Returns the relationships learned by each profile.
+        """
+        learned = {}
+        for (profile, mapper, key), workers in self.n_plus_ones.items():
+            if workers >= self.min_workers:
+                learned.setdefault(profile, []).append(
+                    '{}.{}'.format(mapper.class_.__name__, key))
+        return learned
+
+    def _do_orm_execute(self, execute_state):
+        loading = execute_state.session.info.get(LOADING_INFO_KEY)
+        if (
+            loading is None or
+            not execute_state.is_select or
+            execute_state.is_column_load
+        ):
+            return
+
+        if execute_state.is_relationship_load:
+            path = execute_state.loader_strategy_path.path
+        else:
+            path = ()
+
+        if self.auto_tune and execute_state.lazy_loaded_from is not None:
+            mapper, relationship = path[-2], path[-1]
+            loading.lazy_loads[
+                loading.profile, mapper, relationship.key] += 1
+
+        options = self.options(
+            loading.profile, execute_state.all_mappers, path)
+        if options:
+            execute_state.statement = execute_state.statement.options(
+                *options)
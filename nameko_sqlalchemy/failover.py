@@ -0,0 +1,130 @@
+import logging
+import time
+from weakref import WeakKeyDictionary
+
+from eventlet.semaphore import Semaphore
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_INTERVAL = 5
+
+# cannot_connect_now, raised by a PostgreSQL server in recovery
+FAILOVER_SQLSTATES = frozenset(['57P03'])
+
+# read_only_sql_transaction, also raised by transactions the application
+# made read only, so only counted on a hot standby
+READ_ONLY_SQLSTATE = '25006'
+
+# ER_READ_ONLY_MODE
+FAILOVER_MYSQL_ERRORS = frozenset([1836])
+
+# ER_OPTION_PREVENTS_STATEMENT, raised for options other than read only too
+OPTION_PREVENTS_STATEMENT = 1290
+READ_ONLY_OPTIONS = ('--read-only', '--super-read-only')
+
+
+def is_failover_error(exception, dbapi_connection=None):
+    """ Returns whether ``exception``, raised by the DBAPI on
+    ``dbapi_connection``, shows the database to have been demoted from
+    primary, e.g. after a failover.
+    """
+    sqlstate = (
+        getattr(exception, 'pgcode', None) or
+        getattr(exception, 'sqlstate', None)
+    )
+    if sqlstate in FAILOVER_SQLSTATES:
+        return True
+    if sqlstate == READ_ONLY_SQLSTATE:
+        return in_hot_standby(dbapi_connection)
+
+    args = getattr(exception, 'args', ())
+    if not args:
+        return False
+    if args[0] in FAILOVER_MYSQL_ERRORS:
+        return True
+    return (
+        args[0] == OPTION_PREVENTS_STATEMENT and len(args) > 1 and
+        any(option in str(args[1]) for option in READ_ONLY_OPTIONS)
+    )
+
+
+def in_hot_standby(dbapi_connection):
+    """ Returns whether ``dbapi_connection`` is to a PostgreSQL standby, as
+    reported by servers from PostgreSQL 14 to psycopg2 and psycopg.
+    """
+    info = getattr(dbapi_connection, 'info', None)
+    parameter_status = getattr(info, 'parameter_status', None)
+    return (
+        parameter_status is not None and
+        parameter_status('in_hot_standby') == 'on'
+    )
+
+
+def error_connection(exception_context):
+    """ Returns the DBAPI connection an error was raised on, if known.
+    """
+    connection = exception_context.connection
+    if connection is None or connection.closed or connection.invalidated:
+        return None
+    return connection.connection.dbapi_connection
+
+
+class FailoverDetector(object):
+    """ Recovers the engines it listens to from a failover in one step,
+    rather than one connection at a time.
+
+    Errors for which ``is_failover``, called with the DBAPI exception and
+    connection, returns true are reported as disconnects, so that the
+    connection is invalidated and ``transaction_retry`` rolls back before
+    retrying, and ``on_failover`` is called with the engine. It defaults to
+    disposing of the engine's pool, so that every connection is reopened
+    and host names are resolved again. ``on_failover`` runs behind a lock,
+    at most once every ``min_interval`` seconds for each engine.
+    """
+
+    def __init__(
+        self, on_failover=None, is_failover=is_failover_error,
+        min_interval=DEFAULT_MIN_INTERVAL
+    ):
+        self.on_failover = on_failover or dispose
+        self.is_failover = is_failover
+        self.min_interval = min_interval
+        self.lock = Semaphore()
+        self.last_failover = WeakKeyDictionary()
+        self.failovers = 0
+
+    def listen(self, engine):
+        def handle_error(exception_context):
+            self._handle_error(engine, exception_context)
+
+        event.listen(engine, 'handle_error', handle_error)
+
+    def _handle_error(self, engine, exception_context):
+        if not self.is_failover(
+            exception_context.original_exception,
+            error_connection(exception_context)
+        ):
+            return
+        exception_context.is_disconnect = True
+        self.failover(engine)
+
+    def failover(self, engine):
+        """ Calls ``on_failover`` with ``engine`` unless it was called for
+        it less than ``min_interval`` seconds ago. Returns whether it was.
+        """
+        with self.lock:
+            now = time.time()
+            last = self.last_failover.get(engine)
+            if last is not None and now - last < self.min_interval:
+                return False
+            self.last_failover[engine] = now
+            self.failovers += 1
+
+            logger.warning('Failover detected on %r, reconnecting', engine)
+            self.on_failover(engine)
+            return True
+
+
+def dispose(engine):
+    engine.dispose()
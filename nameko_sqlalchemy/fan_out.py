@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from eventlet import GreenPool
+from eventlet.patcher import is_monkey_patched
+
+DEFAULT_CONCURRENCY = 4
+
+
+def execute(connection, statement):
+    """ Executes ``statement``, or a ``(statement, params)`` tuple, and
+    returns all its rows, or the number of rows it matched if it returns
+    none.
+    """
+    if isinstance(statement, tuple):
+        statement, params = statement
+    else:
+        params = {}
+    result = connection.execute(statement, params)
+    if result.returns_rows:
+        return result.all()
+    return result.rowcount
+
+
+class FanOut(object):
+    """ Runs the statements given to :meth:`run` concurrently, each on a
+    connection of its own from ``connect``, with no more than
+    ``concurrency`` of them in flight for the worker at a time.
+
+    Statements run in green threads when the standard library's sockets are
+    monkey patched, as they are in nameko services, and in a pool of native
+    threads otherwise, so that blocking drivers still overlap.
+    """
+
+    def __init__(self, connect, concurrency=DEFAULT_CONCURRENCY):
+        self.connect = connect
+        self.concurrency = concurrency
+        self._pool = None
+
+    def run(self, statements):
+        """ Returns the results of ``statements`` in order. If any of them
+        fails, the first error is raised once all of them have ended, so
+        that every connection is back in the pool.
+        """
+        if self._pool is None:
+            if is_monkey_patched('socket'):
+                self._pool = GreenPool(self.concurrency)
+            else:
+                self._pool = ThreadPoolExecutor(self.concurrency)
+
+        if isinstance(self._pool, GreenPool):
+            pending = [
+                self._pool.spawn(self._execute, statement).wait
+                for statement in statements
+            ]
+        else:
+            pending = [
+                self._pool.submit(self._execute, statement).result
+                for statement in statements
+            ]
+
+        results = []
+        error = None
+        for wait in pending:
+            try:
+                results.append(wait())
+            except Exception as exc:
+                if error is None:
+                    error = exc
+        if error is not None:
+            raise error
+        return results
+
+    def _execute(self, statement):
+        with self.connect() as connection:
+            return execute(connection, statement)
+
+    def close(self):
+        if isinstance(self._pool, ThreadPoolExecutor):
+            self._pool.shutdown()
+        self._pool = None
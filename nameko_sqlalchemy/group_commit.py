@@ -0,0 +1,119 @@
+import logging
+import sys
+
+from eventlet.event import Event
+
+from nameko_sqlalchemy.batching import BatchQueue
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 0.005
+DEFAULT_MAX_BATCH = 100
+
+
+class GroupCommit(object):
+    """ Coalesces writes submitted by concurrent workers into shared
+    transactions, so that many of them pay for a single commit.
+
+    Units of work are callables taking a session. :meth:`run`, in a green
+    thread of its own, collects the units submitted within ``window``
+    seconds of the first one, up to ``max_batch`` of them, runs them all
+    with one session and commits it. If any unit or the commit fails, the
+    transaction is rolled back and the units are run again, each committed
+    separately, so that only the failing ones raise. Units may therefore run
+    twice and should only act through the session they are given.
+    """
+
+    def __init__(
+        self, Session, window=DEFAULT_WINDOW, max_batch=DEFAULT_MAX_BATCH
+    ):
+        self.Session = Session
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = BatchQueue()
+        self.batches = 0
+        self.units = 0
+        self.fallbacks = 0
+
+    def submit(self, unit):
+        """ Waits for ``unit`` to be committed and returns its result.
+        """
+        result = Event()
+        self.queue.put((unit, result))
+        return result.wait()
+
+    def stop(self):
+        """ Ends :meth:`run` once the units already submitted are committed.
+        """
+        self.queue.stop()
+
+    def run(self):
+        while True:
+            batch = self.queue.get_batch(self.window, self.max_batch)
+            if not batch:
+                return
+            self.commit(batch)
+
+    def commit(self, batch):
+        self.batches += 1
+        self.units += len(batch)
+
+        try:
+            self.commit_batch(batch)
+        except Exception:
+            # a session failed to roll back or close: the units still
+            # waiting get the error rather than waiting forever
+            logger.exception('Group commit of %d units failed', len(batch))
+            for _, result in batch:
+                if not result.ready():
+                    result.send_exception(*sys.exc_info())
+
+    def commit_batch(self, batch):
+        session = self.Session()
+        try:
+            results = [unit(session) for unit, _ in batch]
+            session.commit()
+        except Exception:
+            session.rollback()
+            if len(batch) == 1:
+                _, result = batch[0]
+                result.send_exception(*sys.exc_info())
+                return
+            self.fallbacks += 1
+            logger.warning(
+                'Group commit of %d units failed, committing them separately',
+                len(batch), exc_info=True)
+            self.commit_each(batch)
+        else:
+            for (_, result), value in zip(batch, results):
+                result.send(value)
+        finally:
+            session.close()
+
+    def commit_each(self, batch):
+        for unit, result in batch:
+            try:
+                value = self.commit_one(unit)
+            except Exception:
+                result.send_exception(*sys.exc_info())
+            else:
+                result.send(value)
+
+    def commit_one(self, unit):
+        session = self.Session()
+        try:
+            value = unit(session)
+            session.commit()
+            return value
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def as_dict(self):
+        return {
+            'batches': self.batches,
+            'units': self.units,
+            'fallbacks': self.fallbacks,
+        }
@@ -0,0 +1,45 @@
+import datetime
+import uuid
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, select
+
+TABLE_NAME = 'nameko_sqlalchemy_idempotency_keys'
+
+# create the table with ``metadata.create_all(engine)`` or a migration
+metadata = MetaData()
+
+idempotency_keys = Table(
+    TABLE_NAME, metadata,
+    Column('key', String(255), primary_key=True),
+    Column(
+        'created_at', DateTime, nullable=False,
+        default=datetime.datetime.utcnow),
+)
+
+
+def new_key():
+    return uuid.uuid4().hex
+
+
+def record(session, key):
+    """ Inserts ``key`` in the current transaction of ``session``. A key
+    recorded before raises an ``IntegrityError`` once flushed.
+    """
+    session.execute(idempotency_keys.insert().values(key=key))
+
+
+def is_recorded(session, key):
+    return session.execute(
+        select(idempotency_keys.c.key).where(idempotency_keys.c.key == key)
+    ).first() is not None
+
+
+def delete_expired(session, max_age):
+    """ Deletes the keys recorded more than ``max_age`` seconds ago and
+    returns how many were deleted. Doesn't commit.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=max_age)
+    return session.execute(
+        idempotency_keys.delete().where(
+            idempotency_keys.c.created_at < cutoff)
+    ).rowcount
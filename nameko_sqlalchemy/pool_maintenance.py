@@ -0,0 +1,137 @@
+import logging
+import time
+
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.util import queue as sqla_queue
+
+logger = logging.getLogger(__name__)
+
+# QueuePool internals maintenance relies on, as SQLAlchemy has no public API
+# to take an idle connection out of a pool and put it back
+POOL_INTERNALS = ('_pool', '_dec_overflow', '_dialect')
+
+
+class PoolMaintenance(object):
+    """ Housekeeping for the idle connections of a :class:`QueuePool`.
+
+    Each :meth:`run_once` call closes idle connections in excess of
+    ``min_idle``, reconnects idle connections opened more than
+    ``max_lifetime`` seconds ago and, if ``pre_ping`` is set, pings the
+    remaining idle connections and reconnects those found dead. Checked out
+    connections are never touched, so this work happens off the request path
+    rather than when a worker checks a connection out.
+
+    Idle connections are taken out of the pool one at a time, the one idle
+    for longest first, and put back as soon as they are checked, so that the
+    others stay available to workers. This relies on the internals of
+    SQLAlchemy 1.4's :class:`QueuePool` listed in ``POOL_INTERNALS``, and a
+    :class:`TypeError` is raised for pools without them.
+    """
+
+    def __init__(
+        self, pool, interval=30, min_idle=None, max_lifetime=None,
+        pre_ping=False
+    ):
+        if not isinstance(pool, QueuePool):
+            raise TypeError(
+                'Pool maintenance requires a QueuePool, not {}'.format(
+                    type(pool).__name__))
+        missing = [name for name in POOL_INTERNALS if not hasattr(pool, name)]
+        if missing:
+            raise TypeError(
+                'Pool maintenance is not supported by this version of '
+                'SQLAlchemy, QueuePool lacks {}'.format(', '.join(missing)))
+        self.pool = pool
+        self.interval = interval
+        self.min_idle = min_idle
+        self.max_lifetime = max_lifetime
+        self.pre_ping = pre_ping
+
+    def run_once(self):
+        """ Returns the number of connections trimmed, recycled and found
+        dead by pinging.
+        """
+        stats = {'trimmed': 0, 'recycled': 0, 'dead': 0}
+        if self.min_idle is not None:
+            stats['trimmed'] = self.trim()
+        if self.max_lifetime is not None or self.pre_ping:
+            # each is put back behind the others, so the connections idle
+            # at the start are visited once, and keep their order
+            for _ in range(self.pool.checkedin()):
+                record = self._take_oldest()
+                if record is None:
+                    break
+                try:
+                    outcome = self._check(record)
+                    if outcome:
+                        stats[outcome] += 1
+                finally:
+                    self._return(record)
+        return stats
+
+    def trim(self):
+        trimmed = 0
+        while self.pool.checkedin() > self.min_idle:
+            record = self._take_oldest()
+            if record is None:
+                break
+            try:
+                record.close()
+            finally:
+                # frees the slot, as QueuePool does for returned overflow
+                self.pool._dec_overflow()
+            trimmed += 1
+        return trimmed
+
+    def _take_oldest(self):
+        """ Takes the connection idle for longest out of the pool, the
+        first of its queue both when it hands out the oldest or the newest.
+        """
+        queue = self.pool._pool
+        with queue.mutex:
+            if not queue.queue:
+                return None
+            record = queue.queue.popleft()
+            queue.not_full.notify()
+            return record
+
+    def _return(self, record):
+        try:
+            self.pool._pool.put(record, False)
+        except sqla_queue.Full:
+            # connections were opened for workers meanwhile
+            try:
+                record.close()
+            finally:
+                self.pool._dec_overflow()
+
+    def _check(self, record):
+        if record.connection is None:
+            return None
+
+        if (
+            self.max_lifetime is not None and
+            time.time() - record.starttime > self.max_lifetime
+        ):
+            self._reconnect(record)
+            return 'recycled'
+
+        if self.pre_ping:
+            try:
+                alive = self.pool._dialect.do_ping(record.connection)
+            except Exception:
+                logger.warning('Error pinging idle connection', exc_info=True)
+                alive = False
+            if not alive:
+                self._reconnect(record)
+                return 'dead'
+
+        return None
+
+    def _reconnect(self, record):
+        record.close()
+        try:
+            record.get_connection()
+        except Exception:
+            # left disconnected; the next checkout will connect instead
+            logger.warning('Error reconnecting idle connection', exc_info=True)
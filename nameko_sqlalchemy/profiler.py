@@ -0,0 +1,178 @@
+import logging
+import random
+import re
+import time
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE = 0.01
+DEFAULT_TOP = 10
+
+# set on the connections running EXPLAIN, so they aren't profiled themselves
+SKIP_OPTION = 'nameko_sqlalchemy_skip_profiling'
+
+EXPLAINABLE = ('select', 'insert', 'update', 'delete', 'with')
+
+FINGERPRINT_CACHE_SIZE = 1000
+
+NORMALISE = [
+    # string literals
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    # bound parameters in any paramstyle
+    (re.compile(r'%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+'), '?'),
+    # numeric literals
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\s+'), ' '),
+    # IN lists and multi row VALUES of any length
+    (re.compile(r'\(\?(?: ?, ?\?)+\)'), '(?, ...)'),
+    (re.compile(r'(\([^()]*\))(?: ?, ?\1)+'), r'\1, ...'),
+]
+
+
+def fingerprint(statement):
+    """ Returns ``statement`` with its literals and parameters replaced by
+    ``?``, so that statements differing only by their values are profiled
+    together.
+    """
+    for pattern, replacement in NORMALISE:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+class StatementStats(object):
+
+    def __init__(self, fingerprint, engine, statement, parameters):
+        self.fingerprint = fingerprint
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.plan = None
+        # a sample to EXPLAIN
+        self.engine = engine
+        self.statement = statement
+        self.parameters = parameters
+
+    def add(self, duration):
+        self.count += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+
+    def as_dict(self):
+        return {
+            'fingerprint': self.fingerprint,
+            'count': self.count,
+            'total_time': self.total_time,
+            'mean_time': self.total_time / self.count,
+            'max_time': self.max_time,
+            'plan': self.plan,
+        }
+
+
+class StatementProfiler(object):
+    """ Times a random ``sample_rate`` fraction of the statements executed
+    on the engines it listens to, aggregated by :func:`fingerprint`.
+
+    :meth:`report` returns the ``top`` statements by total sampled time,
+    capturing the query plan of each the first time it is reported with
+    ``EXPLAIN``, or ``EXPLAIN QUERY PLAN`` on SQLite. Plans are captured
+    outside of the statements' own transactions, on a separate connection.
+    """
+
+    def __init__(
+        self, sample_rate=DEFAULT_SAMPLE_RATE, top=DEFAULT_TOP, explain=True
+    ):
+        self.sample_rate = sample_rate
+        self.top = top
+        self.explain = explain
+        self.stats = {}
+        self.fingerprints = {}
+
+    def listen(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def _before_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        if (
+            random.random() < self.sample_rate and
+            not context.execution_options.get(SKIP_OPTION, False)
+        ):
+            context._profile_start = time.perf_counter()
+
+    def _after_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        started = getattr(context, '_profile_start', None)
+        if started is None:
+            return
+        duration = time.perf_counter() - started
+
+        key = self._fingerprint(statement)
+        try:
+            stats = self.stats[key]
+        except KeyError:
+            if executemany:
+                parameters = parameters[0] if parameters else ()
+            stats = self.stats[key] = StatementStats(
+                key, conn.engine, statement, parameters)
+        stats.add(duration)
+
+    def _fingerprint(self, statement):
+        try:
+            return self.fingerprints[statement]
+        except KeyError:
+            if len(self.fingerprints) >= FINGERPRINT_CACHE_SIZE:
+                self.fingerprints.clear()
+            key = self.fingerprints[statement] = fingerprint(statement)
+            return key
+
+    def reset(self):
+        self.stats.clear()
+
+    def report(self):
+        """ Returns the ``top`` statements by total sampled time, as dicts.
+        """
+        top = sorted(
+            self.stats.values(), key=lambda stats: stats.total_time,
+            reverse=True)[:self.top]
+        if self.explain:
+            for stats in top:
+                if stats.plan is None:
+                    stats.plan = self._explain(stats)
+        return [stats.as_dict() for stats in top]
+
+    def format_report(self):
+        lines = []
+        for stats in self.report():
+            lines.append(
+                '{total_time:9.3f}s {count:8d}x  mean {mean:8.3f}ms  '
+                'max {max:8.3f}ms  {fingerprint}'.format(
+                    mean=stats['mean_time'] * 1000,
+                    max=stats['max_time'] * 1000, **stats))
+            for row in stats['plan'] or ():
+                lines.append('    {}'.format(row))
+        return '\n'.join(lines)
+
+    def _explain(self, stats):
+        if not stats.statement.lstrip().lower().startswith(EXPLAINABLE):
+            return []
+
+        if stats.engine.dialect.name == 'sqlite':
+            prefix = 'EXPLAIN QUERY PLAN '
+        else:
+            prefix = 'EXPLAIN '
+        try:
+            with stats.engine.connect() as connection:
+                connection = connection.execution_options(
+                    **{SKIP_OPTION: True})
+                result = connection.exec_driver_sql(
+                    prefix + stats.statement, stats.parameters)
+                return [
+                    ' '.join(str(value) for value in row) for row in result]
+        except Exception:
+            logger.warning(
+                'Error explaining %s', stats.fingerprint, exc_info=True)
+            return []
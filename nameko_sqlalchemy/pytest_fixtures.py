@@ -1,8 +1,123 @@
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
-from .database import DatabaseWrapper, Session
+RecordedQuery = namedtuple(
+    'RecordedQuery', ['statement', 'parameters', 'duration', 'rows'])
+
+
+class _RowCountingCursor(object):
+    """ DBAPI cursor proxy counting the rows fetched through it.
+    """
+
+    def __init__(self, cursor, query):
+        self._cursor = cursor
+        self._query = query
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _count(self, rows):
+        self._query['rows'] += len(rows)
+        return rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._query['rows'] += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        return self._count(self._cursor.fetchmany(*args, **kwargs))
+
+    def fetchall(self):
+        return self._count(self._cursor.fetchall())
+
+
+class QueryRecorder(object):
+    """ Records every statement executed on ``engine`` while active.
+
+    Used as a context manager, the recorder collects the statements, their
+    parameters, execution time and the number of rows fetched from their
+    results, along with the wall time spent inside the block.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._queries = []
+        self.duration = None
+
+    @property
+    def queries(self):
+        return [
+            RecordedQuery(**query) for query in self._queries
+        ]
+
+    @property
+    def rows(self):
+        return sum(query['rows'] for query in self._queries)
+
+    def __len__(self):
+        return len(self._queries)
+
+    def __enter__(self):
+        event.listen(
+            self.engine, 'before_cursor_execute', self._before_execute)
+        event.listen(
+            self.engine, 'after_cursor_execute', self._after_execute)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.duration = time.perf_counter() - self._started
+        event.remove(
+            self.engine, 'before_cursor_execute', self._before_execute)
+        event.remove(
+            self.engine, 'after_cursor_execute', self._after_execute)
+
+    def _before_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        context._query_recorder_started = time.perf_counter()
+
+    def _after_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        query = {
+            'statement': statement,
+            'parameters': parameters,
+            'duration': (
+                time.perf_counter() - context._query_recorder_started),
+            'rows': 0,
+        }
+        self._queries.append(query)
+        # results are fetched from the context's cursor after this event
+        context.cursor = _RowCountingCursor(context.cursor, query)
+
+    def check(self, max_queries=None, max_rows=None, max_time=None):
+        """ Raise ``AssertionError`` if any of the given budgets is exceeded.
+        """
+        failures = []
+        if max_queries is not None and len(self) > max_queries:
+            failures.append('{} queries executed, expected at most {}'.format(
+                len(self), max_queries))
+        if max_rows is not None and self.rows > max_rows:
+            failures.append('{} rows fetched, expected at most {}'.format(
+                self.rows, max_rows))
+        if max_time is not None and self.duration > max_time:
+            failures.append('took {:.3f}s, expected at most {:.3f}s'.format(
+                self.duration, max_time))
+        if failures:
+            statements = '\n'.join(
+                '  {}. {}'.format(index, query.statement)
+                for index, query in enumerate(self.queries, start=1)
+            )
+            raise AssertionError('{}\nRecorded queries:\n{}'.format(
+                '; '.join(failures), statements))
 
 
 def pytest_addoption(parser):
@@ -129,6 +244,9 @@ def db_connection(db_url, model_base, db_engine_options):
 
 @pytest.yield_fixture
 def db_session(db_connection, model_base):
+    # imported here so that loading the plugin doesn't import nameko
+    from .database import Session
+
     session = sessionmaker(bind=db_connection, class_=Session)
     db_session = session()
 
@@ -145,6 +263,7 @@ def db_session(db_connection, model_base):
 
 @pytest.yield_fixture
 def database(db_connection, model_base):
+    from .database import DatabaseWrapper, Session
 
     database = DatabaseWrapper(
         sessionmaker(bind=db_connection, class_=Session))
@@ -157,3 +276,32 @@ def database(db_connection, model_base):
     for table in reversed(model_base.metadata.sorted_tables):
         db_connection.execute(table.delete())
     transaction.commit()
+
+
+@pytest.fixture
+def assert_max_queries(db_connection):
+    """ Assert that a block stays within a query, row and time budget
+
+    Every statement executed on the test database while the block runs
+    is recorded; the block fails the test if more than ``max_queries``
+    statements were executed, more than ``max_rows`` rows were fetched or
+    more than ``max_time`` seconds elapsed. The
+    :class:`~nameko_sqlalchemy.pytest_fixtures.QueryRecorder` is yielded
+    so the recorded statements can be inspected as well.
+
+    .. code-block:: python
+
+        def test_list_users(assert_max_queries, database):
+            service = worker_factory(UserService, db=database)
+
+            with assert_max_queries(1, max_rows=10, max_time=0.5):
+                service.list_users()
+    """
+    @contextmanager
+    def assert_max_queries(max_queries=None, max_rows=None, max_time=None):
+        with QueryRecorder(db_connection.engine) as recorder:
+            yield recorder
+        recorder.check(
+            max_queries=max_queries, max_rows=max_rows, max_time=max_time)
+
+    return assert_max_queries
@@ -0,0 +1,112 @@
+import re
+
+from sqlalchemy import event, text
+
+from nameko_sqlalchemy.statement_cache import StatementRegistry
+
+PREPARED_INFO_KEY = 'nameko_sqlalchemy.prepared_queries'
+
+QUERY_NAME_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+NUMERIC_PARAM_PATTERN = re.compile(r'(?<![:\w]):(\d+)')
+
+PLACEHOLDERS = {
+    'format': '%s',
+    'pyformat': '%s',
+    'qmark': '?',
+    'numeric': ':{}',
+}
+
+
+def supports_server_side_prepare(dialect):
+    return (
+        dialect.name == 'postgresql' and dialect.paramstyle in PLACEHOLDERS)
+
+
+class QueryRegistry(StatementRegistry):
+    """ Named, parameterised queries compiled once per provider.
+
+    ``queries`` maps names to SQL strings using ``:name`` bound parameters,
+    or to statements as accepted by :class:`StatementRegistry`.
+
+    With ``prepare`` set, each query is also prepared server side on every
+    pooled connection the first time it is checked out, and executed with
+    ``EXECUTE`` from then on. Only PostgreSQL supports this; on other
+    databases queries run precompiled, relying on the driver's own
+    statement cache.
+    """
+
+    def __init__(self, queries=None, prepare=False):
+        queries = {
+            name: text(query) if isinstance(query, str) else query
+            for name, query in (queries or {}).items()
+        }
+        super(QueryRegistry, self).__init__(queries)
+        self.prepare = prepare
+        self.prepared = {}
+        if prepare:
+            for name in queries:
+                if not QUERY_NAME_PATTERN.match(name):
+                    raise ValueError(
+                        'Query name {!r} cannot be used as the name of a '
+                        'prepared statement'.format(name))
+
+    def compile(self, dialect, **kwargs):
+        super(QueryRegistry, self).compile(dialect, **kwargs)
+        if self.prepare and supports_server_side_prepare(dialect):
+            placeholder = PLACEHOLDERS[dialect.paramstyle]
+            for name in self.statements:
+                self.prepared[name] = self._prepared_sql(
+                    name, dialect, placeholder)
+
+    def _prepared_sql(self, name, dialect, placeholder):
+        # compile with numbered parameters, which PREPARE spells $1, $2...
+        numeric_dialect = dialect.__class__(paramstyle='numeric')
+        compiled = self.statements[name].compile(dialect=numeric_dialect)
+        param_names = list(compiled.positiontup)
+        quoted_name = dialect.identifier_preparer.quote(name)
+
+        prepare_sql = 'PREPARE {} AS {}'.format(
+            quoted_name, NUMERIC_PARAM_PATTERN.sub(r'$\1', compiled.string))
+        if param_names:
+            execute_sql = 'EXECUTE {} ({})'.format(quoted_name, ', '.join(
+                placeholder.format(index)
+                for index, _ in enumerate(param_names, start=1)
+            ))
+        else:
+            execute_sql = 'EXECUTE {}'.format(quoted_name)
+        return prepare_sql, execute_sql, param_names
+
+    def listen(self, engine):
+        if self.prepared:
+            event.listen(engine, 'checkout', self._prepare_on_checkout)
+
+    def _prepare_on_checkout(
+        self, dbapi_connection, connection_record, connection_proxy
+    ):
+        prepared = connection_record.info.setdefault(PREPARED_INFO_KEY, set())
+        missing = [name for name in self.prepared if name not in prepared]
+        if not missing:
+            return
+
+        cursor = dbapi_connection.cursor()
+        try:
+            for name in missing:
+                cursor.execute(self.prepared[name][0])
+        except Exception:
+            dbapi_connection.rollback()
+            raise
+        else:
+            # don't leave the implicit transaction open on the connection
+            dbapi_connection.commit()
+            prepared.update(missing)
+        finally:
+            cursor.close()
+
+    def execute(self, connection, name, params=None):
+        params = params or {}
+        if name in connection.info.get(PREPARED_INFO_KEY, ()):
+            _, execute_sql, param_names = self.prepared[name]
+            return connection.exec_driver_sql(
+                execute_sql, tuple(params[param] for param in param_names))
+        return super(QueryRegistry, self).execute(connection, name, params)
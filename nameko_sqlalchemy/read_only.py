@@ -0,0 +1,46 @@
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import Session as BaseSession
+
+
+class ReadOnlyError(Exception):
+    """ Raised when a read only session is flushed with changes.
+    """
+
+
+class ReadOnlyMixin(object):
+    """ Makes a session cheaper for workers that only read: it never
+    autoflushes, doesn't expire its objects on commit and refuses to flush
+    changes, raising :class:`ReadOnlyError` instead.
+
+    :meth:`rows` reads without building ORM objects at all.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs['autoflush'] = False
+        kwargs['expire_on_commit'] = False
+        super(ReadOnlyMixin, self).__init__(*args, **kwargs)
+
+    def flush(self, objects=None):
+        if self.new or self.dirty or self.deleted:
+            raise ReadOnlyError(
+                'Cannot flush changes from a read only session')
+        super(ReadOnlyMixin, self).flush(objects)
+
+    def rows(self, statement, params=None):
+        """ Returns the rows of ``statement`` as named tuples, executed on
+        the session's connection rather than through the ORM, so that no
+        object or identity map entry is created for them.
+
+        ``statement`` may also be a mapped class, to select all of its
+        column attributes, named by their attribute keys.
+        """
+        if isinstance(statement, type):
+            statement = select(*[
+                getattr(statement, attribute.key).label(attribute.key)
+                for attribute in inspect(statement).column_attrs
+            ])
+        return self.connection().execute(statement, params or {}).all()
+
+
+class ReadOnlySession(ReadOnlyMixin, BaseSession):
+    pass
@@ -0,0 +1,144 @@
+from eventlet.semaphore import Semaphore
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+from nameko_sqlalchemy.pool_maintenance import PoolMaintenance
+
+DEFAULT_CONNECTION_TIMEOUT = 30
+
+
+class ShardNotFound(LookupError):
+    """ Raised when a worker is routed to a shard missing from the shard map.
+    """
+
+
+class ConnectionLimit(object):
+    """ Bounds the number of database connections open at once across the
+    pools of several engines.
+
+    A slot is taken before each DBAPI connection is opened and given back
+    when it is closed, so connections idle in the pools count towards
+    ``size``. When no slot is left, the idle connections of the other
+    engines' pools are closed, so that a busy shard can use the capacity
+    held by quiet ones, and the new connection waits up to ``timeout``
+    seconds for another to be closed. Connections checked in meanwhile are
+    closed rather than kept idle.
+    """
+
+    def __init__(self, size, timeout=DEFAULT_CONNECTION_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self.semaphore = Semaphore(size)
+        self.engines = []
+
+    def listen(self, engine):
+        self.engines.append(engine)
+        # opens the connection itself, so must be the last listener
+        event.listen(engine, 'do_connect', self._connect)
+        event.listen(engine, 'checkin', self._checkin)
+        event.listen(engine, 'close', self._release)
+        event.listen(engine, 'close_detached', self._release_detached)
+
+    def _connect(self, dialect, connection_record, cargs, cparams):
+        self._acquire(dialect)
+        try:
+            return dialect.connect(*cargs, **cparams)
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+    def _acquire(self, dialect):
+        if self.semaphore.acquire(blocking=False):
+            return
+        self._close_idle(dialect)
+        if not self.semaphore.acquire(timeout=self.timeout):
+            raise exc.TimeoutError(
+                'Limit of {} connections across shards reached, timed out '
+                'after {}s'.format(self.size, self.timeout))
+
+    def _close_idle(self, dialect):
+        for engine in self.engines:
+            pool = engine.pool
+            # the pool opening a connection has none idle to close
+            if engine.dialect is not dialect and (
+                isinstance(pool, QueuePool) and pool.checkedin()
+            ):
+                # unlike dispose, keeps the accounting of the connections
+                # still checked out of the pool
+                PoolMaintenance(pool, min_idle=0).trim()
+
+    def _checkin(self, dbapi_connection, connection_record):
+        # a new connection is waiting for a slot
+        if dbapi_connection is not None and self.semaphore.balance < 0:
+            connection_record.invalidate()
+
+    def _release(self, dbapi_connection, connection_record):
+        self.semaphore.release()
+
+    def _release_detached(self, dbapi_connection):
+        self.semaphore.release()
+
+    @property
+    def open_connections(self):
+        return self.size - self.semaphore.balance
+
+
+class ShardRouter(object):
+    """ Engines and session factories for a map of shards, created the first
+    time a worker is routed to each shard.
+
+    ``uris`` maps shard ids to database URIs. ``create_engine`` is called
+    with a URI and returns the engine for it, and ``create_sessionmaker``
+    with that engine. If ``max_connections`` is given, the connections
+    open across all shards are bounded by a :class:`ConnectionLimit`.
+    """
+
+    def __init__(
+        self, uris, create_engine, create_sessionmaker, max_connections=None,
+        timeout=DEFAULT_CONNECTION_TIMEOUT
+    ):
+        self.uris = uris
+        self.create_engine = create_engine
+        self.create_sessionmaker = create_sessionmaker
+        self.limit = (
+            ConnectionLimit(max_connections, timeout)
+            if max_connections is not None else None
+        )
+        self.engines = {}
+        self.sessionmakers = {}
+        self.lock = Semaphore()
+
+    def __contains__(self, shard_id):
+        return shard_id in self.uris
+
+    def sessionmaker(self, shard_id):
+        try:
+            return self.sessionmakers[shard_id]
+        except KeyError:
+            pass
+
+        if shard_id not in self.uris:
+            raise ShardNotFound(
+                'No database configured for shard {!r}'.format(shard_id))
+
+        with self.lock:
+            # another worker may have created it while we waited
+            if shard_id not in self.sessionmakers:
+                engine = self.create_engine(self.uris[shard_id])
+                if self.limit is not None:
+                    self.limit.listen(engine)
+                self.engines[shard_id] = engine
+                self.sessionmakers[shard_id] = self.create_sessionmaker(
+                    engine)
+        return self.sessionmakers[shard_id]
+
+    def engine(self, shard_id):
+        self.sessionmaker(shard_id)
+        return self.engines[shard_id]
+
+    def dispose(self):
+        with self.lock:
+            for engine in self.engines.values():
+                engine.dispose()
+            self.engines.clear()
+            self.sessionmakers.clear()
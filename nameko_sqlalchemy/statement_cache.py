@@ -0,0 +1,90 @@
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+from sqlalchemy.sql import ClauseElement
+
+
+class CompiledCacheStats(object):
+    """ Counts how often the statements executed on an engine were found in
+    its compiled cache.
+
+    The cache itself is sized with the ``query_cache_size`` engine option.
+    Statements that cannot be cached, such as plain SQL strings or
+    precompiled statements, are counted as ``uncached``.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.reset()
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def _after_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        if context.cache_hit is CACHE_HIT:
+            self.hits += 1
+        elif context.cache_hit is CACHE_MISS:
+            self.misses += 1
+        else:
+            self.uncached += 1
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @property
+    def size(self):
+        cache = self.engine._compiled_cache
+        return len(cache) if cache is not None else 0
+
+    @property
+    def capacity(self):
+        cache = self.engine._compiled_cache
+        return cache.capacity if cache is not None else 0
+
+    def as_dict(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'uncached': self.uncached,
+            'hit_rate': self.hit_rate,
+            'size': self.size,
+            'capacity': self.capacity,
+        }
+
+
+class StatementRegistry(object):
+    """ Named statements compiled once and executed without recompiling.
+
+    ``statements`` maps names to Core or ORM statements, or to callables
+    returning one so that models can be referenced lazily. They are compiled
+    for the engine's dialect by :meth:`compile`, which the providers call in
+    ``setup()``, passing on any compiler options such as
+    ``schema_translate_map``; values are passed as bound parameters on
+    execution.
+    """
+
+    def __init__(self, statements=None):
+        self.statements = dict(statements or {})
+        self.compiled = {}
+
+    def __contains__(self, name):
+        return name in self.statements
+
+    def compile(self, dialect, **kwargs):
+        for name, statement in self.statements.items():
+            if not isinstance(statement, ClauseElement):
+                statement = self.statements[name] = statement()
+            self.compiled[name] = statement.compile(dialect=dialect, **kwargs)
+
+    def execute(self, connection, name, params=None):
+        try:
+            compiled = self.compiled[name]
+        except KeyError:
+            raise KeyError('No statement compiled as {!r}'.format(name))
+        return connection.execute(compiled, params or {})
@@ -0,0 +1,269 @@
+import functools
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Tuple
+from weakref import WeakKeyDictionary
+
+from greenlet import getcurrent, greenlet
+from sqlalchemy import event
+
+CHECKOUT = 'db.checkout'
+STATEMENT = 'db.statement'
+COMMIT = 'db.commit'
+ROLLBACK = 'db.rollback'
+RETRY_ATTEMPT = 'db.transaction_retry.attempt'
+
+# the traces of each green thread, eventlet's are greenlets, by the owner
+# they were activated for, e.g. each provider of a service
+_active: 'WeakKeyDictionary[greenlet, Dict[Any, Tuple[Tracer, Any]]]' = (
+    WeakKeyDictionary())
+
+
+class Tracer(object):
+    """ Interface of the tracers accepted by the providers.
+
+    :meth:`start_span` returns a span, an object with ``set_attribute(key,
+    value)`` and ``end(error=None)`` methods. ``parent_id`` is the call id
+    of the nameko worker the span belongs to. To export spans, implement it
+    on top of e.g. an OpenTelemetry tracer.
+    """
+
+    def start_span(self, name, parent_id, attributes=None):
+        raise NotImplementedError()
+
+
+class NoopSpan(object):
+
+    def set_attribute(self, key, value):
+        pass
+
+    def end(self, error=None):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class NoopTracer(Tracer):
+    """ The default tracer; providers using it don't instrument anything.
+    """
+
+    def start_span(self, name, parent_id, attributes=None):
+        return NOOP_SPAN
+
+
+class SpanGroup(object):
+    """ The spans of one operation traced by several tracers at once.
+    """
+
+    def __init__(self, spans):
+        self.spans = spans
+
+    def set_attribute(self, key, value):
+        for span in self.spans:
+            span.set_attribute(key, value)
+
+    def end(self, error=None):
+        for span in self.spans:
+            span.end(error=error)
+
+
+class Span(object):
+
+    def __init__(self, tracer, name, parent_id, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.end_time = None
+        self.error = None
+
+    def __repr__(self):
+        return '<Span {} of {}>'.format(self.name, self.parent_id)
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self, error=None):
+        self.end_time = time.time()
+        self.error = error
+        self.tracer.spans.append(self)
+
+    @property
+    def duration(self):
+        return self.end_time - self.start_time
+
+
+class InMemoryTracer(Tracer):
+    """ Records the ended spans in :attr:`spans`, for tests.
+    """
+
+    def __init__(self):
+        self.spans = []
+
+    def start_span(self, name, parent_id, attributes=None):
+        return Span(self, name, parent_id, attributes)
+
+    def spans_named(self, name):
+        return [span for span in self.spans if span.name == name]
+
+
+def is_noop(tracer):
+    return isinstance(tracer, NoopTracer)
+
+
+def activate(tracer, parent_id, owner=None):
+    """ Parents the spans of ``owner`` in the current green thread to
+    ``parent_id``. ``owner`` defaults to the tracer; providers pass
+    themselves, so that the traces of several providers of a service
+    don't replace one another.
+    """
+    current = getcurrent()
+    traces = _active.get(current)
+    if traces is None:
+        traces = _active[current] = {}
+    traces[tracer if owner is None else owner] = (tracer, parent_id)
+
+
+def deactivate(owner=None):
+    """ Ends the trace of ``owner`` in the current green thread, or all of
+    its traces if ``owner`` is None.
+    """
+    current = getcurrent()
+    if owner is None:
+        _active.pop(current, None)
+        return
+    traces = _active.get(current)
+    if traces is not None:
+        traces.pop(owner, None)
+        if not traces:
+            del _active[current]
+
+
+def active_trace(owner=None):
+    """ Returns the ``(tracer, parent_id)`` active for ``owner`` in the
+    current green thread, or for any owner if ``owner`` is None.
+    """
+    if not _active:
+        return None
+    traces = _active.get(getcurrent())
+    if not traces:
+        return None
+    if owner is None:
+        return next(iter(traces.values()))
+    return traces.get(owner)
+
+
+def active_traces():
+    """ Returns the distinct ``(tracer, parent_id)`` active in the current
+    green thread.
+    """
+    traces = _active.get(getcurrent()) if _active else None
+    if not traces:
+        return []
+    return list(dict.fromkeys(traces.values()))
+
+
+def start_span(name, owner=None, attributes=None):
+    """ Starts a span of ``owner``'s trace, or of every active trace if
+    ``owner`` is None, returning ``None`` if there is none.
+    """
+    if owner is not None:
+        trace = active_trace(owner)
+        traces = [] if trace is None else [trace]
+    else:
+        traces = active_traces()
+    spans = [
+        tracer.start_span(name, parent_id, attributes)
+        for tracer, parent_id in traces
+    ]
+    if not spans:
+        return None
+    if len(spans) == 1:
+        return spans[0]
+    return SpanGroup(spans)
+
+
+@contextmanager
+def span(name, **attributes):
+    """ Traces the enclosed block with every active tracer, if any.
+    """
+    current = start_span(name, attributes=attributes)
+    if current is None:
+        yield NOOP_SPAN
+        return
+
+    try:
+        yield current
+    except BaseException as exc:
+        current.end(error=exc)
+        raise
+    else:
+        current.end()
+
+
+def _traced(name, fn, owner):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        current = start_span(name, owner) if _active else None
+        if current is None:
+            return fn(*args, **kwargs)
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as exc:
+            current.end(error=exc)
+            raise
+        current.end()
+        return result
+    return wrapper
+
+
+def instrument_engine(engine, owner):
+    """ Traces connection checkouts, statements, commits and rollbacks on
+    ``engine`` in green threads with a trace active for ``owner``.
+    """
+    dialect = engine.dialect
+    dialect.do_commit = _traced(COMMIT, dialect.do_commit, owner)
+    dialect.do_rollback = _traced(ROLLBACK, dialect.do_rollback, owner)
+
+    def instrument_pool(engine):
+        pool = engine.pool
+        pool.connect = _traced(CHECKOUT, pool.connect, owner)
+
+    def before_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        if not _active:
+            return
+        context._trace_span = start_span(STATEMENT, owner, {
+            'db.system': conn.dialect.name,
+            'db.statement': statement,
+            'db.executemany': executemany,
+        })
+
+    instrument_pool(engine)
+    # disposing of an engine replaces its pool
+    event.listen(engine, 'engine_disposed', instrument_pool)
+
+    event.listen(engine, 'before_cursor_execute', before_execute)
+    event.listen(engine, 'after_cursor_execute', _after_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+
+def _after_execute(
+    conn, cursor, statement, parameters, context, executemany
+):
+    current = getattr(context, '_trace_span', None)
+    if current is not None:
+        current.set_attribute('db.rowcount', cursor.rowcount)
+        current.end()
+        context._trace_span = None
+
+
+def _handle_error(exception_context):
+    context = exception_context.execution_context
+    current = getattr(context, '_trace_span', None)
+    if current is not None:
+        current.end(error=exception_context.original_exception)
+        context._trace_span = None
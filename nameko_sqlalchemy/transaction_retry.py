@@ -1,46 +1,139 @@
 import functools
+import logging
 import operator
 from time import sleep
 
 import wrapt
 from sqlalchemy import exc
 
+from nameko_sqlalchemy import idempotency, tracing
+
+logger = logging.getLogger(__name__)
+
+
+class RetryPolicy(object):
+    """ The number of retries and the backoff between them, normalised once
+    when a function is decorated rather than on every call.
+    """
+
+    __slots__ = ('total', 'backoff_factor', 'backoff_max')
+
+    def __init__(self, total=1, backoff_factor=0, backoff_max=None):
+        self.total = max(total, 1)
+        self.backoff_factor = max(backoff_factor, 0)
+        self.backoff_max = (
+            float('inf') if backoff_max is None else max(0, backoff_max))
+
+    def backoff(self, errors):
+        """ Returns the delay before retrying after ``errors`` failures.
+        """
+        if errors < 2:
+            return 0
+        return min(self.backoff_factor * (2 ** (errors - 1)), self.backoff_max)
+
 
 def transaction_retry(wrapped=None, session=None, total=1,
-                      backoff_factor=0, backoff_max=None):
+                      backoff_factor=0, backoff_max=None,
+                      idempotency_key=None):
 
     if wrapped is None:
         return functools.partial(
             transaction_retry, session=session,
             total=total,
             backoff_factor=backoff_factor,
-            backoff_max=backoff_max)
+            backoff_max=backoff_max,
+            idempotency_key=idempotency_key)
+
+    policy = RetryPolicy(total, backoff_factor, backoff_max)
+
+    if isinstance(session, operator.attrgetter):
+        get_session = session
+    elif session:
+        def get_session(instance):
+            return session
+    else:
+        get_session = None
+
+    if idempotency_key is None:
+        make_key = None
+    elif get_session is None:
+        raise ValueError('idempotency_key requires a session to record it in')
+    elif idempotency_key is True:
+        def make_key(*args, **kwargs):
+            return idempotency.new_key()
+    else:
+        make_key = idempotency_key
+
+    def rollback(instance, exception):
+        # a recorded key must be rolled back with the failed transaction
+        if (
+            (exception.connection_invalidated or make_key is not None) and
+            get_session is not None
+        ):
+            get_session(instance).rollback()
+
+    def call(wrapped, instance, args, kwargs, number, key):
+        if key is None:
+            return wrapped(*args, **kwargs)
+
+        session = get_session(instance)
+        if number > 1 and idempotency.is_recorded(session, key):
+            # the commit of an earlier attempt succeeded after all
+            logger.info(
+                'Not retrying %s, idempotency key %s already committed',
+                wrapped.__name__, key)
+            return None
+        idempotency.record(session, key)
+        result = wrapped(*args, **kwargs)
+        session.commit()
+        return result
+
+    def attempt(wrapped, instance, args, kwargs, number, key):
+        try:
+            if tracing.active_trace() is None:
+                return call(wrapped, instance, args, kwargs, number, key)
+            with tracing.span(
+                tracing.RETRY_ATTEMPT, function=wrapped.__name__,
+                attempt=number
+            ):
+                return call(wrapped, instance, args, kwargs, number, key)
+        except exc.OperationalError as exception:
+            rollback(instance, exception)
+            raise
 
     @wrapt.decorator
     def wrapper(wrapped, instance, args, kwargs):
+        errors = 0
+        if make_key is not None:
+            key = make_key(*args, **kwargs)
+        else:
+            key = None
+            if tracing.active_trace() is None:
+                # fast path: a call that succeeds first time costs no more
+                # than calling ``wrapped`` in a try block
+                try:
+                    return wrapped(*args, **kwargs)
+                except exc.OperationalError as exception:
+                    rollback(instance, exception)
+                    errors = 1
 
-        @retry(total, backoff_factor, backoff_max, exc.OperationalError)
-        def run_or_rollback():
+        while True:
+            if errors:
+                sleep(policy.backoff(errors))
             try:
-                return wrapped(*args, **kwargs)
-            except exc.OperationalError as exception:
-                if exception.connection_invalidated:
-                    if isinstance(session, operator.attrgetter):
-                        session(instance).rollback()
-                    elif session:
-                        session.rollback()
-                raise
-
-        return run_or_rollback()
+                return attempt(
+                    wrapped, instance, args, kwargs, errors + 1, key)
+            except exc.OperationalError:
+                errors += 1
+                if errors > policy.total:
+                    raise
 
     return wrapper(wrapped)  # pylint: disable=E1120
 
 
 def retry(total, backoff_factor, backoff_max, exceptions):
 
-    total = max(total, 1)
-    backoff_factor = max(backoff_factor, 0)
-    backoff_max = float('inf') if backoff_max is None else max(0, backoff_max)
+    policy = RetryPolicy(total, backoff_factor, backoff_max)
 
     @wrapt.decorator
     def wrapper(wrapped, instance, args, kwargs):
@@ -51,15 +144,9 @@ def retry(total, backoff_factor, backoff_max, exceptions):
             except exceptions:
                 errors += 1
 
-                if errors > total:
+                if errors > policy.total:
                     raise
 
-                if errors >= 2:
-                    backoff_value = backoff_factor * (2 ** (errors - 1))
-                else:
-                    backoff_value = 0
-                backoff_value = min(backoff_value, backoff_max)
-
-                sleep(backoff_value)
+                sleep(policy.backoff(errors))
 
     return wrapper
@@ -0,0 +1,182 @@
+import logging
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import InvalidRequestError
+
+logger = logging.getLogger(__name__)
+
+OPENED_INFO_KEY = 'nameko_sqlalchemy.watchdog.opened'
+BEGAN_INFO_KEY = 'nameko_sqlalchemy.watchdog.began'
+CONNECTION_INFO_KEY = 'nameko_sqlalchemy.watchdog.connection'
+REPORTED_INFO_KEY = 'nameko_sqlalchemy.watchdog.reported'
+EXECUTING_INFO_KEY = 'nameko_sqlalchemy.watchdog.executing'
+COMMITTING_INFO_KEY = 'nameko_sqlalchemy.watchdog.committing'
+ABORTED_INFO_KEY = 'nameko_sqlalchemy.watchdog.aborted'
+
+SESSION = 'session'
+TRANSACTION = 'transaction'
+
+
+class SessionWatchdog(object):
+    """ Reports the sessions of workers that hold a connection for longer
+    than ``max_session_time`` seconds, or keep a transaction open for longer
+    than ``max_transaction_time`` seconds.
+
+    Each :meth:`check` logs a warning naming the worker's call id for every
+    session over either threshold, once per session or transaction, and
+    calls ``callback`` with the worker context, ``'session'`` or
+    ``'transaction'`` and the time elapsed, e.g. to emit a metric. With
+    ``abort`` set, transactions over ``max_transaction_time`` are also
+    aborted, unless a statement, flush or commit is in progress on them or
+    they stream results: their connection is invalidated, which closes it
+    and so ends the transaction on the database, and the session raises
+    :class:`~sqlalchemy.exc.InvalidRequestError` when next used, until it
+    is rolled back.
+    """
+
+    def __init__(
+        self, interval=5, max_session_time=None, max_transaction_time=None,
+        abort=False, callback=None
+    ):
+        self.interval = interval
+        self.max_session_time = max_session_time
+        self.max_transaction_time = max_transaction_time
+        self.abort = abort
+        self.callback = callback
+
+    def watch_engine(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        event.listen(engine, 'handle_error', self._after_error)
+        event.listen(engine, 'checkin', self._checkin)
+
+    def watch_sessions(self, Session):
+        event.listen(Session, 'after_begin', self._after_begin)
+        event.listen(
+            Session, 'after_transaction_end', self._after_transaction_end)
+        event.listen(Session, 'do_orm_execute', self._before_orm_execute)
+        event.listen(Session, 'before_flush', self._before_flush)
+        event.listen(Session, 'before_commit', self._before_commit)
+
+    def _before_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        conn.info[EXECUTING_INFO_KEY] = True
+
+    def _after_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        # results streamed from a server side cursor are fetched later,
+        # without events, the connection stays busy until the transaction
+        # ends
+        if context is None or not context.execution_options.get(
+            'stream_results', False
+        ):
+            conn.info[EXECUTING_INFO_KEY] = False
+
+    def _after_error(self, exception_context):
+        if exception_context.connection is not None:
+            exception_context.connection.info[EXECUTING_INFO_KEY] = False
+
+    def _checkin(self, dbapi_connection, connection_record):
+        if connection_record is not None:
+            connection_record.info.pop(EXECUTING_INFO_KEY, None)
+
+    def _after_begin(self, session, transaction, connection):
+        if transaction.parent is None:
+            now = time.time()
+            session.info.setdefault(OPENED_INFO_KEY, now)
+            session.info[BEGAN_INFO_KEY] = now
+            session.info[CONNECTION_INFO_KEY] = connection
+
+    def _after_transaction_end(self, session, transaction):
+        if transaction.parent is None:
+            session.info.pop(BEGAN_INFO_KEY, None)
+            connection = session.info.pop(CONNECTION_INFO_KEY, None)
+            if connection is not None and not (
+                connection.closed or connection.invalidated
+            ):
+                connection.info.pop(EXECUTING_INFO_KEY, None)
+            session.info.pop(COMMITTING_INFO_KEY, None)
+            session.info.pop(ABORTED_INFO_KEY, None)
+            session.info.get(REPORTED_INFO_KEY, set()).discard(TRANSACTION)
+
+    def _before_orm_execute(self, orm_execute_state):
+        self._raise_if_aborted(orm_execute_state.session)
+
+    def _before_flush(self, session, flush_context, instances):
+        self._raise_if_aborted(session)
+
+    def _before_commit(self, session):
+        self._raise_if_aborted(session)
+        session.info[COMMITTING_INFO_KEY] = True
+
+    def _raise_if_aborted(self, session):
+        elapsed = session.info.get(ABORTED_INFO_KEY)
+        if elapsed is not None:
+            raise InvalidRequestError(
+                'Transaction aborted by watchdog after being open for '
+                '{:.3f}s, roll the session back to use it again'.format(
+                    elapsed))
+
+    def check(self, dbs):
+        """ Checks the sessions of the workers in ``dbs``, a mapping of
+        worker contexts to their :class:`DatabaseWrapper`. Returns the
+        number of transactions aborted.
+        """
+        now = time.time()
+        aborted = 0
+        for worker_ctx, db in list(dbs.items()):
+            for session in db.open_sessions():
+                if self._check(worker_ctx, session, now):
+                    aborted += 1
+        return aborted
+
+    def _check(self, worker_ctx, session, now):
+        info = session.info
+        if BEGAN_INFO_KEY not in info:
+            # holds no connection, its age alone is harmless
+            info.pop(OPENED_INFO_KEY, None)
+            info.get(REPORTED_INFO_KEY, set()).discard(SESSION)
+            return False
+
+        if self.max_session_time is not None:
+            elapsed = now - info[OPENED_INFO_KEY]
+            if elapsed > self.max_session_time:
+                self._report(worker_ctx, session, SESSION, elapsed)
+
+        if self.max_transaction_time is not None:
+            elapsed = now - info[BEGAN_INFO_KEY]
+            if elapsed > self.max_transaction_time:
+                self._report(worker_ctx, session, TRANSACTION, elapsed)
+                if self.abort and not self._busy(session):
+                    logger.warning(
+                        'Aborting transaction of %s open for %.3fs',
+                        worker_ctx.call_id, elapsed)
+                    session.info[ABORTED_INFO_KEY] = elapsed
+                    info[CONNECTION_INFO_KEY].invalidate()
+                    return True
+        return False
+
+    def _report(self, worker_ctx, session, kind, elapsed):
+        reported = session.info.setdefault(REPORTED_INFO_KEY, set())
+        if kind in reported:
+            return
+        reported.add(kind)
+
+        logger.warning(
+            '%s has kept a %s open for %.3fs', worker_ctx.call_id, kind,
+            elapsed)
+        if self.callback is not None:
+            self.callback(worker_ctx, kind, elapsed)
+
+    def _busy(self, session):
+        info = session.info
+        if ABORTED_INFO_KEY in info or info.get(COMMITTING_INFO_KEY, False):
+            return True
+        connection = info.get(CONNECTION_INFO_KEY)
+        return session._flushing or (
+            connection is not None and
+            connection.info.get(EXECUTING_INFO_KEY, False)
+        )
@@ -0,0 +1,166 @@
+import logging
+import time
+
+from eventlet.queue import Full
+
+from nameko_sqlalchemy.batching import BatchQueue
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 10000
+DEFAULT_MAX_BATCH = 500
+DEFAULT_INTERVAL = 0.1
+
+
+class WriteBehindFull(Exception):
+    """ Raised when a write can't be queued within the ``timeout`` of the
+    write-behind queue, because the database doesn't keep up with them.
+    """
+
+
+class WriteBehind(object):
+    """ Queues writes that callers don't need to be durable before going
+    on, e.g. audit log inserts or counter updates, and executes them in
+    batches.
+
+    :meth:`run`, in a green thread of its own, collects the writes queued
+    within ``interval`` seconds of the first one, up to ``max_batch`` of
+    them, and executes them in one transaction, in the order they were
+    queued: consecutive writes of the same statement object and parameter
+    names are executed as one ``executemany``, so statements should be built
+    once and reused with different parameters. If the transaction
+    fails, the writes are executed again, each in a transaction of its own,
+    and those still failing are logged and dropped.
+
+    No more than ``max_size`` writes are queued: :meth:`write` then blocks
+    until the queue has room, or raises :class:`WriteBehindFull` after
+    ``timeout`` seconds if set. Writes still queued when the process dies
+    are lost.
+    """
+
+    def __init__(
+        self, Session, max_size=DEFAULT_MAX_SIZE, max_batch=DEFAULT_MAX_BATCH,
+        interval=DEFAULT_INTERVAL, timeout=None
+    ):
+        self.Session = Session
+        self.max_batch = max_batch
+        self.interval = interval
+        self.timeout = timeout
+        self.queue = BatchQueue(max_size)
+        self.queued = 0
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        self.batches = 0
+        self.fallbacks = 0
+        self.blocked_time = 0.0
+
+    def write(self, statement, params=None):
+        """ Queues ``statement`` to be executed with ``params``.
+        """
+        item = (statement, params or {})
+        try:
+            self.queue.put_nowait(item)
+        except Full:
+            started = time.perf_counter()
+            try:
+                self.queue.put(item, timeout=self.timeout)
+            except Full:
+                self.rejected += 1
+                raise WriteBehindFull(
+                    'Write-behind queue full for {}s'.format(self.timeout))
+            finally:
+                self.blocked_time += time.perf_counter() - started
+        self.queued += 1
+
+    def stop(self):
+        """ Ends :meth:`run` once the writes already queued are executed.
+        """
+        self.queue.stop()
+
+    def run(self):
+        while True:
+            batch = self.queue.get_batch(self.interval, self.max_batch)
+            if not batch:
+                return
+            self.execute(batch)
+
+    def execute(self, batch):
+        self.batches += 1
+        settled = self.written + self.failed
+        try:
+            self.execute_batch(batch)
+        except Exception:
+            # a session failed to roll back or close: the writes not yet
+            # written or dropped are counted as failed, and run goes on
+            logger.exception(
+                'Write-behind batch of %d writes failed', len(batch))
+            self.failed += len(batch) - (self.written + self.failed - settled)
+
+    def execute_batch(self, batch):
+        session = self.Session()
+        try:
+            for statement, params in group(batch):
+                session.execute(statement, params)
+            session.commit()
+        except Exception:
+            session.rollback()
+            self.fallbacks += 1
+            logger.warning(
+                'Write-behind batch of %d writes failed, executing them '
+                'separately', len(batch), exc_info=True)
+            self.execute_each(batch)
+        else:
+            self.written += len(batch)
+        finally:
+            session.close()
+
+    def execute_each(self, batch):
+        for statement, params in batch:
+            try:
+                self.execute_one(statement, params)
+            except Exception:
+                self.failed += 1
+                logger.exception('Dropping write-behind write %s', statement)
+            else:
+                self.written += 1
+
+    def execute_one(self, statement, params):
+        session = self.Session()
+        try:
+            session.execute(statement, params)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def as_dict(self):
+        return {
+            'queued': self.queued,
+            'written': self.written,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'pending': self.queue.qsize(),
+            'batches': self.batches,
+            'fallbacks': self.fallbacks,
+            'blocked_time': self.blocked_time,
+        }
+
+
+def group(batch):
+    """ Returns the writes of ``batch`` as ``(statement, params)`` pairs, in
+    order, the parameters of consecutive writes of the same statement and
+    parameter names gathered in a list to be executed at once.
+    """
+    groups = []
+    for statement, params in batch:
+        names = frozenset(params)
+        if groups and groups[-1][0] is statement and groups[-1][1] == names:
+            groups[-1][2].append(params)
+        else:
+            groups.append((statement, names, [params]))
+    return [
+        (statement, params_list) for statement, _, params_list in groups
+    ]
@@ -0,0 +1,42 @@
+import eventlet
+
+from nameko_sqlalchemy.batching import BatchQueue
+
+
+def test_collects_items_within_window():
+    queue = BatchQueue()
+    queue.put(1)
+
+    def put_later():
+        eventlet.sleep(0.01)
+        queue.put(2)
+        eventlet.sleep(0.1)
+        queue.put(3)
+
+    gt = eventlet.spawn(put_later)
+
+    assert queue.get_batch(0.05, 10) == [1, 2]
+    assert queue.get_batch(0.05, 10) == [3]
+    gt.wait()
+
+
+def test_max_batch():
+    queue = BatchQueue()
+    for item in range(5):
+        queue.put(item)
+
+    assert queue.get_batch(0, 2) == [0, 1]
+    assert queue.get_batch(0, 2) == [2, 3]
+    assert queue.get_batch(0, 2) == [4]
+
+
+def test_returns_items_put_before_stop():
+    queue = BatchQueue()
+    queue.put(1)
+    queue.put(2)
+    queue.stop()
+    queue.put(3)
+
+    assert queue.get_batch(0.01, 10) == [1, 2]
+    assert queue.get_batch(0.01, 10) == []
+    assert queue.get_batch(0.01, 10) == []
@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+from benchmarks import imports, load, providers, utils
+
+
+def test_providers_benchmark_runs(tmpdir, capsys):
+    output = tmpdir.join('results.json').strpath
+
+    providers.main([
+        '--iterations', '5', '--concurrency', '2', '--output', output
+    ])
+    with open(output) as results_file:
+        results = json.load(results_file)['results']
+    assert 'database.get_dependency+teardown' in results
+    assert 'transaction_retry.function' in results
+    assert results['database.lazy_session']['calls'] == 5
+    assert 'retained_bytes_per_call' in (
+        results['memory.database_worker_20_closed_sessions'])
+    capsys.readouterr()
+
+    providers.main([
+        '--iterations', '5', '--only', 'transaction_retry',
+        '--compare', output
+    ])
+    report = capsys.readouterr().out
+    assert 'transaction_retry.function' in report
+    assert 'database.lazy_session' not in report
+    assert '%)' in report
+
+
+def test_git_revision_outside_a_checkout(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+
+    assert utils.git_revision() is None
+
+
+def test_provider_scenarios_tear_workers_down(monkeypatch):
+    created = []
+    make_providers = providers.make_providers
+
+    def tracked_providers(db_uri):
+        created.append(make_providers(db_uri))
+        return created[-1]
+
+    monkeypatch.setattr(providers, 'make_providers', tracked_providers)
+    scenarios = providers.make_scenarios('sqlite://')
+    for name, scenario in scenarios.items():
+        if name.startswith('database'):
+            scenario()
+
+    _, database, database_session = created[0]
+    assert not database.dbs
+    assert not database_session.sessions
+
+
+def test_summarize():
+    summary = utils.summarize([0.001, 0.002, 0.003, 0.004], elapsed=0.5)
+
+    assert summary['calls'] == 4
+    assert summary['ops_per_sec'] == 8
+    assert summary['p50_us'] == 3000
+    assert summary['max_us'] == 4000
+
+
+def test_measure_allocations_reports_retained_memory():
+    retained = []
+
+    allocations = utils.measure_allocations(
+        lambda: retained.append(bytearray(1000)), iterations=10)
+
+    assert allocations['retained_bytes_per_call'] >= 1000
+    assert allocations['peak_bytes'] >= 10000
+
+
+@pytest.mark.parametrize('provider', ['database', 'database_session'])
+def test_load_harness_runs(provider):
+    results = load.run(
+        provider=provider, calls=20, concurrency=5, read_ratio=0.75,
+        pool_size=2, max_overflow=1)
+
+    assert results['all']['calls'] == 20
+    assert results['all']['errors'] == 0
+    assert results['read']['calls'] == 15
+    assert results['write']['calls'] == 5
+    assert results['pool_wait']['calls'] >= 20
+
+
+def test_load_harness_counts_errors(monkeypatch):
+    # every call fails when the table is never created
+    monkeypatch.setattr(
+        load.DeclBase.metadata, 'create_all', lambda engine: None)
+
+    results = load.run(calls=4, concurrency=2)
+
+    assert results['all']['errors'] == 4
+
+
+def test_imports_benchmark_runs(tmpdir, capsys):
+    output = tmpdir.join('results.json').strpath
+
+    imports.main(['--repeat', '1', '--only', 'constants', '--output', output])
+
+    with open(output) as results_file:
+        results = json.load(results_file)['results']
+    assert list(results) == ['constants']
+    assert results['constants']['calls'] == 1
+    assert 'constants' in capsys.readouterr().out
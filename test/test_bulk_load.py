@@ -0,0 +1,354 @@
+import datetime
+import enum
+import glob
+import os
+import tempfile
+
+import pytest
+from mock import Mock
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    Column,
+    DateTime,
+    Enum,
+    Integer,
+    LargeBinary,
+    MetaData,
+    PickleType,
+    String,
+    Table,
+    create_engine,
+    event,
+    select,
+)
+from sqlalchemy.dialects import mysql, postgresql
+
+from nameko_sqlalchemy.bulk_load import BulkLoadError, RowStream, bulk_load, text_value
+
+metadata = MetaData()
+
+example = Table(
+    'example', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100)),
+    Column('active', Boolean),
+    Column('created', DateTime),
+)
+
+document = Table(
+    'document', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('doc_body', JSON, key='body'),
+    Column('digest', LargeBinary),
+)
+
+
+
+class Color(enum.Enum):
+    red = 1
+    green = 2
+
+
+colored = Table(
+    'colored', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('color', Enum(Color)),
+)
+
+pickled = Table(
+    'pickled', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('value', PickleType),
+)
+
+
+@pytest.fixture
+def connection():
+    engine = create_engine('sqlite://')
+    metadata.create_all(engine)
+    with engine.connect() as connection:
+        yield connection
+    engine.dispose()
+
+
+def fake_connection(dialect):
+    connection = Mock()
+    connection.dialect = dialect
+    connection.get_execution_options.return_value = {}
+    return connection
+
+
+def fake_mysql_connection(warnings=(), rowcount=None):
+    """ A MySQL connection recording the statements and files loaded.
+    """
+    connection = fake_connection(mysql.pymysql.dialect())
+    cursor = connection.connection.cursor.return_value
+    cursor.fetchall.return_value = list(warnings)
+    connection.loaded = []
+
+    def execute(sql, parameters=None):
+        if parameters is None:
+            connection.loaded.append((sql, None))
+            return
+        path, = parameters
+        with open(path, 'rb') as data:
+            loaded = data.read()
+        connection.loaded.append((sql, loaded))
+        cursor.rowcount = (
+            loaded.count(b'\n') if rowcount is None else rowcount)
+
+    cursor.execute.side_effect = execute
+    return connection
+
+
+def copied_data(connection, table, rows, **kwargs):
+    """ Returns the statement and data of a COPY of ``rows``.
+    """
+    cursor = connection.connection.cursor.return_value
+    copied = []
+
+    def copy_expert(sql, stream, size):
+        copied.append(sql)
+        while True:
+            chunk = stream.read(size)
+            if not chunk:
+                break
+            copied.append(chunk)
+
+    cursor.copy_expert.side_effect = copy_expert
+    loaded = bulk_load(connection, table, rows, **kwargs)
+    return loaded, copied
+
+
+@pytest.fixture
+def executemanys(connection):
+    executemanys = []
+
+    @event.listens_for(connection, 'before_cursor_execute')
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            executemanys.append(len(parameters))
+
+    return executemanys
+
+
+def test_inserts_in_batches(connection, executemanys):
+    rows = ((n, 'name {}'.format(n), n % 2 == 0, None) for n in range(25))
+
+    assert bulk_load(connection, example, rows, batch_size=10) == 25
+
+    assert executemanys == [10, 10, 5]
+    assert connection.execute(
+        select(example.c.name).where(example.c.id == 24)
+    ).scalar() == 'name 24'
+
+
+def test_inserts_mappings_and_column_subset(connection):
+    rows = [{'id': 1, 'name': 'spam'}, {'id': 2, 'name': 'ham'}]
+
+    assert bulk_load(connection, example, rows, columns=['id', 'name']) == 2
+
+    assert connection.execute(
+        select(example.c.name).order_by(example.c.id)
+    ).scalars().all() == ['spam', 'ham']
+
+
+def test_reads_mappings_by_column_key(connection):
+    rows = [{'id': 1, 'body': {'spam': 1}, 'digest': b'\x00ab'}]
+
+    assert bulk_load(connection, document, rows) == 1
+    assert bulk_load(connection, document, [(2, None)], columns=['id', 'body'])
+
+    assert connection.execute(
+        select(document.c.body, document.c.digest).order_by(document.c.id)
+    ).all() == [({'spam': 1}, b'\x00ab'), (None, None)]
+
+
+def test_inserts_nothing(connection, executemanys):
+    assert bulk_load(connection, example, []) == 0
+    assert executemanys == []
+
+
+def test_accepts_mapped_class(connection):
+    class Mapped(object):
+        __table__ = example
+
+    assert bulk_load(connection, Mapped, [(1, 'spam', True, None)]) == 1
+
+
+@pytest.mark.parametrize('value,expected', [
+    (None, '\\N'),
+    (True, 't'),
+    (False, 'f'),
+    (0, '0'),
+    (1.5, '1.5'),
+    ('tab\tnew\nline\rback\\slash', 'tab\\tnew\\nline\\rback\\\\slash'),
+    (datetime.datetime(2024, 1, 2, 3, 4, 5), '2024-01-02 03:04:05'),
+])
+def test_text_value(value, expected):
+    assert text_value(value) == expected
+
+
+@pytest.mark.parametrize('value', [b'ab', bytearray(b'ab'), {'a': 1}, [1]])
+def test_text_value_rejects_values_without_text(value):
+    with pytest.raises(TypeError):
+        text_value(value)
+
+
+def test_row_stream_reads_rows_lazily():
+    consumed = []
+
+    def rows():
+        for n in range(100):
+            consumed.append(n)
+            yield (n, 'é')
+
+    stream = RowStream(rows(), ['id', 'name'])
+
+    assert stream.read(8) == b'0\t\xc3\xa9\n1\t\xc3'
+    assert len(consumed) == 2
+
+    rest = stream.read()
+    assert rest.startswith(b'\xa9\n2\t')
+    assert len(consumed) == 100
+    assert stream.rows == 100
+    assert stream.read(8) == b''
+
+
+def test_copies_from_stdin_on_postgresql():
+    connection = fake_connection(postgresql.psycopg2.dialect())
+
+    rows = [
+        (1, 'spam', True, None),
+        {'id': 2, 'name': 'ham', 'active': False, 'created': None},
+    ]
+    loaded, copied = copied_data(connection, example, rows)
+
+    assert loaded == 2
+    assert copied == [
+        'COPY example (id, name, active, created) FROM STDIN',
+        b'1\tspam\tt\t\\N\n2\tham\tf\t\\N\n',
+    ]
+    assert connection.connection.cursor.return_value.close.called
+
+
+def test_copy_encodes_json_and_binary_columns():
+    connection = fake_connection(postgresql.psycopg2.dialect())
+
+    rows = [
+        {'id': 1, 'body': {'text': 'tab\there'}, 'digest': b'\x00ab'},
+        (2, None, None),
+    ]
+    loaded, copied = copied_data(connection, document, rows)
+
+    assert loaded == 2
+    # bytea hex input and JSON, both escaped for COPY
+    assert copied == [
+        'COPY document (id, doc_body, digest) FROM STDIN',
+        b'1\t{"text": "tab\\\\there"}\t\\\\x006162\n2\t\\N\t\\N\n',
+    ]
+
+
+def test_loads_types_without_text_with_executemany():
+    connection = fake_connection(postgresql.psycopg2.dialect())
+
+    assert bulk_load(connection, pickled, [(1, {'spam': 1})]) == 1
+
+    assert not connection.connection.cursor.called
+    statement, params = connection.execute.call_args[0]
+    assert params == [{'id': 1, 'value': {'spam': 1}}]
+
+
+def test_copy_translates_schema():
+    connection = fake_connection(postgresql.psycopg2.dialect())
+    connection.get_execution_options.return_value = {
+        'schema_translate_map': {None: 'tenant'}}
+
+    bulk_load(connection, example, [], columns=['id'])
+
+    sql = connection.connection.cursor.return_value.copy_expert.call_args[0][0]
+    assert sql == 'COPY tenant.example (id) FROM STDIN'
+
+
+def test_loads_data_infile_on_mysql():
+    connection = fake_mysql_connection()
+
+    rows = [(1, 'spam', True, None), (2, 'ham', False, None)]
+    assert bulk_load(connection, example, rows) == 2
+
+    [(sql, data), warnings] = connection.loaded
+    assert sql == (
+        'LOAD DATA LOCAL INFILE %s INTO TABLE example CHARACTER SET utf8mb4 '
+        '(id, name, active, created)')
+    assert data == b'1\tspam\t1\t\\N\n2\tham\t0\t\\N\n'
+    assert warnings == ('SHOW WARNINGS', None)
+    path, = connection.connection.cursor.return_value.execute.call_args_list[
+        0][0][1]
+    assert not os.path.exists(path)
+
+
+def test_load_data_decodes_binary_columns():
+    connection = fake_mysql_connection()
+
+    rows = [(1, {'spam': 1}, b'\x00ab'), (2, None, None)]
+    assert bulk_load(connection, document, rows) == 2
+
+    [(sql, data), _] = connection.loaded
+    assert sql == (
+        'LOAD DATA LOCAL INFILE %s INTO TABLE document CHARACTER SET utf8mb4 '
+        '(id, doc_body, @column_2) SET digest = UNHEX(@column_2)')
+    assert data == b'1\t{"spam": 1}\t006162\n2\t\\N\t\\N\n'
+
+
+def test_load_data_raises_for_warnings():
+    connection = fake_mysql_connection(warnings=[
+        ('Warning', 1366, "Incorrect integer value: 'spam' for column 'id'"),
+    ])
+
+    with pytest.raises(BulkLoadError) as exc_info:
+        bulk_load(connection, example, [('spam', 'ham', True, None)])
+
+    assert str(exc_info.value) == (
+        "LOAD DATA loaded 1 of 1 rows: Warning 1366: Incorrect integer "
+        "value: 'spam' for column 'id'")
+
+
+def test_load_data_raises_for_skipped_rows():
+    connection = fake_mysql_connection(rowcount=1)
+
+    with pytest.raises(BulkLoadError) as exc_info:
+        bulk_load(connection, example, [
+            (1, 'spam', True, None), (1, 'ham', True, None)])
+
+    assert str(exc_info.value) == 'LOAD DATA loaded 1 of 2 rows: no warnings'
+
+
+def test_encodes_enum_members_as_stored():
+    connection = fake_connection(postgresql.psycopg2.dialect())
+
+    rows = [(1, Color.red), (2, 'green'), (3, None)]
+    loaded, copied = copied_data(connection, colored, rows)
+
+    assert loaded == 3
+    assert copied[1] == b'1\tred\n2\tgreen\n3\t\\N\n'
+
+
+def test_enum_members_match_executemany(connection):
+    assert bulk_load(connection, colored, [(1, Color.red)]) == 1
+
+    assert connection.exec_driver_sql(
+        'SELECT color FROM colored').scalar() == 'red'
+
+
+def test_load_data_removes_file_when_rows_fail():
+    connection = fake_mysql_connection()
+    pattern = os.path.join(tempfile.gettempdir(), 'tmp*.tsv')
+    existing = set(glob.glob(pattern))
+
+    with pytest.raises(TypeError):
+        bulk_load(connection, example, [
+            (1, 'spam', True, None), (2, b'x', True, None)])
+
+    assert set(glob.glob(pattern)) == existing
+    assert not connection.loaded
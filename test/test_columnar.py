@@ -0,0 +1,187 @@
+import sys
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    Numeric,
+    String,
+    Table,
+    create_engine,
+    event,
+    select,
+    text,
+)
+
+from nameko_sqlalchemy import columnar
+
+metadata = MetaData()
+
+example = Table(
+    'example', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100)),
+)
+
+amounts = Table(
+    'amounts', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('amount', Numeric(asdecimal=True)),
+)
+
+
+@pytest.fixture
+def connection():
+    engine = create_engine('sqlite://')
+    metadata.create_all(engine)
+    with engine.connect() as connection:
+        connection.execute(example.insert(), [
+            {'id': n, 'name': 'name {}'.format(n) if n > 2 else None}
+            for n in range(5)
+        ])
+        yield connection
+    engine.dispose()
+
+
+@pytest.fixture
+def fetches(connection):
+    fetches = []
+
+    @event.listens_for(connection, 'before_cursor_execute')
+    def record(conn, cursor, statement, parameters, context, executemany):
+        fetches.append(context.execution_options.get('stream_results'))
+
+    return fetches
+
+
+def test_fetch_columns(connection, fetches):
+    columns = columnar.fetch_columns(
+        connection, select(example).order_by(example.c.id), chunk_size=2)
+
+    assert columns == {
+        'id': [0, 1, 2, 3, 4],
+        'name': [None, None, None, 'name 3', 'name 4'],
+    }
+    assert fetches == [True]
+
+
+def test_fetch_columns_textual_sql_with_params(connection):
+    columns = columnar.fetch_columns(
+        connection, text('SELECT id FROM example WHERE id > :id'), {'id': 3})
+
+    assert columns == {'id': [4]}
+
+
+def test_fetch_columns_without_rows(connection):
+    columns = columnar.fetch_columns(
+        connection, select(example).where(example.c.id < 0))
+
+    assert columns == {'id': [], 'name': []}
+
+
+def test_fetch_chunks(connection):
+    chunks = columnar.fetch_chunks(
+        connection, select(example.c.id).order_by(example.c.id),
+        chunk_size=2)
+
+    assert list(chunks) == [['id'], [(0, 1)], [(2, 3)], [(4,)]]
+
+
+def test_fetch_record_batches(connection):
+    pyarrow = pytest.importorskip('pyarrow')
+
+    batches = list(columnar.fetch_record_batches(
+        connection, select(example).order_by(example.c.id), chunk_size=2))
+
+    assert [batch.num_rows for batch in batches] == [2, 2, 1]
+    assert batches[0].schema.names == ['id', 'name']
+    assert batches[0].column(1).type == pyarrow.null()
+    assert batches[2].column(1).to_pylist() == ['name 4']
+
+
+def test_fetch_arrow(connection):
+    pyarrow = pytest.importorskip('pyarrow')
+
+    table = columnar.fetch_arrow(
+        connection, select(example).order_by(example.c.id), chunk_size=2)
+
+    assert table.num_rows == 5
+    assert table.column('id').num_chunks == 3
+    assert table.schema.field('name').type == pyarrow.string()
+    assert table.to_pydict() == {
+        'id': [0, 1, 2, 3, 4],
+        'name': [None, None, None, 'name 3', 'name 4'],
+    }
+
+
+def test_fetch_arrow_unifies_chunk_types(connection):
+    pyarrow = pytest.importorskip('pyarrow')
+    connection.execute(amounts.insert(), [
+        {'id': 0, 'amount': None},
+        {'id': 1, 'amount': Decimal('1.5')},
+        {'id': 2, 'amount': None},
+        {'id': 3, 'amount': Decimal('123.45')},
+    ])
+
+    table = columnar.fetch_arrow(
+        connection, select(amounts).order_by(amounts.c.id), chunk_size=1)
+
+    assert pyarrow.types.is_decimal(table.schema.field('amount').type)
+    assert table.column('amount').to_pylist() == [
+        None, Decimal('1.5'), None, Decimal('123.45')]
+
+
+def test_chunked_array_of_mixed_scale_decimals():
+    pyarrow = pytest.importorskip('pyarrow')
+    arrays = [
+        pyarrow.array([None]),
+        pyarrow.array([Decimal('1.5')]),
+        pyarrow.array([Decimal('123.45')]),
+    ]
+
+    array = columnar.chunked_array(pyarrow, arrays)
+
+    assert array.type == pyarrow.decimal128(5, 2)
+    assert array.to_pylist() == [None, Decimal('1.5'), Decimal('123.45')]
+
+
+def test_chunked_array_of_nulls():
+    pyarrow = pytest.importorskip('pyarrow')
+
+    array = columnar.chunked_array(
+        pyarrow, [pyarrow.array([None]), pyarrow.array([None])])
+
+    assert array.type == pyarrow.null()
+    assert array.to_pylist() == [None, None]
+
+
+def test_fetch_arrow_incompatible_chunk_types(connection):
+    pyarrow = pytest.importorskip('pyarrow')
+    connection.execute(text(
+        "INSERT INTO amounts (id, amount) VALUES (0, 1), (1, 'one')"))
+
+    with pytest.raises(pyarrow.ArrowTypeError):
+        columnar.fetch_arrow(
+            connection, text('SELECT amount FROM amounts ORDER BY id'),
+            chunk_size=1)
+
+
+def test_fetch_arrow_without_rows(connection):
+    pytest.importorskip('pyarrow')
+
+    table = columnar.fetch_arrow(
+        connection, select(example).where(example.c.id < 0))
+
+    assert table.num_rows == 0
+    assert table.schema.names == ['id', 'name']
+
+
+def test_fetch_arrow_without_pyarrow(connection, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+
+    with pytest.raises(ImportError):
+        columnar.fetch_arrow(connection, select(example))
+    with pytest.raises(ImportError):
+        next(columnar.fetch_record_batches(connection, select(example)))
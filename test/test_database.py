@@ -1,14 +1,36 @@
+import functools
 from weakref import WeakKeyDictionary
 
+import eventlet
 import pytest
-from mock import Mock, patch
+from mock import Mock, call, patch
 from nameko.containers import ServiceContainer, WorkerContext
 from nameko.testing.services import dummy, entrypoint_hook
-from sqlalchemy import Column, String, create_engine
+from sqlalchemy import (
+    Column,
+    String,
+    bindparam,
+    create_engine,
+    event,
+    func,
+    select,
+    text,
+)
 from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-
-from nameko_sqlalchemy.database import DB_URIS_KEY, Database, Session
+from sqlalchemy.pool import NullPool, QueuePool
+
+from nameko_sqlalchemy.database import (
+    DB_URIS_KEY,
+    Database,
+    DatabaseWrapper,
+    SchemaNotFound,
+    Session,
+)
+from nameko_sqlalchemy.eager_loading import LOADING_INFO_KEY
+from nameko_sqlalchemy.read_only import ReadOnlyError
+from nameko_sqlalchemy.sharding import ShardNotFound
 
 DeclBase = declarative_base(name='examplebase')
 
@@ -81,6 +103,29 @@ def test_session_options_setup(config, container):
     assert dependency_provider.Session.kw['expire_on_commit'] is False
 
 
+def test_compiled_cache_setup(config, container):
+    dependency_provider = Database(
+        DeclBase, compiled_cache_size=42).bind(container, 'database')
+
+    dependency_provider.setup()
+
+    assert dependency_provider.compiled_cache.capacity == 42
+    assert dependency_provider.engine._compiled_cache.capacity == 42
+
+
+def test_compiled_cache_stats(dependency_provider):
+    dependency_provider.setup()
+    worker_ctx = Mock(spec=WorkerContext)
+    db = dependency_provider.get_dependency(worker_ctx)
+
+    for _ in range(3):
+        db.session.execute(select(1))
+    dependency_provider.worker_teardown(worker_ctx)
+
+    assert dependency_provider.compiled_cache.misses == 1
+    assert dependency_provider.compiled_cache.hits == 2
+
+
 def test_stop(dependency_provider):
     dependency_provider.setup()
     assert dependency_provider.engine
@@ -97,6 +142,91 @@ def test_kill(dependency_provider):
     assert not hasattr(dependency_provider, 'engine')
 
 
+class TestPoolMaintenance:
+
+    @pytest.fixture
+    def config(self, tmpdir):
+        return {
+            DB_URIS_KEY: {
+                'exampleservice:examplebase': 'sqlite:///{}'.format(
+                    tmpdir.join('db').strpath)
+            }
+        }
+
+    @pytest.fixture
+    def container(self, container):
+        container.spawn_managed_thread.side_effect = (
+            lambda fn: eventlet.spawn(fn))
+        return container
+
+    @pytest.fixture
+    def dependency_provider(self, container):
+        return Database(
+            DeclBase,
+            engine_options={'poolclass': QueuePool, 'pool_size': 5},
+            pool_maintenance={'interval': 0.01, 'min_idle': 1},
+        ).bind(container, 'database')
+
+    def fill_pool(self, engine, count):
+        connections = [engine.connect() for _ in range(count)]
+        for connection in connections:
+            connection.close()
+
+    def test_not_started_by_default(self, container):
+        dependency_provider = Database(DeclBase).bind(container, 'database')
+        dependency_provider.setup()
+        dependency_provider.start()
+
+        assert not container.spawn_managed_thread.called
+        assert dependency_provider.maintenance is None
+
+    def test_trims_idle_connections(self, dependency_provider):
+        dependency_provider.setup()
+        dependency_provider.start()
+        engine = dependency_provider.engine
+        self.fill_pool(engine, 4)
+        assert engine.pool.checkedin() == 4
+
+        eventlet.sleep(0.05)
+        assert engine.pool.checkedin() == 1
+
+        dependency_provider.stop()
+        assert dependency_provider.maintenance_gt.dead
+
+    def test_logs_errors(self, dependency_provider):
+        dependency_provider.setup()
+        dependency_provider.start()
+
+        with patch.object(
+            dependency_provider.maintenance, 'run_once',
+            side_effect=Exception('boom')
+        ):
+            with patch('nameko_sqlalchemy.database.logger') as logger:
+                eventlet.sleep(0.05)
+
+        assert logger.exception.called
+        assert not dependency_provider.maintenance_gt.dead
+        dependency_provider.stop()
+
+    def test_kill(self, dependency_provider):
+        dependency_provider.setup()
+        dependency_provider.start()
+
+        dependency_provider.kill()
+        assert dependency_provider.maintenance_gt.dead
+        assert not hasattr(dependency_provider, 'engine')
+
+    def test_requires_queue_pool(self, container):
+        dependency_provider = Database(
+            DeclBase, engine_options={'poolclass': NullPool},
+            pool_maintenance={},
+        ).bind(container, 'database')
+        dependency_provider.setup()
+
+        with pytest.raises(TypeError):
+            dependency_provider.start()
+
+
 class TestWorkerScopeSessionUnit:
 
     def test_get_dependency(self, dependency_provider):
@@ -130,9 +260,13 @@ class TestWorkerScopeSessionUnit:
             worker_ctx_2: db_2
         })
 
-    def test_weakref(self, dependency_provider):
+        dependency_provider.worker_teardown(worker_ctx_1)
+        dependency_provider.worker_teardown(worker_ctx_2)
+        assert dependency_provider.dbs == {}
 
+    def test_weakref(self, dependency_provider):
         dependency_provider.setup()
+
         worker_ctx = Mock(spec=WorkerContext)
 
         db = dependency_provider.get_dependency(worker_ctx)
@@ -142,6 +276,12 @@ class TestWorkerScopeSessionUnit:
         del worker_ctx
         assert dependency_provider.dbs == WeakKeyDictionary({})
 
+    def test_wrapper_has_no_instance_dict(self, dependency_provider):
+        dependency_provider.setup()
+
+        db = dependency_provider.get_dependency(Mock(spec=WorkerContext))
+        assert not hasattr(db, '__dict__')
+
     def test_worker_teardown(self, dependency_provider):
         dependency_provider.setup()
 
@@ -157,6 +297,1001 @@ class TestWorkerScopeSessionUnit:
         assert not db.session.new  # session.close() rolls back new objects
 
 
+class TestStatementsUnit:
+
+    @pytest.fixture
+    def dependency_provider(self, container):
+        return Database(DeclBase, statements={
+            'value_by_key': select(ExampleModel.value).where(
+                ExampleModel.key == bindparam('key')),
+            'count': lambda: select(func.count(ExampleModel.key)),
+        }).bind(container, 'database')
+
+    def test_execute_statement(self, dependency_provider):
+        dependency_provider.setup()
+        ExampleModel.metadata.create_all(dependency_provider.engine)
+        worker_ctx = Mock(spec=WorkerContext)
+        db = dependency_provider.get_dependency(worker_ctx)
+
+        db.session.add(ExampleModel(key='spam', value='ham'))
+        db.session.flush()
+
+        # runs in the worker session's transaction, without recompiling
+        assert db.execute_statement(
+            'value_by_key', {'key': 'spam'}).scalar() == 'ham'
+        assert db.execute_statement('count').scalar() == 1
+        assert dependency_provider.compiled_cache.hits == 0
+
+        dependency_provider.worker_teardown(worker_ctx)
+
+    def test_unknown_statement(self, dependency_provider):
+        dependency_provider.setup()
+        db = dependency_provider.get_dependency(Mock(spec=WorkerContext))
+
+        with pytest.raises(KeyError):
+            db.execute_statement('unknown')
+
+
+class TestSessionWatchdog:
+
+    @pytest.fixture
+    def config(self, tmpdir):
+        return {
+            DB_URIS_KEY: {
+                'exampleservice:examplebase': 'sqlite:///{}'.format(
+                    tmpdir.join('db').strpath)
+            }
+        }
+
+    @pytest.fixture
+    def container(self, container):
+        container.spawn_managed_thread.side_effect = (
+            lambda fn: eventlet.spawn(fn))
+        return container
+
+    @pytest.fixture
+    def callback(self):
+        return Mock()
+
+    @pytest.fixture
+    def dependency_provider(self, container, callback):
+        return Database(
+            DeclBase,
+            engine_options={'poolclass': QueuePool},
+            session_watchdog={
+                'interval': 0.01,
+                'max_transaction_time': 0.02,
+                'abort': True,
+                'callback': callback,
+            },
+        ).bind(container, 'database')
+
+    def test_not_started_by_default(self, container):
+        dependency_provider = Database(DeclBase).bind(container, 'database')
+        dependency_provider.setup()
+        dependency_provider.start()
+
+        assert not container.spawn_managed_thread.called
+        assert dependency_provider.watchdog is None
+
+    def test_aborts_idle_transactions(
+        self, dependency_provider, callback
+    ):
+        dependency_provider.setup()
+        dependency_provider.start()
+        worker_ctx = Mock(spec=WorkerContext, call_id='service.method.0')
+        db = dependency_provider.get_dependency(worker_ctx)
+
+        db.session.execute(text('SELECT 1'))
+        assert dependency_provider.engine.pool.checkedout() == 1
+
+        eventlet.sleep(0.1)
+
+        assert callback.call_count == 1
+        assert callback.call_args[0][:2] == (worker_ctx, 'transaction')
+        assert dependency_provider.engine.pool.checkedout() == 0
+
+        dependency_provider.worker_teardown(worker_ctx)
+        dependency_provider.stop()
+        assert dependency_provider.watchdog_gt.dead
+
+    def test_kill(self, dependency_provider):
+        dependency_provider.setup()
+        dependency_provider.start()
+
+        dependency_provider.kill()
+
+        assert dependency_provider.watchdog_gt.dead
+
+
+class TestFailover:
+
+    @pytest.fixture
+    def config(self, tmpdir):
+        return {
+            DB_URIS_KEY: {
+                'exampleservice:examplebase': 'sqlite:///{}'.format(
+                    tmpdir.join('primary').strpath)
+            }
+        }
+
+    @staticmethod
+    def missing_table(exception, dbapi_connection):
+        return 'no such table' in str(exception)
+
+    def fail_over(self, dependency_provider):
+        worker_ctx = Mock(spec=WorkerContext)
+        db = dependency_provider.get_dependency(worker_ctx)
+        with pytest.raises(OperationalError) as exc_info:
+            db.session.execute(text('SELECT * FROM missing'))
+        dependency_provider.worker_teardown(worker_ctx)
+        return exc_info.value
+
+    def test_disposes_of_pool(self, container):
+        dependency_provider = Database(
+            DeclBase, failover={'is_failover': self.missing_table}
+        ).bind(container, 'database')
+        dependency_provider.setup()
+        engine = dependency_provider.engine
+        pool = engine.pool
+
+        error = self.fail_over(dependency_provider)
+
+        assert error.connection_invalidated
+        assert dependency_provider.engine is engine
+        assert engine.pool is not pool
+        assert dependency_provider.failover_detector.failovers == 1
+
+    def test_reloads_uri(self, container, tmpdir):
+        new_uri = 'sqlite:///{}'.format(tmpdir.join('standby').strpath)
+        dependency_provider = Database(DeclBase, failover={
+            'is_failover': self.missing_table, 'reload_uri': lambda: new_uri,
+        }).bind(container, 'database')
+        dependency_provider.setup()
+        engine = dependency_provider.engine
+        Session = dependency_provider.Session
+
+        self.fail_over(dependency_provider)
+
+        assert dependency_provider.db_uri == new_uri
+        assert str(dependency_provider.engine.url) == new_uri
+        assert dependency_provider.Session is not Session
+
+        worker_ctx = Mock(spec=WorkerContext)
+        db = dependency_provider.get_dependency(worker_ctx)
+        assert db.session.get_bind() is dependency_provider.engine
+        assert engine is not dependency_provider.engine
+        dependency_provider.worker_teardown(worker_ctx)
+
+    def test_formats_reloaded_uri(self, container, tmpdir):
+        dependency_provider = Database(DeclBase, failover={
+            'is_failover': self.missing_table,
+            'reload_uri': lambda: 'sqlite:///{}'.format(
+                tmpdir.join('{0[service_name]}').strpath),
+        }).bind(container, 'database')
+        dependency_provider.setup()
+
+        self.fail_over(dependency_provider)
+
+        assert dependency_provider.db_uri == 'sqlite:///{}'.format(
+            tmpdir.join('exampleservice').strpath)
+
+    @pytest.mark.parametrize('reloaded', [None, 'same'])
+    def test_keeps_engine_if_uri_unchanged(self, config, container, reloaded):
+        uri = config[DB_URIS_KEY]['exampleservice:examplebase']
+        dependency_provider = Database(DeclBase, failover={
+            'is_failover': self.missing_table,
+            'reload_uri': lambda: uri if reloaded else None,
+        }).bind(container, 'database')
+        dependency_provider.setup()
+        engine = dependency_provider.engine
+
+        self.fail_over(dependency_provider)
+
+        assert dependency_provider.engine is engine
+        assert dependency_provider.retired_engines == {}
+
+    def test_disposes_of_retired_engine_once_drained(self, container, tmpdir):
+        new_uri = 'sqlite:///{}'.format(tmpdir.join('standby').strpath)
+        dependency_provider = Database(
+            DeclBase, engine_options={'poolclass': QueuePool},
+            failover={
+                'is_failover': self.missing_table,
+                'reload_uri': lambda: new_uri,
+            },
+        ).bind(container, 'database')
+        dependency_provider.setup()
+        engine = dependency_provider.engine
+
+        # a worker started before the failover keeps using the old engine
+        worker_ctx = Mock(spec=WorkerContext)
+        db = dependency_provider.get_dependency(worker_ctx)
+        self.fail_over(dependency_provider)
+
+        assert list(dependency_provider.retired_engines) == [engine]
+        db.session.execute(text('SELECT 1'))
+        db.session.commit()
+        assert engine.pool.checkedin() == 1
+
+        dependency_provider.worker_teardown(worker_ctx)
+
+        assert dependency_provider.retired_engines == {}
+        assert engine.pool.checkedin() == 0
+
+    def test_disposes_of_retired_engines_at_stop(self, container, tmpdir):
+        new_uri = 'sqlite:///{}'.format(tmpdir.join('standby').strpath)
+        dependency_provider = Database(
+            DeclBase, engine_options={'poolclass': QueuePool},
+            failover={
+                'is_failover': self.missing_table,
+                'reload_uri': lambda: new_uri,
+            },
+        ).bind(container, 'database')
+        dependency_provider.setup()
+        engine = dependency_provider.engine
+
+        worker_ctx = Mock(spec=WorkerContext)
+        db = dependency_provider.get_dependency(worker_ctx)
+        self.fail_over(dependency_provider)
+        db.session.execute(text('SELECT 1'))
+        db.session.commit()
+
+        # the worker's teardown was skipped
+        dependency_provider.stop()
+
+        assert dependency_provider.retired_engines == {}
+        assert engine.pool.checkedin() == 0
+
+    def test_updates_pool_maintenance(self, container):
+        container.spawn_managed_thread.side_effect = (
+            lambda fn: eventlet.spawn(fn))
+        dependency_provider = Database(
+            DeclBase,
+            engine_options={'poolclass': QueuePool},
+            pool_maintenance={'interval': 60},
+            failover={'is_failover': self.missing_table},
+        ).bind(container, 'database')
+        dependency_provider.setup()
+        dependency_provider.start()
+
+        self.fail_over(dependency_provider)
+
+        assert (
+            dependency_provider.maintenance.pool is
+            dependency_provider.engine.pool)
+        dependency_provider.stop()
+
+
+class TestGroupCommit:
+
+    @pytest.fixture
+    def config(self, tmpdir):
+        return {
+            DB_URIS_KEY: {
+                'exampleservice:examplebase': 'sqlite:///{}'.format(
+                    tmpdir.join('db').strpath)
+            }
+        }
+
+    @pytest.fixture
+    def container(self, container):
+        container.spawn_managed_thread.side_effect = (
+            lambda fn: eventlet.spawn(fn))
+        return container
+
+    @pytest.fixture
+    def dependency_provider(self, container):
+        dependency_provider = Database(
+            DeclBase, group_commit={'window': 0.01}
+        ).bind(container, 'database')
+        dependency_provider.setup()
+        ExampleModel.metadata.create_all(dependency_provider.engine)
+        return dependency_provider
+
+    def write(self, dependency_provider, key):
+        worker_ctx = Mock(spec=WorkerContext)
+        db = dependency_provider.get_dependency(worker_ctx)
+
+        def unit(session):
+            session.add(ExampleModel(key=key, value='value'))
+            return key
+
+        try:
+            return db.group_commit(unit)
+        finally:
+            dependency_provider.worker_teardown(worker_ctx)
+
+    def test_batches_worker_commits(self, dependency_provider):
+        dependency_provider.start()
+        pool = eventlet.GreenPool()
+
+        keys = list(pool.imap(
+            functools.partial(self.write, dependency_provider), 'abc'))
+
+        assert keys == ['a', 'b', 'c']
+        assert dependency_provider.committer.batches == 1
+        session = dependency_provider.Session()
+        assert session.query(ExampleModel).count() == 3
+
+        dependency_provider.stop()
+        assert dependency_provider.committer_gt.dead
+
+    def test_not_batched_by_default(self, container):
+        dependency_provider = Database(DeclBase).bind(container, 'database')
+        dependency_provider.setup()
+        ExampleModel.metadata.create_all(dependency_provider.engine)
+        dependency_provider.start()
+
+        assert self.write(dependency_provider, 'a') == 'a'
+        assert dependency_provider.committer is None
+        assert not container.spawn_managed_thread.called
+
+    def test_kill(self, dependency_provider):
+        dependency_provider.start()
+
+        dependency_provider.kill()
+
+        assert dependency_provider.committer_gt.dead
+
+    def test_schema_key_unsupported(self, container):
+        dependency_provider = Database(
+            DeclBase, schema_key='tenant', schemas={'acme'}, group_commit={}
+        ).bind(container, 'database')
+        with pytest.raises(ValueError):
+            dependency_provider.setup()
+
+
+class TestPinnedConnection:
+
+    @pytest.fixture
+    def config(self, tmpdir):
+        return {
+            DB_URIS_KEY: {
+                'exampleservice:examplebase': 'sqlite:///{}'.format(
+                    tmpdir.join('db').strpath)
+            }
+        }
+
+    @pytest.fixture
+    def dependency_provider(self, container):
+        dependency_provider = Database(
+            DeclBase, pin_connection=True,
+            engine_options={'poolclass': QueuePool},
+        ).bind(container, 'database')
+        dependency_provider.setup()
+        engine = dependency_provider.engine
+
+        # let pysqlite begin transactions when asked to, and readers
+        # not block writers of other connections
+        @event.listens_for(engine, 'connect')
+        def disable_pysqlite_transactions(dbapi_connection, record):
+            dbapi_connection.isolation_level = None
+            dbapi_connection.execute('PRAGMA journal_mode=WAL')
+
+        @event.listens_for(engine, 'begin')
+        def begin(connection):
+            connection.exec_driver_sql('BEGIN')
+
+        ExampleModel.metadata.create_all(engine)
+        return dependency_provider
+
+    @pytest.fixture
+    def checkouts(self, dependency_provider):
+        checkouts = []
+        event.listen(
+            dependency_provider.engine, 'checkout',
+            lambda *args: checkouts.append(args))
+        return checkouts
+
+    def stored_keys(self, dependency_provider):
+        session = dependency_provider.Session()
+        try:
+            return sorted(key for key, in session.query(ExampleModel.key))
+        finally:
+            session.close()
+
+    @pytest.fixture
+    def worker_ctx(self):
+        return Mock(spec=WorkerContext)
+
+    @pytest.fixture
+    def db(self, dependency_provider, worker_ctx):
+        return dependency_provider.get_dependency(worker_ctx)
+
+    def test_sessions_share_connection(
+        self, dependency_provider, worker_ctx, db, checkouts
+    ):
+        db.session.add(ExampleModel(key='worker'))
+        db.session.commit()
+        with db.get_session() as session:
+            session.add(ExampleModel(key='context'))
+        db.session.add(ExampleModel(key='other'))
+        db.session.commit()
+
+        assert len(checkouts) == 1
+        assert self.stored_keys(dependency_provider) == [
+            'context', 'other', 'worker']
+
+        dependency_provider.worker_teardown(worker_ctx)
+        assert dependency_provider.engine.pool.checkedout() == 0
+
+    def test_worker_rollback_after_context_commit(
+        self, dependency_provider, db, checkouts
+    ):
+        context_session = db.get_session()
+        context_session.query(ExampleModel).all()
+        db.session.add(ExampleModel(key='worker'))
+        db.session.flush()
+        context_session.commit()
+        db.session.rollback()
+
+        # the transactions overlapped, the worker session used its own
+        # connection
+        assert len(checkouts) == 2
+        assert self.stored_keys(dependency_provider) == []
+
+    def test_context_commit_during_worker_transaction(
+        self, dependency_provider, db, checkouts
+    ):
+        db.session.query(ExampleModel).all()
+        with db.get_session() as session:
+            session.add(ExampleModel(key='context'))
+        db.session.rollback()
+
+        assert len(checkouts) == 2
+        assert self.stored_keys(dependency_provider) == ['context']
+
+    def test_context_session_rollback_releases_connection(
+        self, dependency_provider, db, checkouts
+    ):
+        with pytest.raises(ValueError):
+            with db.get_session() as session:
+                session.add(ExampleModel(key='context'))
+                session.flush()
+                raise ValueError('boom')
+
+        db.session.add(ExampleModel(key='worker'))
+        db.session.commit()
+
+        assert len(checkouts) == 1
+        assert self.stored_keys(dependency_provider) == ['worker']
+
+    def test_unfinished_context_session_rolled_back_on_close(
+        self, dependency_provider, db, checkouts
+    ):
+        session = db.get_session()
+        session.add(ExampleModel(key='context'))
+        session.flush()
+        session.close()
+
+        db.session.add(ExampleModel(key='worker'))
+        db.session.commit()
+
+        assert len(checkouts) == 1
+        assert self.stored_keys(dependency_provider) == ['worker']
+
+    def test_context_session_alone_commits(self, dependency_provider, db):
+        with db.get_session() as session:
+            session.add(ExampleModel(key='context'))
+
+        assert self.stored_keys(dependency_provider) == ['context']
+
+    def test_not_pinned_by_default(self, container, checkouts):
+        dependency_provider = Database(DeclBase).bind(container, 'database')
+        dependency_provider.setup()
+        db = dependency_provider.get_dependency(Mock(spec=WorkerContext))
+
+        assert db.pin is None
+
+
+class TestShards:
+
+    @pytest.fixture
+    def shard_uris(self, tmpdir):
+        uris = {}
+        for shard_id in ('eu', 'us'):
+            uris[shard_id] = 'sqlite:///{}'.format(
+                tmpdir.join('{}.db'.format(shard_id)))
+            engine = create_engine(uris[shard_id])
+            ExampleModel.metadata.create_all(engine)
+            engine.execute(
+                ExampleModel.__table__.insert(),
+                {'key': 'region', 'value': shard_id})
+        return uris
+
+    @pytest.fixture
+    def config(self, shard_uris):
+        return {DB_URIS_KEY: {'exampleservice:examplebase': shard_uris}}
+
+    @pytest.fixture
+    def dependency_provider(self, container):
+        return Database(
+            DeclBase, shard_key='tenant', max_shard_connections=2
+        ).bind(container, 'database')
+
+    def get_dependency(self, dependency_provider, tenant):
+        worker_ctx = Mock(spec=WorkerContext, data={'tenant': tenant})
+        return worker_ctx, dependency_provider.get_dependency(worker_ctx)
+
+    def test_setup(self, dependency_provider, shard_uris):
+        dependency_provider.setup()
+
+        assert dependency_provider.shards.uris == shard_uris
+        assert dependency_provider.shards.engines == {}
+        assert dependency_provider.shards.limit.size == 2
+
+    def test_routes_worker_sessions(self, dependency_provider):
+        dependency_provider.setup()
+
+        _, eu_db = self.get_dependency(dependency_provider, 'eu')
+        _, us_db = self.get_dependency(dependency_provider, 'us')
+
+        assert eu_db.session.query(ExampleModel.value).scalar() == 'eu'
+        with us_db.get_session() as session:
+            assert session.query(ExampleModel.value).scalar() == 'us'
+        assert set(dependency_provider.shards.engines) == {'eu', 'us'}
+
+    def test_unknown_shard_fails_worker(self, dependency_provider):
+        dependency_provider.setup()
+
+        worker_ctx, db = self.get_dependency(dependency_provider, 'apac')
+        with pytest.raises(ShardNotFound):
+            db.session.query(ExampleModel).all()
+
+        dependency_provider.worker_teardown(worker_ctx)
+        assert dependency_provider.dbs == {}
+
+    def test_stop_disposes_shard_engines(self, dependency_provider):
+        dependency_provider.setup()
+        worker_ctx, db = self.get_dependency(dependency_provider, 'eu')
+        db.session.query(ExampleModel).all()
+        dependency_provider.worker_teardown(worker_ctx)
+
+        dependency_provider.stop()
+
+        assert dependency_provider.shards.engines == {}
+
+    def test_shard_key_required(self, container):
+        dependency_provider = Database(DeclBase).bind(container, 'database')
+        with pytest.raises(ValueError):
+            dependency_provider.setup()
+
+    def test_pool_maintenance_unsupported(self, container):
+        dependency_provider = Database(
+            DeclBase, shard_key='tenant', pool_maintenance={}
+        ).bind(container, 'database')
+        with pytest.raises(ValueError):
+            dependency_provider.setup()
+
+
+class TestSchemas:
+
+    @pytest.fixture
+    def config(self, tmpdir):
+        return {
+            DB_URIS_KEY: {
+                'exampleservice:examplebase': 'sqlite:///{}'.format(
+                    tmpdir.join('main.db')),
+            }
+        }
+
+    @pytest.fixture
+    def dependency_provider(self, container, tmpdir):
+        dependency_provider = Database(
+            DeclBase, schema_key='tenant', schemas={'acme', 'initech'},
+            statements={'values': select(ExampleModel.value)},
+        ).bind(container, 'database')
+        dependency_provider.setup()
+
+        engine = dependency_provider.engine
+
+        @event.listens_for(engine, 'connect')
+        def attach_tenant_schemas(dbapi_connection, connection_record):
+            for schema in ('acme', 'initech'):
+                dbapi_connection.execute(
+                    "ATTACH DATABASE '{}' AS {}".format(
+                        tmpdir.join('{}.db'.format(schema)), schema))
+
+        for schema in (None, 'acme', 'initech'):
+            schema_engine = engine.execution_options(
+                schema_translate_map={None: schema})
+            ExampleModel.metadata.create_all(schema_engine)
+            with schema_engine.begin() as connection:
+                connection.execute(
+                    ExampleModel.__table__.insert(),
+                    {'key': 'tenant', 'value': schema or 'default'})
+        return dependency_provider
+
+    def get_dependency(self, dependency_provider, **data):
+        worker_ctx = Mock(spec=WorkerContext, data=data)
+        return dependency_provider.get_dependency(worker_ctx)
+
+    def test_routes_worker_sessions(self, dependency_provider):
+        acme_db = self.get_dependency(dependency_provider, tenant='acme')
+        initech_db = self.get_dependency(dependency_provider, tenant='initech')
+        default_db = self.get_dependency(dependency_provider)
+
+        assert acme_db.session.query(ExampleModel.value).scalar() == 'acme'
+        with initech_db.get_session() as session:
+            assert session.query(ExampleModel.value).scalar() == 'initech'
+        assert default_db.session.query(
+            ExampleModel.value).scalar() == 'default'
+
+    def test_precompiled_statements(self, dependency_provider):
+        acme_db = self.get_dependency(dependency_provider, tenant='acme')
+        default_db = self.get_dependency(dependency_provider)
+
+        assert acme_db.execute_statement('values').scalar() == 'acme'
+        assert default_db.execute_statement('values').scalar() == 'default'
+
+    def test_schema_engines_share_pool(self, dependency_provider):
+        acme_db = self.get_dependency(dependency_provider, tenant='acme')
+        other_acme_db = self.get_dependency(dependency_provider, tenant='acme')
+        acme_db.session.query(ExampleModel).all()
+        other_acme_db.session.query(ExampleModel).all()
+
+        engine = dependency_provider.engine
+        schema_engine = acme_db.session.get_bind()
+        assert other_acme_db.session.get_bind() is schema_engine
+        assert schema_engine.pool is engine.pool
+        assert list(dependency_provider.schema_engines) == [(engine, 'acme')]
+
+    def test_prepare_queries_unsupported(self, container):
+        dependency_provider = Database(
+            DeclBase, schema_key='tenant', schemas={'acme'},
+            prepare_queries=True
+        ).bind(container, 'database')
+        with pytest.raises(ValueError):
+            dependency_provider.setup()
+
+    def test_schemas_required(self, container):
+        dependency_provider = Database(
+            DeclBase, schema_key='tenant').bind(container, 'database')
+        with pytest.raises(ValueError):
+            dependency_provider.setup()
+
+    def test_unknown_schema_fails_worker(self, dependency_provider):
+        db = self.get_dependency(dependency_provider, tenant='main')
+
+        with pytest.raises(SchemaNotFound):
+            db.session.query(ExampleModel).all()
+        with pytest.raises(SchemaNotFound):
+            db.fan_out([select(ExampleModel.value)])
+        assert dependency_provider.schema_engines == {}
+
+    def test_schema_resolver(self, dependency_provider):
+        resolver = Mock(side_effect={'ACME': 'acme'}.get)
+        dependency_provider.schemas = resolver
+
+        db = self.get_dependency(dependency_provider, tenant='ACME')
+        assert db.session.query(ExampleModel.value).scalar() == 'acme'
+        resolver.assert_called_once_with('ACME')
+
+        db = self.get_dependency(dependency_provider, tenant='acme')
+        with pytest.raises(SchemaNotFound):
+            db.session.query(ExampleModel).all()
+
+    def test_schema_engines_bounded(self, dependency_provider):
+        dependency_provider.max_schema_engines = 1
+        engine = dependency_provider.engine
+
+        for tenant in ('acme', 'initech', 'acme'):
+            db = self.get_dependency(dependency_provider, tenant=tenant)
+            assert db.session.query(ExampleModel.value).scalar() == tenant
+
+        assert list(dependency_provider.schema_engines) == [(engine, 'acme')]
+
+
+class TestQueriesUnit:
+
+    @pytest.fixture
+    def dependency_provider(self, container):
+        return Database(DeclBase, queries={
+            'value_by_key': 'SELECT value FROM example WHERE key = :key',
+        }, prepare_queries=True).bind(container, 'database')
+
+    def test_run_query(self, dependency_provider):
+        dependency_provider.setup()
+        ExampleModel.metadata.create_all(dependency_provider.engine)
+        worker_ctx = Mock(spec=WorkerContext)
+        db = dependency_provider.get_dependency(worker_ctx)
+
+        db.session.add(ExampleModel(key='spam', value='ham'))
+        db.session.flush()
+
+        assert db.run_query('value_by_key', key='spam').scalar() == 'ham'
+
+        dependency_provider.worker_teardown(worker_ctx)
+
+    def test_unknown_query(self, dependency_provider):
+        dependency_provider.setup()
+        db = dependency_provider.get_dependency(Mock(spec=WorkerContext))
+
+        with pytest.raises(KeyError):
+            db.run_query('unknown')
+
+
+class TestBulkLoadUnit:
+
+    def test_bulk_load(self, dependency_provider):
+        dependency_provider.setup()
+        ExampleModel.metadata.create_all(dependency_provider.engine)
+        worker_ctx = Mock(spec=WorkerContext)
+        db = dependency_provider.get_dependency(worker_ctx)
+
+        rows = (('key{}'.format(n), 'value') for n in range(10))
+        loaded = db.bulk_load(
+            ExampleModel, rows, columns=['key', 'value'], batch_size=3)
+
+        assert loaded == 10
+        assert db.session.query(ExampleModel).count() == 10
+        db.session.rollback()
+        assert db.session.query(ExampleModel).count() == 0
+
+        dependency_provider.worker_teardown(worker_ctx)
+
+
+class TestColumnarUnit:
+
+    def test_fetch_columns(self, dependency_provider):
+        dependency_provider.setup()
+        ExampleModel.metadata.create_all(dependency_provider.engine)
+        worker_ctx = Mock(spec=WorkerContext)
+        db = dependency_provider.get_dependency(worker_ctx)
+        db.session.add(ExampleModel(key='spam', value='ham'))
+        db.session.flush()
+
+        columns = db.fetch_columns(
+            select(ExampleModel.key, ExampleModel.value))
+
+        assert columns == {'key': ['spam'], 'value': ['ham']}
+        dependency_provider.worker_teardown(worker_ctx)
+
+    def test_fetch_arrow(self, dependency_provider):
+        pytest.importorskip('pyarrow')
+        dependency_provider.setup()
+        ExampleModel.metadata.create_all(dependency_provider.engine)
+        worker_ctx = Mock(spec=WorkerContext)
+        db = dependency_provider.get_dependency(worker_ctx)
+        db.session.add(ExampleModel(key='spam', value='ham'))
+        db.session.flush()
+
+        table = db.fetch_arrow(
+            text('SELECT key FROM example WHERE value = :value'),
+            {'value': 'ham'})
+
+        assert table.to_pydict() == {'key': ['spam']}
+        dependency_provider.worker_teardown(worker_ctx)
+
+
+class TestReadOnly:
+
+    @pytest.fixture
+    def dependency_provider(self, container):
+        return Database(DeclBase, read_only=True).bind(container, 'database')
+
+    def test_sessions_are_read_only(self, dependency_provider):
+        dependency_provider.setup()
+        ExampleModel.metadata.create_all(dependency_provider.engine)
+        worker_ctx = Mock(spec=WorkerContext)
+        db = dependency_provider.get_dependency(worker_ctx)
+
+        assert db.session.rows(ExampleModel) == []
+        with db.get_session() as session:
+            assert isinstance(session, Session)
+            assert not session.autoflush
+        db.session.add(ExampleModel(key='spam'))
+        with pytest.raises(ReadOnlyError):
+            db.session.flush()
+
+        dependency_provider.worker_teardown(worker_ctx)
+
+    def test_group_commit_not_supported(self, container):
+        dependency_provider = Database(
+            DeclBase, read_only=True, group_commit={}
+        ).bind(container, 'database')
+
+        with pytest.raises(ValueError):
+            dependency_provider.setup()
+
+
+class TestEagerLoading:
+
+    @pytest.fixture
+    def dependency_provider(self, container):
+        return Database(
+            DeclBase, eager_loading={'auto_tune': True}
+        ).bind(container, 'database')
+
+    @pytest.fixture
+    def worker_ctx(self):
+        worker_ctx = Mock(spec=WorkerContext)
+        worker_ctx.entrypoint = Mock(method_name='get_examples')
+        return worker_ctx
+
+    def test_profile_of_entrypoint(self, dependency_provider, worker_ctx):
+        dependency_provider.setup()
+        db = dependency_provider.get_dependency(worker_ctx)
+
+        assert db.loading.profile == 'get_examples'
+        loading = db.session.info[LOADING_INFO_KEY]
+        assert loading is db.loading
+        with db.get_session() as session:
+            assert session.info[LOADING_INFO_KEY] is db.loading
+
+        with db.eager_loading('get_example'):
+            assert loading.profile == 'get_example'
+        assert loading.profile == 'get_examples'
+
+        dependency_provider.worker_teardown(worker_ctx)
+
+    def test_finishes_worker_on_teardown(
+        self, dependency_provider, worker_ctx
+    ):
+        dependency_provider.setup()
+        db = dependency_provider.get_dependency(worker_ctx)
+
+        with patch.object(
+            dependency_provider.eager_loader, 'finish_worker'
+        ) as finish_worker:
+            dependency_provider.worker_teardown(worker_ctx)
+
+        assert finish_worker.call_args_list == [call(db.loading)]
+
+    def test_not_configured(self, container, worker_ctx):
+        dependency_provider = Database(DeclBase).bind(container, 'database')
+        dependency_provider.setup()
+        db = dependency_provider.get_dependency(worker_ctx)
+
+        assert db.loading is None
+        assert LOADING_INFO_KEY not in db.session.info
+        with db.eager_loading('get_example'):
+            pass
+
+        dependency_provider.worker_teardown(worker_ctx)
+
+
+class TestFanOut:
+
+    @pytest.fixture
+    def config(self, tmpdir):
+        return {
+            DB_URIS_KEY: {
+                'exampleservice:examplebase': 'sqlite:///{}'.format(
+                    tmpdir.join('db').strpath)
+            }
+        }
+
+    @pytest.fixture
+    def dependency_provider(self, container):
+        return Database(
+            DeclBase, fan_out_concurrency=2
+        ).bind(container, 'database')
+
+    def test_fan_out(self, dependency_provider):
+        dependency_provider.setup()
+        ExampleModel.metadata.create_all(dependency_provider.engine)
+        worker_ctx = Mock(spec=WorkerContext)
+        db = dependency_provider.get_dependency(worker_ctx)
+        with db.get_session() as session:
+            session.add(ExampleModel(key='spam', value='ham'))
+
+        assert db.concurrent is None
+        results = db.fan_out([
+            select(ExampleModel.key),
+            (text('SELECT value FROM example WHERE key = :key'),
+             {'key': 'spam'}),
+            select(func.count()).select_from(ExampleModel),
+        ])
+
+        assert results == [[('spam',)], [('ham',)], [(1,)]]
+        assert db.concurrent.concurrency == 2
+        dependency_provider.worker_teardown(worker_ctx)
+
+    def test_does_not_see_uncommitted_changes(self, dependency_provider):
+        dependency_provider.setup()
+        ExampleModel.metadata.create_all(dependency_provider.engine)
+        worker_ctx = Mock(spec=WorkerContext)
+        db = dependency_provider.get_dependency(worker_ctx)
+        db.session.add(ExampleModel(key='spam', value='ham'))
+        db.session.flush()
+
+        assert db.fan_out([select(ExampleModel.key)]) == [[]]
+        dependency_provider.worker_teardown(worker_ctx)
+
+    def test_without_provider(self, dependency_provider):
+        dependency_provider.setup()
+        ExampleModel.metadata.create_all(dependency_provider.engine)
+        db = DatabaseWrapper(dependency_provider.Session)
+        db.session.add(ExampleModel(key='spam', value='ham'))
+        db.session.flush()
+
+        # runs within the worker scoped session
+        assert db.fan_out([select(ExampleModel.key)]) == [[('spam',)]]
+        db.close()
+
+
+class TestWriteBehind:
+
+    @pytest.fixture
+    def config(self, tmpdir):
+        return {
+            DB_URIS_KEY: {
+                'exampleservice:examplebase': 'sqlite:///{}'.format(
+                    tmpdir.join('db').strpath)
+            }
+        }
+
+    @pytest.fixture
+    def container(self, container):
+        container.spawn_managed_thread.side_effect = (
+            lambda fn: eventlet.spawn(fn))
+        return container
+
+    @pytest.fixture
+    def dependency_provider(self, container):
+        dependency_provider = Database(
+            DeclBase, write_behind={'interval': 0.01}
+        ).bind(container, 'database')
+        dependency_provider.setup()
+        ExampleModel.metadata.create_all(dependency_provider.engine)
+        return dependency_provider
+
+    def stored_keys(self, dependency_provider):
+        session = dependency_provider.Session()
+        try:
+            return sorted(key for key, in session.query(ExampleModel.key))
+        finally:
+            session.close()
+
+    def test_writes_after_worker(self, dependency_provider):
+        dependency_provider.start()
+        insert = ExampleModel.__table__.insert()
+        worker_ctx = Mock(spec=WorkerContext)
+        db = dependency_provider.get_dependency(worker_ctx)
+
+        db.write_behind(insert, {'key': 'a', 'value': 'spam'})
+        db.write_behind(insert, {'key': 'b', 'value': 'ham'})
+        assert self.stored_keys(dependency_provider) == []
+        dependency_provider.worker_teardown(worker_ctx)
+
+        # flushed on stop
+        dependency_provider.stop()
+        assert dependency_provider.writer_gt.dead
+        assert dependency_provider.writer.as_dict()['written'] == 2
+        dependency_provider.setup()
+        assert self.stored_keys(dependency_provider) == ['a', 'b']
+
+    def test_written_at_once_by_default(self, container):
+        dependency_provider = Database(DeclBase).bind(container, 'database')
+        dependency_provider.setup()
+        ExampleModel.metadata.create_all(dependency_provider.engine)
+        dependency_provider.start()
+        worker_ctx = Mock(spec=WorkerContext)
+        db = dependency_provider.get_dependency(worker_ctx)
+
+        db.write_behind(
+            ExampleModel.__table__.insert(), {'key': 'a', 'value': 'spam'})
+
+        assert self.stored_keys(dependency_provider) == ['a']
+        assert dependency_provider.writer is None
+        dependency_provider.worker_teardown(worker_ctx)
+
+    def test_kill(self, dependency_provider):
+        dependency_provider.start()
+
+        dependency_provider.kill()
+
+        assert dependency_provider.writer_gt.dead
+
+    def test_read_only_unsupported(self, container):
+        dependency_provider = Database(
+            DeclBase, read_only=True, write_behind={}
+        ).bind(container, 'database')
+        with pytest.raises(ValueError):
+            dependency_provider.setup()
+
+
 class TestGetSessionContextManagerUnit:
 
     @pytest.fixture
@@ -268,11 +1403,35 @@ class TestGetSessionContextManagerUnit:
         assert not rollback.called
         assert close.called
 
-        assert db._context_sessions == [session_one, session_two]
+        # sessions closed on exit are no longer tracked
+        assert db._context_sessions == {session_one}
 
         assert close.call_count == 1
         db.close()
-        assert close.call_count == 3
+        assert close.call_count == 2
+        assert db._context_sessions == set()
+
+    @patch.object(Session, 'close')
+    def test_sessions_closed_on_exit_are_not_retained(self, close, db):
+
+        for _ in range(10):
+            with db.get_session(close_on_exit=True):
+                pass
+
+        assert close.call_count == 10
+        assert db._context_sessions == set()
+
+    @patch.object(Session, 'close')
+    def test_sessions_closed_on_exit_after_error_are_not_retained(
+        self, close, db
+    ):
+
+        with pytest.raises(Exception):
+            with db.get_session(close_on_exit=True):
+                raise Exception('Yo!')
+
+        assert close.called
+        assert db._context_sessions == set()
 
     def test_worker_teardown(self, dependency_provider):
         dependency_provider.setup()
@@ -286,8 +1445,13 @@ class TestGetSessionContextManagerUnit:
         with db.get_session(close_on_exit=False) as session_two:
             assert isinstance(session_two, Session)
 
+        # reusing a session closed on exit tracks it again
+        assert dependency_provider.dbs[worker_ctx]._context_sessions == {
+            session_two}
         session_one.add(ExampleModel())
         session_two.add(ExampleModel())
+        assert dependency_provider.dbs[worker_ctx]._context_sessions == {
+            session_one, session_two}
         assert session_one.new
         assert session_two.new
         dependency_provider.worker_teardown(worker_ctx)
@@ -4,13 +4,14 @@ import pytest
 from mock import Mock
 from nameko.containers import ServiceContainer, WorkerContext
 from nameko.testing.services import dummy, entrypoint_hook
-from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy import Column, Integer, String, create_engine, text
 from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm.session import Session
 
 from nameko_sqlalchemy.database import DB_URIS_KEY
 from nameko_sqlalchemy.database_session import DatabaseSession
+from nameko_sqlalchemy.read_only import ReadOnlyError, ReadOnlySession
 
 DeclBase = declarative_base(name='examplebase')
 
@@ -100,6 +101,21 @@ def test_session_options_setup(config, container):
     assert db_session.Session.kw['expire_on_commit'] is False
 
 
+def test_compiled_cache(container):
+    db_session = DatabaseSession(
+        DeclBase, compiled_cache_size=42).bind(container, 'session')
+    db_session.setup()
+    assert db_session.compiled_cache.capacity == 42
+
+    worker_ctx = Mock(spec=WorkerContext)
+    session = db_session.get_dependency(worker_ctx)
+    for _ in range(3):
+        session.execute(text('SELECT 1'))
+    db_session.worker_teardown(worker_ctx)
+
+    assert db_session.compiled_cache.hit_rate == 2 / 3
+
+
 def test_stop(db_session):
     db_session.setup()
     assert db_session.engine
@@ -143,6 +159,10 @@ def test_multiple_workers(db_session):
         worker_ctx_2: session_2
     })
 
+    db_session.worker_teardown(worker_ctx_1)
+    db_session.worker_teardown(worker_ctx_2)
+    assert db_session.sessions == {}
+
 
 def test_weakref(db_session):
     db_session.setup()
@@ -171,6 +191,23 @@ def test_worker_teardown(db_session):
     assert not session.new  # session.close() rolls back new objects
 
 
+def test_read_only(container):
+    db_session = DatabaseSession(DeclBase, read_only=True).bind(
+        container, 'session')
+    db_session.setup()
+    DeclBase.metadata.create_all(db_session.engine)
+
+    worker_ctx = Mock(spec=WorkerContext)
+    session = db_session.get_dependency(worker_ctx)
+
+    assert isinstance(session, ReadOnlySession)
+    assert session.rows(text('SELECT COUNT(*) FROM example')) == [(0,)]
+    session.add(ExampleModel())
+    with pytest.raises(ReadOnlyError):
+        session.commit()
+    db_session.worker_teardown(worker_ctx)
+
+
 def test_end_to_end(container_factory, tmpdir):
 
     # create a temporary database
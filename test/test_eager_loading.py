@@ -0,0 +1,174 @@
+from typing import List
+
+import pytest
+from sqlalchemy import Column, ForeignKey, Integer, create_engine, event
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship, selectinload, sessionmaker
+
+from nameko_sqlalchemy.eager_loading import (
+    LOADING_INFO_KEY,
+    EagerLoading,
+    WorkerLoading,
+)
+
+DeclBase = declarative_base(name='examplebase')
+
+
+class Parent(DeclBase):
+    __tablename__ = 'parent'
+    id = Column(Integer, primary_key=True)
+    children: List['Child'] = relationship('Child', back_populates='parent')
+
+
+class Child(DeclBase):
+    __tablename__ = 'child'
+    id = Column(Integer, primary_key=True)
+    parent_id = Column(Integer, ForeignKey('parent.id'))
+    parent: Parent = relationship('Parent', back_populates='children')
+    toys: List['Toy'] = relationship('Toy')
+
+
+class Toy(DeclBase):
+    __tablename__ = 'toy'
+    id = Column(Integer, primary_key=True)
+    child_id = Column(Integer, ForeignKey('child.id'))
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    DeclBase.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(Parent.__table__.insert(), [
+            {'id': id_} for id_ in range(1, 5)])
+        connection.execute(Child.__table__.insert(), [
+            {'id': id_, 'parent_id': id_ % 4 + 1} for id_ in range(1, 9)])
+        connection.execute(Toy.__table__.insert(), [
+            {'id': id_, 'child_id': id_} for id_ in range(1, 9)])
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def statements(engine):
+    statements = []
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    return statements
+
+
+def make_session(engine, eager_loading, profile):
+    Session = sessionmaker(bind=engine)
+    eager_loading.watch_sessions(Session)
+    loading = WorkerLoading(profile)
+    return Session(info={LOADING_INFO_KEY: loading}), loading
+
+
+def load_children(session):
+    parents = session.query(Parent).order_by(Parent.id).all()
+    return [len(parent.children) for parent in parents]
+
+
+def test_applies_profile_options(engine, statements):
+    eager_loading = EagerLoading({
+        'get_parents': {Parent: [selectinload(Parent.children)]},
+    })
+    session, _ = make_session(engine, eager_loading, 'get_parents')
+
+    assert load_children(session) == [2, 2, 2, 2]
+    # the parents and one select of all their children
+    assert len(statements) == 2
+
+
+def test_applies_options_to_relationship_loads(engine, statements):
+    eager_loading = EagerLoading({
+        'get_parents': {Child: [selectinload(Child.toys)]},
+    })
+    session, _ = make_session(engine, eager_loading, 'get_parents')
+
+    children = session.query(Parent).get(1).children
+    assert [len(child.toys) for child in children] == [1, 1]
+    # the parent, its children and one select of their toys
+    assert len(statements) == 3
+
+
+def test_other_profiles_load_lazily(engine, statements):
+    eager_loading = EagerLoading({
+        'get_parents': {Parent: [selectinload(Parent.children)]},
+    })
+    session, _ = make_session(engine, eager_loading, 'other')
+
+    assert load_children(session) == [2, 2, 2, 2]
+    assert len(statements) == 5
+
+
+def test_sessions_without_loading_are_untouched(engine, statements):
+    eager_loading = EagerLoading({
+        None: {Parent: [selectinload(Parent.children)]},
+    })
+    Session = sessionmaker(bind=engine)
+    eager_loading.watch_sessions(Session)
+
+    assert load_children(Session()) == [2, 2, 2, 2]
+    assert len(statements) == 5
+
+
+def test_counts_lazy_loads(engine):
+    eager_loading = EagerLoading(auto_tune=True)
+    session, loading = make_session(engine, eager_loading, 'get_parents')
+
+    load_children(session)
+
+    assert loading.lazy_loads == {
+        ('get_parents', Parent.__mapper__, 'children'): 4}
+
+
+def test_does_not_count_lazy_loads_without_auto_tune(engine):
+    eager_loading = EagerLoading()
+    session, loading = make_session(engine, eager_loading, 'get_parents')
+
+    load_children(session)
+
+    assert not loading.lazy_loads
+
+
+def test_learns_from_repeated_n_plus_ones(engine, statements):
+    eager_loading = EagerLoading(auto_tune=True, threshold=4, min_workers=2)
+
+    for _ in range(2):
+        session, loading = make_session(engine, eager_loading, 'get_parents')
+        load_children(session)
+        eager_loading.finish_worker(loading)
+        session.close()
+
+    assert eager_loading.as_dict() == {'get_parents': ['Parent.children']}
+
+    del statements[:]
+    session, loading = make_session(engine, eager_loading, 'get_parents')
+    assert load_children(session) == [2, 2, 2, 2]
+    assert len(statements) == 2
+    assert not loading.lazy_loads
+
+
+def test_ignores_lazy_loads_under_threshold(engine):
+    eager_loading = EagerLoading(auto_tune=True, threshold=5, min_workers=1)
+    session, loading = make_session(engine, eager_loading, 'get_parents')
+
+    load_children(session)
+    eager_loading.finish_worker(loading)
+
+    assert eager_loading.as_dict() == {}
+
+
+def test_learns_per_profile(engine):
+    eager_loading = EagerLoading(auto_tune=True, threshold=1, min_workers=1)
+    session, loading = make_session(engine, eager_loading, 'get_parents')
+
+    load_children(session)
+    eager_loading.finish_worker(loading)
+
+    assert eager_loading.options('get_parents', (Parent.__mapper__,))
+    assert eager_loading.options('other', (Parent.__mapper__,)) == []
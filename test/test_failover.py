@@ -0,0 +1,149 @@
+import sqlite3
+
+import pytest
+from mock import Mock
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+
+from nameko_sqlalchemy.failover import FailoverDetector, is_failover_error
+
+
+class PostgresError(Exception):
+    def __init__(self, pgcode):
+        super(PostgresError, self).__init__('error')
+        self.pgcode = pgcode
+
+
+def postgres_connection(hot_standby):
+    connection = Mock()
+    connection.info.parameter_status.side_effect = {
+        'in_hot_standby': 'on' if hot_standby else 'off'}.get
+    return connection
+
+
+@pytest.mark.parametrize('exception,expected', [
+    (PostgresError('57P03'), True),
+    (PostgresError('40001'), False),
+    (Exception(1290, 'The MySQL server is running with the --read-only '
+                     'option so it cannot execute this statement'), True),
+    (Exception(1290, 'The MySQL server is running with the '
+                     '--super-read-only option so it cannot execute this '
+                     'statement'), True),
+    (Exception(1290, 'The MySQL server is running with the '
+                     '--secure-file-priv option so it cannot execute this '
+                     'statement'), False),
+    (Exception(1836, 'Running in read-only mode'), True),
+    (Exception(1792, 'Cannot execute statement in a READ ONLY '
+                     'transaction.'), False),
+    (Exception(2013, 'Lost connection to MySQL server'), False),
+    (Exception('cannot execute INSERT in a read-only transaction'), False),
+    (Exception('no such table: example'), False),
+])
+def test_is_failover_error(exception, expected):
+    assert is_failover_error(exception) is expected
+
+
+@pytest.mark.parametrize('connection,expected', [
+    (postgres_connection(hot_standby=True), True),
+    (postgres_connection(hot_standby=False), False),
+    (None, False),
+])
+def test_read_only_transactions_only_fail_over_on_standby(
+    connection, expected
+):
+    error = PostgresError('25006')
+
+    assert is_failover_error(error, connection) is expected
+
+
+@pytest.fixture
+def engine(tmpdir):
+    engine = create_engine(
+        'sqlite:///{}'.format(tmpdir.join('db').strpath),
+        poolclass=QueuePool)
+    yield engine
+    engine.dispose()
+
+
+def missing_table(exception, dbapi_connection):
+    return 'no such table' in str(exception)
+
+
+def test_invalidates_connection_and_disposes_of_pool(engine):
+    detector = FailoverDetector(is_failover=missing_table)
+    detector.listen(engine)
+    pool = engine.pool
+
+    with engine.connect() as connection:
+        with pytest.raises(OperationalError) as exc_info:
+            connection.execute(text('SELECT * FROM missing'))
+
+    assert exc_info.value.connection_invalidated
+    assert engine.pool is not pool
+    assert detector.failovers == 1
+
+
+def test_passes_dbapi_connection(engine):
+    is_failover = Mock(return_value=False)
+    detector = FailoverDetector(is_failover=is_failover)
+    detector.listen(engine)
+
+    with engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute(text('SELECT * FROM missing'))
+
+    exception, dbapi_connection = is_failover.call_args[0]
+    assert isinstance(exception, sqlite3.OperationalError)
+    assert isinstance(dbapi_connection, sqlite3.Connection)
+
+
+def test_ignores_other_errors(engine):
+    detector = FailoverDetector()
+    detector.listen(engine)
+    pool = engine.pool
+
+    with engine.connect() as connection:
+        with pytest.raises(OperationalError) as exc_info:
+            connection.execute(text('SELECT * FROM missing'))
+
+    assert not exc_info.value.connection_invalidated
+    assert engine.pool is pool
+    assert detector.failovers == 0
+
+
+def test_handles_failover_once_per_interval(engine):
+    on_failover = Mock()
+    detector = FailoverDetector(
+        on_failover, is_failover=missing_table, min_interval=60)
+    detector.listen(engine)
+
+    for _ in range(3):
+        with engine.connect() as connection:
+            with pytest.raises(OperationalError):
+                connection.execute(text('SELECT * FROM missing'))
+
+    on_failover.assert_called_once_with(engine)
+    assert detector.failovers == 1
+
+
+def test_handles_each_engine(engine):
+    other_engine = create_engine('sqlite://')
+    on_failover = Mock()
+    detector = FailoverDetector(on_failover, min_interval=60)
+
+    assert detector.failover(engine)
+    assert detector.failover(other_engine)
+    assert not detector.failover(engine)
+
+    assert on_failover.call_count == 2
+
+
+def test_handles_failover_again_after_interval(engine):
+    on_failover = Mock()
+    detector = FailoverDetector(on_failover, min_interval=0)
+
+    assert detector.failover(engine)
+    assert detector.failover(engine)
+
+    assert on_failover.call_count == 2
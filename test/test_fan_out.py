@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import eventlet
+import pytest
+from eventlet import GreenPool
+from mock import patch
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+from nameko_sqlalchemy.fan_out import FanOut
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # a file, so that all connections see the same database
+    engine = create_engine('sqlite:///{}'.format(tmp_path / 'fan_out.db'))
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE example (id INTEGER)'))
+        connection.execute(
+            text('INSERT INTO example VALUES (:id)'),
+            [{'id': id_} for id_ in range(5)])
+    yield engine
+    engine.dispose()
+
+
+class Connections(object):
+    """ Connects to ``engine``, tracking the connections in use.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.in_use = 0
+        self.max_in_use = 0
+        self.opened = 0
+
+    def connect(self):
+        self.opened += 1
+        self.in_use += 1
+        self.max_in_use = max(self.max_in_use, self.in_use)
+        # let the other statements start
+        eventlet.sleep(0.01)
+        return self.engine.connect()
+
+    def release(self, dbapi_connection, connection_record):
+        self.in_use -= 1
+
+
+@pytest.fixture
+def connections(engine):
+    connections = Connections(engine)
+    event.listen(engine, 'checkin', connections.release)
+    return connections
+
+
+def test_results_in_order(connections):
+    fan_out = FanOut(connections.connect)
+
+    results = fan_out.run([
+        text('SELECT id FROM example WHERE id = 3'),
+        (text('SELECT id FROM example WHERE id < :id'), {'id': 2}),
+        text('SELECT count(*) FROM example'),
+    ])
+
+    assert results == [[(3,)], [(0,), (1,)], [(5,)]]
+    assert connections.opened == 3
+    assert connections.in_use == 0
+    fan_out.close()
+
+
+def test_runs_concurrently_up_to_concurrency(connections):
+    fan_out = FanOut(connections.connect, concurrency=2)
+
+    results = fan_out.run(
+        [text('SELECT count(*) FROM example')] * 5)
+
+    assert results == [[(5,)]] * 5
+    assert connections.max_in_use == 2
+    fan_out.close()
+
+
+def test_returns_rowcount(connections):
+    fan_out = FanOut(connections.connect)
+
+    results = fan_out.run([text('UPDATE example SET id = id + 10')])
+
+    assert results == [5]
+    fan_out.close()
+
+
+def test_raises_first_error_once_all_ended(connections):
+    fan_out = FanOut(connections.connect)
+
+    with pytest.raises(OperationalError) as exc_info:
+        fan_out.run([
+            text('SELECT count(*) FROM example'),
+            text('SELECT * FROM missing_one'),
+            text('SELECT * FROM missing_two'),
+        ])
+
+    assert 'missing_one' in str(exc_info.value)
+    assert connections.opened == 3
+    assert connections.in_use == 0
+    fan_out.close()
+
+
+def test_green_threads_when_monkey_patched(connections):
+    fan_out = FanOut(connections.connect)
+
+    fan_out.run([text('SELECT 1')])
+
+    assert isinstance(fan_out._pool, GreenPool)
+    fan_out.close()
+    assert fan_out._pool is None
+
+
+def test_native_threads_when_not_monkey_patched(engine):
+    fan_out = FanOut(engine.connect)
+
+    with patch(
+        'nameko_sqlalchemy.fan_out.is_monkey_patched', return_value=False
+    ):
+        results = fan_out.run([text('SELECT 1'), text('SELECT 2')])
+
+    assert results == [[(1,)], [(2,)]]
+    assert isinstance(fan_out._pool, ThreadPoolExecutor)
+    fan_out.close()
+    assert fan_out._pool is None
@@ -0,0 +1,175 @@
+import eventlet
+import pytest
+from mock import Mock
+from sqlalchemy import Column, String, create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from nameko_sqlalchemy.group_commit import GroupCommit
+
+DeclBase = declarative_base(name='examplebase')
+
+
+class ExampleModel(DeclBase):
+    __tablename__ = 'example'
+    key = Column(String, primary_key=True)
+    value = Column(String)
+
+
+@pytest.fixture
+def Session(tmpdir):
+    engine = create_engine('sqlite:///{}'.format(tmpdir.join('db.sqlite')))
+    DeclBase.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def committer(Session):
+    committer = GroupCommit(Session, window=0.01)
+    gt = eventlet.spawn(committer.run)
+    yield committer
+    committer.stop()
+    gt.wait()
+
+
+def insert(key):
+    def unit(session):
+        session.add(ExampleModel(key=key, value='value'))
+        return key
+    return unit
+
+
+def stored_keys(Session):
+    return sorted(key for key, in Session().query(ExampleModel.key))
+
+
+def test_batches_concurrent_units(committer, Session):
+    pool = eventlet.GreenPool()
+    keys = ['key-{}'.format(index) for index in range(10)]
+
+    results = list(pool.imap(committer.submit, map(insert, keys)))
+
+    assert results == keys
+    assert stored_keys(Session) == keys
+    assert committer.as_dict() == {
+        'batches': 1, 'units': 10, 'fallbacks': 0}
+
+
+def test_max_batch(Session, committer):
+    committer.max_batch = 4
+    pool = eventlet.GreenPool()
+
+    list(pool.imap(committer.submit, map(insert, 'abcdefghij')))
+
+    assert committer.batches == 3
+    assert stored_keys(Session) == list('abcdefghij')
+
+
+def test_failing_unit(committer, Session):
+    def fail(session):
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        committer.submit(fail)
+
+    assert committer.fallbacks == 0
+
+
+def test_failing_batch_falls_back(committer, Session):
+    committer.submit(insert('taken'))
+    pool = eventlet.GreenPool()
+
+    def submit(key):
+        try:
+            return committer.submit(insert(key))
+        except IntegrityError:
+            return None
+
+    results = list(pool.imap(submit, ['a', 'taken', 'b']))
+
+    assert results == ['a', None, 'b']
+    assert stored_keys(Session) == ['a', 'b', 'taken']
+    assert committer.fallbacks == 1
+
+
+def test_stop_commits_queued_units(Session):
+    committer = GroupCommit(Session, window=0.01)
+    pool = eventlet.GreenPool()
+    pending = [pool.spawn(committer.submit, insert(key)) for key in 'ab']
+    eventlet.sleep()
+
+    committer.stop()
+    committer.run()
+
+    assert [gt.wait() for gt in pending] == ['a', 'b']
+    assert stored_keys(Session) == ['a', 'b']
+
+
+def test_session_closed(committer):
+    session = Mock()
+    committer.Session = Mock(return_value=session)
+
+    committer.submit(insert('a'))
+
+    assert session.commit.called
+    assert session.close.called
+
+
+def test_failing_rollback_reaches_every_unit(committer):
+    session = Mock()
+    session.commit.side_effect = ValueError('boom')
+    session.rollback.side_effect = RuntimeError('rollback failed')
+    committer.Session = Mock(return_value=session)
+    pool = eventlet.GreenPool()
+
+    def submit(key):
+        try:
+            return committer.submit(insert(key))
+        except RuntimeError:
+            return None
+
+    assert list(pool.imap(submit, 'ab')) == [None, None]
+
+    # the committer still runs
+    session.commit.side_effect = None
+    session.rollback.side_effect = None
+    assert committer.submit(insert('c')) == 'c'
+
+
+def test_failing_rollback_of_one_unit_in_fallback(committer):
+    sessions = []
+
+    def Session():
+        session = Mock()
+        if len(sessions) == 1:
+            # the fallback session of the first unit
+            session.rollback.side_effect = RuntimeError('rollback failed')
+        sessions.append(session)
+        return session
+
+    committer.Session = Session
+    pool = eventlet.GreenPool()
+
+    def fail(session):
+        raise ValueError('boom')
+
+    def submit(unit):
+        try:
+            return committer.submit(unit)
+        except Exception as exc:
+            return type(exc)
+
+    results = list(pool.imap(submit, [fail, insert('a')]))
+
+    assert results == [RuntimeError, 'a']
+    assert committer.fallbacks == 1
+
+
+def test_failing_close_after_commit(committer):
+    session = Mock()
+    session.close.side_effect = RuntimeError('close failed')
+    committer.Session = Mock(return_value=session)
+
+    assert committer.submit(insert('a')) == 'a'
+    assert committer.submit(insert('b')) == 'b'
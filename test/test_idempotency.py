@@ -0,0 +1,165 @@
+import datetime
+import sys
+from test.conftest import ExampleModel
+
+import pytest
+from mock import Mock, patch
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from nameko_sqlalchemy import idempotency
+from nameko_sqlalchemy.transaction_retry import transaction_retry
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(
+        sys.modules['nameko_sqlalchemy.transaction_retry'], 'sleep', Mock())
+
+
+@pytest.fixture
+def engine(tmpdir):
+    engine = create_engine(
+        'sqlite:///{}'.format(tmpdir.join('idempotency.db').strpath))
+    ExampleModel.metadata.create_all(engine)
+    idempotency.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def _op_exc():
+    return OperationalError(None, None, None, connection_invalidated=True)
+
+
+@pytest.fixture
+def fail_commits(engine):
+    """ Makes the next ``count`` commits raise, after or before committing.
+    """
+    do_commit = engine.dialect.do_commit
+    failures = []
+
+    def failing_commit(dbapi_connection):
+        if not failures:
+            return do_commit(dbapi_connection)
+        committed = failures.pop()
+        if committed:
+            do_commit(dbapi_connection)
+        raise _op_exc()
+
+    def fail(count=1, committed=True):
+        failures.extend([committed] * count)
+
+    with patch.object(engine.dialect, 'do_commit', failing_commit):
+        yield fail
+
+
+def test_requires_session():
+    with pytest.raises(ValueError):
+        transaction_retry(lambda: None, idempotency_key=True)
+
+
+def test_records_key_with_the_write(session):
+    @transaction_retry(session=session, idempotency_key=lambda data: data)
+    def create(data):
+        session.add(ExampleModel(data=data))
+        return data
+
+    assert create('hello') == 'hello'
+
+    session.rollback()
+    assert session.query(ExampleModel).count() == 1
+    assert idempotency.is_recorded(session, 'hello')
+
+
+def test_commits_for_the_wrapped_function(session):
+    @transaction_retry(session=session, idempotency_key=True)
+    def create():
+        session.add(ExampleModel(data='hello'))
+
+    create()
+    session.rollback()
+
+    assert session.query(ExampleModel).count() == 1
+
+
+def test_does_not_replay_write_after_ambiguous_commit(session, fail_commits):
+    calls = []
+
+    @transaction_retry(session=session, total=3, idempotency_key=True)
+    def create():
+        calls.append(None)
+        session.add(ExampleModel(data='hello'))
+        session.commit()
+        return 'created'
+
+    fail_commits(committed=True)
+
+    assert create() is None
+    assert len(calls) == 1
+    assert session.query(ExampleModel).count() == 1
+
+
+def test_replays_write_after_failed_commit(session, fail_commits):
+    calls = []
+
+    @transaction_retry(session=session, total=3, idempotency_key=True)
+    def create():
+        calls.append(None)
+        session.add(ExampleModel(data='hello'))
+        session.commit()
+        return 'created'
+
+    fail_commits(count=2, committed=False)
+
+    assert create() == 'created'
+    assert len(calls) == 3
+    assert session.query(ExampleModel).count() == 1
+
+
+def test_replays_write_after_failed_statement(session):
+    calls = []
+
+    @transaction_retry(session=session, idempotency_key=True)
+    def create():
+        calls.append(None)
+        session.add(ExampleModel(data='hello'))
+        session.flush()
+        if len(calls) == 1:
+            raise _op_exc()
+        return 'created'
+
+    assert create() == 'created'
+    assert len(calls) == 2
+    assert session.query(ExampleModel).count() == 1
+
+
+def test_rejects_reused_key(session):
+    @transaction_retry(session=session, idempotency_key=lambda data: data)
+    def create(data):
+        session.add(ExampleModel(data=data))
+
+    create('hello')
+
+    with pytest.raises(IntegrityError):
+        create('hello')
+    session.rollback()
+    assert session.query(ExampleModel).count() == 1
+
+
+def test_delete_expired(session):
+    idempotency.record(session, 'new')
+    session.execute(idempotency.idempotency_keys.insert().values(
+        key='old',
+        created_at=datetime.datetime.utcnow() - datetime.timedelta(hours=2)))
+
+    assert idempotency.delete_expired(session, max_age=3600) == 1
+    assert idempotency.is_recorded(session, 'new')
+    assert not idempotency.is_recorded(session, 'old')
@@ -0,0 +1,54 @@
+import subprocess
+import sys
+
+import pytest
+
+import nameko_sqlalchemy
+
+
+def imported_after(statement):
+    output = subprocess.check_output([
+        sys.executable, '-W', 'ignore', '-c',
+        '{}; import sys; print(" ".join(sys.modules))'.format(statement)
+    ])
+    return set(output.decode().split())
+
+
+@pytest.mark.parametrize('statement', [
+    'import nameko_sqlalchemy',
+    'from nameko_sqlalchemy import DB_URIS_KEY',
+    'from nameko_sqlalchemy import transaction_retry',
+])
+def test_light_imports_skip_nameko_and_the_orm(statement):
+    modules = imported_after(statement)
+
+    assert 'nameko_sqlalchemy' in modules
+    assert 'nameko_sqlalchemy.database' not in modules
+    assert 'nameko' not in modules
+    assert 'eventlet' not in modules
+    assert 'sqlalchemy.orm' not in modules
+
+
+def test_providers_are_imported_when_used():
+    modules = imported_after('from nameko_sqlalchemy import Database')
+
+    assert 'nameko_sqlalchemy.database' in modules
+    assert 'pyarrow' not in modules
+
+
+def test_exports():
+    from nameko_sqlalchemy.database import Database
+    from nameko_sqlalchemy.transaction_retry import transaction_retry
+
+    assert nameko_sqlalchemy.Database is Database
+    assert nameko_sqlalchemy.transaction_retry is transaction_retry
+    # __all__ is a literal for type checkers, keep it in step
+    assert set(nameko_sqlalchemy.LAZY_EXPORTS) <= set(nameko_sqlalchemy.__all__)
+    assert set(nameko_sqlalchemy.__all__) <= set(dir(nameko_sqlalchemy))
+    for name in nameko_sqlalchemy.__all__:
+        assert getattr(nameko_sqlalchemy, name) is not None
+
+
+def test_unknown_attribute():
+    with pytest.raises(AttributeError):
+        nameko_sqlalchemy.Unknown
@@ -0,0 +1,232 @@
+import time
+
+import pytest
+from mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool, QueuePool
+
+from nameko_sqlalchemy.pool_maintenance import PoolMaintenance
+
+
+@pytest.fixture
+def engine(tmpdir):
+    engine = create_engine(
+        'sqlite:///{}'.format(tmpdir.join('db').strpath),
+        poolclass=QueuePool, pool_size=5, max_overflow=2
+    )
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def pool(engine):
+    return engine.pool
+
+
+def fill(pool, count):
+    """ Open ``count`` connections and return them to the pool idle.
+    """
+    connections = [pool.connect() for _ in range(count)]
+    dbapi_connections = [conn.dbapi_connection for conn in connections]
+    for conn in connections:
+        conn.close()
+    return dbapi_connections
+
+
+def idle_dbapi_connections(pool):
+    return [record.connection for record in pool._pool.queue]
+
+
+def test_requires_queue_pool(tmpdir):
+    engine = create_engine('sqlite://', poolclass=NullPool)
+
+    with pytest.raises(TypeError):
+        PoolMaintenance(engine.pool)
+
+
+def test_nothing_configured(pool):
+    fill(pool, 3)
+
+    maintenance = PoolMaintenance(pool)
+    assert maintenance.run_once() == {'trimmed': 0, 'recycled': 0, 'dead': 0}
+    assert pool.checkedin() == 3
+
+
+class TestTrim:
+
+    def test_trims_idle_connections_beyond_target(self, pool):
+        opened = fill(pool, 4)
+
+        maintenance = PoolMaintenance(pool, min_idle=1)
+        assert maintenance.run_once()['trimmed'] == 3
+
+        assert pool.checkedin() == 1
+        assert pool.checkedout() == 0
+        # the longest idle connections are closed first
+        assert idle_dbapi_connections(pool) == opened[3:]
+
+    def test_trimmed_slots_can_be_reused(self, pool):
+        fill(pool, 5)
+
+        PoolMaintenance(pool, min_idle=0).run_once()
+        assert pool.checkedin() == 0
+
+        # the full size plus overflow is still available
+        connections = [pool.connect() for _ in range(7)]
+        assert pool.checkedout() == 7
+        for conn in connections:
+            conn.close()
+
+    def test_does_not_touch_checked_out_connections(self, pool):
+        fill(pool, 2)
+        checked_out = pool.connect()
+
+        PoolMaintenance(pool, min_idle=0).run_once()
+
+        assert pool.checkedin() == 0
+        assert pool.checkedout() == 1
+        checked_out.close()
+        assert pool.checkedin() == 1
+
+
+class TestRecycle:
+
+    def test_reconnects_connections_past_lifetime(self, pool):
+        opened = fill(pool, 2)
+        time.sleep(0.01)
+
+        maintenance = PoolMaintenance(pool, max_lifetime=0)
+        assert maintenance.run_once()['recycled'] == 2
+
+        assert pool.checkedin() == 2
+        reconnected = idle_dbapi_connections(pool)
+        assert all(conn is not None for conn in reconnected)
+        assert not set(reconnected) & set(opened)
+
+    def test_keeps_young_connections(self, pool):
+        opened = fill(pool, 2)
+
+        maintenance = PoolMaintenance(pool, max_lifetime=3600)
+        assert maintenance.run_once()['recycled'] == 0
+
+        assert idle_dbapi_connections(pool) == opened
+
+    def test_preserves_lifo_order(self, tmpdir):
+        engine = create_engine(
+            'sqlite:///{}'.format(tmpdir.join('db').strpath),
+            poolclass=QueuePool, pool_size=5, pool_use_lifo=True
+        )
+        pool = engine.pool
+        fill(pool, 3)
+        order = list(pool._pool.queue)
+
+        PoolMaintenance(pool, max_lifetime=3600).run_once()
+
+        assert list(pool._pool.queue) == order
+
+    def test_connect_error_leaves_record_for_checkout(self, pool):
+        fill(pool, 1)
+        time.sleep(0.01)
+
+        maintenance = PoolMaintenance(pool, max_lifetime=0)
+        with patch.object(
+            pool, '_invoke_creator', side_effect=Exception('down')
+        ):
+            assert maintenance.run_once()['recycled'] == 1
+
+        assert idle_dbapi_connections(pool) == [None]
+        # the next checkout connects
+        conn = pool.connect()
+        assert conn.dbapi_connection is not None
+        conn.close()
+
+    def test_skips_disconnected_records(self, pool):
+        fill(pool, 1)
+        pool._pool.queue[0].close()
+
+        maintenance = PoolMaintenance(pool, max_lifetime=0, pre_ping=True)
+        assert maintenance.run_once() == {
+            'trimmed': 0, 'recycled': 0, 'dead': 0}
+
+
+class TestPrePing:
+
+    def test_keeps_live_connections(self, pool):
+        opened = fill(pool, 2)
+
+        maintenance = PoolMaintenance(pool, pre_ping=True)
+        assert maintenance.run_once()['dead'] == 0
+
+        assert idle_dbapi_connections(pool) == opened
+
+    def test_reconnects_dead_connections(self, pool):
+        opened = fill(pool, 2)
+
+        maintenance = PoolMaintenance(pool, pre_ping=True)
+        with patch.object(pool._dialect, 'do_ping', return_value=False):
+            assert maintenance.run_once()['dead'] == 2
+
+        reconnected = idle_dbapi_connections(pool)
+        assert all(conn is not None for conn in reconnected)
+        assert not set(reconnected) & set(opened)
+
+    def test_reconnects_on_ping_errors(self, pool):
+        opened = fill(pool, 1)
+
+        maintenance = PoolMaintenance(pool, pre_ping=True)
+        with patch.object(
+            pool._dialect, 'do_ping', side_effect=Exception('boom')
+        ):
+            assert maintenance.run_once()['dead'] == 1
+
+        assert idle_dbapi_connections(pool) != opened
+
+
+def test_takes_one_idle_connection_at_a_time(pool):
+    opened = fill(pool, 3)
+    idle_while_pinging = []
+    checked_out_while_pinging = []
+
+    def ping(dbapi_connection):
+        idle_while_pinging.append(pool.checkedin())
+        # a worker checking out meanwhile gets another idle connection
+        conn = pool.connect()
+        checked_out_while_pinging.append(conn.dbapi_connection)
+        conn.close()
+        return True
+
+    maintenance = PoolMaintenance(pool, pre_ping=True)
+    with patch.object(pool._dialect, 'do_ping', side_effect=ping):
+        assert maintenance.run_once()['dead'] == 0
+
+    assert idle_while_pinging == [2, 2, 2]
+    assert set(checked_out_while_pinging) <= set(opened)
+    assert set(idle_dbapi_connections(pool)) == set(opened)
+
+
+def test_requires_pool_internals(pool):
+    with patch(
+        'nameko_sqlalchemy.pool_maintenance.POOL_INTERNALS',
+        ('_pool', '_missing')
+    ):
+        with pytest.raises(TypeError) as exc_info:
+            PoolMaintenance(pool)
+
+    assert '_missing' in str(exc_info.value)
+
+
+def test_closes_connections_that_no_longer_fit(pool):
+    fill(pool, 5)
+    maintenance = PoolMaintenance(pool, pre_ping=True)
+    records = [maintenance._take_oldest() for _ in range(5)]
+
+    # workers opened new connections while the records were taken out
+    connections = [pool.connect() for _ in range(2)]
+    for conn in connections:
+        conn.close()
+
+    for record in records:
+        maintenance._return(record)
+
+    assert pool.checkedin() == 5
+    assert pool.checkedout() == 0
@@ -0,0 +1,135 @@
+import logging
+
+import pytest
+from mock import Mock, patch
+from nameko.containers import ServiceContainer
+from sqlalchemy import Column, Integer, String, create_engine, select, text
+from sqlalchemy.ext.declarative import declarative_base
+
+from nameko_sqlalchemy.database import DB_URIS_KEY, Database
+from nameko_sqlalchemy.profiler import StatementProfiler, fingerprint
+
+DeclBase = declarative_base(name='examplebase')
+
+
+class ExampleModel(DeclBase):
+    __tablename__ = 'example'
+    id = Column(Integer, primary_key=True)
+    key = Column(String, index=True)
+
+
+@pytest.mark.parametrize('statement, expected', [
+    ("SELECT * FROM t WHERE a = 'x''y' AND b = 42",
+     'SELECT * FROM t WHERE a = ? AND b = ?'),
+    ('SELECT *\n  FROM t\n WHERE a = %(a_1)s AND b = %s',
+     'SELECT * FROM t WHERE a = ? AND b = ?'),
+    ('SELECT * FROM t WHERE a = :a AND b = $1 AND c = ?',
+     'SELECT * FROM t WHERE a = ? AND b = ? AND c = ?'),
+    ('SELECT * FROM t WHERE a IN (?, ?, ?)',
+     'SELECT * FROM t WHERE a IN (?, ...)'),
+    ('INSERT INTO t (a, b) VALUES (?, ?), (?, ?), (?, ?)',
+     'INSERT INTO t (a, b) VALUES (?, ...), ...'),
+    ("SELECT '12:30' FROM t1", 'SELECT ? FROM t1'),
+])
+def test_fingerprint(statement, expected):
+    assert fingerprint(statement) == expected
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    DeclBase.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def profiler(engine):
+    profiler = StatementProfiler(sample_rate=1, top=2)
+    profiler.listen(engine)
+    return profiler
+
+
+def query(engine, statement, **params):
+    with engine.connect() as connection:
+        connection.execute(statement, params)
+
+
+def test_aggregates_by_fingerprint(engine, profiler):
+    for key in ('a', 'b', 'c'):
+        query(engine, select(ExampleModel).where(ExampleModel.key == key))
+    query(engine, text('SELECT id FROM example WHERE id = 1'))
+    query(engine, text('SELECT id FROM example WHERE id = 2'))
+
+    counts = {stats.fingerprint: stats.count
+              for stats in profiler.stats.values()}
+    assert counts == {
+        'SELECT example.id, example."key" FROM example '
+        'WHERE example."key" = ?': 3,
+        'SELECT id FROM example WHERE id = ?': 2,
+    }
+
+
+def test_sample_rate(engine, profiler):
+    profiler.sample_rate = 0.5
+    with patch('nameko_sqlalchemy.profiler.random') as random_:
+        random_.random.side_effect = [0.1, 0.9]
+        query(engine, text('SELECT 1'))
+        query(engine, text('SELECT 1'))
+
+    stats, = profiler.stats.values()
+    assert stats.count == 1
+
+
+def test_report(engine, profiler):
+    durations = iter([0, 3, 10, 11, 20, 20.5])
+    with patch('nameko_sqlalchemy.profiler.time') as time_:
+        time_.perf_counter.side_effect = lambda: next(durations)
+        query(engine, select(ExampleModel).where(ExampleModel.key == 'a'))
+        query(engine, text('SELECT 1'))
+        query(engine, text('SELECT 2 FROM example'))
+
+    report = profiler.report()
+
+    assert [stats['fingerprint'] for stats in report] == [
+        'SELECT example.id, example."key" FROM example '
+        'WHERE example."key" = ?',
+        'SELECT ?',
+    ]
+    assert report[0]['total_time'] == 3
+    assert report[0]['mean_time'] == 3
+    assert report[0]['max_time'] == 3
+    # the index on key is used
+    assert 'ix_example_key' in ' '.join(report[0]['plan'])
+    assert report[1]['plan']
+
+    # explaining isn't profiled
+    assert len(profiler.stats) == 3
+    assert 'SELECT ?' in profiler.format_report()
+
+
+def test_no_plan_for_ddl(engine, profiler):
+    query(engine, text('CREATE TABLE other (id INTEGER)'))
+
+    assert profiler.report()[0]['plan'] == []
+
+
+def test_database_logs_report_on_stop(tmpdir, caplog):
+    config = {
+        DB_URIS_KEY: {
+            'exampleservice:examplebase': 'sqlite:///{}'.format(
+                tmpdir.join('db').strpath)
+        }
+    }
+    container = Mock(
+        spec=ServiceContainer, config=config, service_name='exampleservice')
+    profiler = StatementProfiler(sample_rate=1)
+    provider = Database(DeclBase, profiler=profiler).bind(container, 'db')
+    provider.setup()
+    DeclBase.metadata.create_all(provider.engine)
+    query(provider.engine, select(ExampleModel))
+
+    with caplog.at_level(logging.INFO, logger='nameko_sqlalchemy.database'):
+        provider.stop()
+
+    assert 'statement profile' in caplog.text
+    assert 'FROM example' in caplog.text
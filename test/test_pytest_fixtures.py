@@ -223,3 +223,74 @@ class TestWorkerScopeSessionInContext:
 
         service.write(11, 'ham')
         assert service.read(11) == 'ham'
+
+
+class TestAssertMaxQueries:
+
+    @pytest.fixture
+    def users(self, db_session):
+        db_session.add_all([User(id=id_, name='Joe') for id_ in range(5)])
+        db_session.commit()
+
+    def test_within_budget(self, assert_max_queries, db_session, users):
+        with assert_max_queries(1, max_rows=5, max_time=10) as recorder:
+            assert len(db_session.query(User).all()) == 5
+
+        assert len(recorder) == 1
+        assert recorder.rows == 5
+        assert recorder.duration < 10
+        query = recorder.queries[0]
+        assert query.statement.startswith('SELECT')
+        assert query.rows == 5
+        assert query.duration >= 0
+
+    def test_too_many_queries(self, assert_max_queries, db_session, users):
+        with pytest.raises(AssertionError) as exc_info:
+            with assert_max_queries(1):
+                db_session.query(User).get(1)
+                db_session.query(User).get(2)
+
+        message = str(exc_info.value)
+        assert '2 queries executed, expected at most 1' in message
+        assert '2. SELECT' in message
+
+    def test_too_many_rows(self, assert_max_queries, db_session, users):
+        with pytest.raises(AssertionError) as exc_info:
+            with assert_max_queries(max_rows=2):
+                db_session.query(User).all()
+
+        assert '5 rows fetched, expected at most 2' in str(exc_info.value)
+
+    def test_too_slow(self, assert_max_queries, db_session, users):
+        with pytest.raises(AssertionError) as exc_info:
+            with assert_max_queries(max_time=0):
+                db_session.query(User).first()
+
+        assert 'expected at most 0.000s' in str(exc_info.value)
+
+    def test_rows_fetched_one_by_one(
+        self, assert_max_queries, database, users
+    ):
+        with assert_max_queries(2) as recorder:
+            result = database.session.execute(User.__table__.select())
+            assert result.fetchone() is not None
+            assert len(result.fetchmany(2)) == 2
+            assert len(result.fetchall()) == 2
+            assert result.fetchone() is None
+
+        assert recorder.rows == 5
+
+    def test_does_not_check_when_block_raises(
+        self, assert_max_queries, db_session
+    ):
+        with pytest.raises(ValueError):
+            with assert_max_queries(0):
+                db_session.query(User).all()
+                raise ValueError()
+
+    def test_stops_recording_on_exit(self, assert_max_queries, db_session):
+        with assert_max_queries() as recorder:
+            pass
+
+        db_session.query(User).all()
+        assert len(recorder) == 0
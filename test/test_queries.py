@@ -0,0 +1,141 @@
+import pytest
+from mock import Mock, call
+from sqlalchemy import Column, Integer, String, bindparam, create_engine, select
+from sqlalchemy.dialects.postgresql import psycopg2
+from sqlalchemy.ext.declarative import declarative_base
+
+from nameko_sqlalchemy.queries import PREPARED_INFO_KEY, QueryRegistry
+
+DeclBase = declarative_base(name='examplebase')
+
+
+class ExampleModel(DeclBase):
+    __tablename__ = 'example'
+    id = Column(Integer, primary_key=True)
+    data = Column(String)
+
+
+QUERIES = {
+    'data_by_id': 'SELECT data FROM example WHERE id = :id',
+    'count': lambda: select(ExampleModel.id).where(
+        ExampleModel.id > bindparam('min_id')),
+    'all': 'SELECT data FROM example',
+}
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    DeclBase.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(ExampleModel.__table__.insert(), [
+            {'id': 1, 'data': 'one'}, {'id': 2, 'data': 'two'},
+        ])
+    return engine
+
+
+def test_invalid_name_for_prepared_statement():
+    with pytest.raises(ValueError):
+        QueryRegistry({'not valid': 'SELECT 1'}, prepare=True)
+
+    # fine when not prepared server side
+    QueryRegistry({'not valid': 'SELECT 1'})
+
+
+class TestNotPrepared:
+
+    @pytest.mark.parametrize('prepare', [False, True])
+    def test_execute(self, engine, prepare):
+        registry = QueryRegistry(QUERIES, prepare=prepare)
+        registry.compile(engine.dialect)
+        registry.listen(engine)
+
+        # sqlite has no server side prepared statements
+        assert registry.prepared == {}
+
+        with engine.connect() as connection:
+            assert registry.execute(
+                connection, 'data_by_id', {'id': 2}).scalar() == 'two'
+            assert registry.execute(
+                connection, 'count', {'min_id': 0}).fetchall() == [(1,), (2,)]
+
+
+class TestPostgresqlPrepared:
+
+    @pytest.fixture
+    def registry(self):
+        registry = QueryRegistry(QUERIES, prepare=True)
+        registry.compile(psycopg2.dialect())
+        return registry
+
+    def test_compile(self, registry):
+        assert registry.prepared['data_by_id'] == (
+            'PREPARE data_by_id AS SELECT data FROM example WHERE id = $1',
+            'EXECUTE data_by_id (%s)',
+            ['id'],
+        )
+        prepare_sql, execute_sql, param_names = registry.prepared['count']
+        assert prepare_sql.startswith('PREPARE count AS SELECT example.id')
+        assert prepare_sql.endswith('WHERE example.id > $1')
+        assert execute_sql == 'EXECUTE count (%s)'
+        assert param_names == ['min_id']
+        # reserved words are quoted
+        assert registry.prepared['all'] == (
+            'PREPARE "all" AS SELECT data FROM example',
+            'EXECUTE "all"',
+            [],
+        )
+
+    def test_prepares_on_first_checkout(self, registry):
+        dbapi_connection = Mock()
+        cursor = dbapi_connection.cursor.return_value
+        record = Mock(info={})
+
+        registry._prepare_on_checkout(dbapi_connection, record, Mock())
+
+        assert cursor.execute.call_args_list == [
+            call(registry.prepared[name][0])
+            for name in ('data_by_id', 'count', 'all')
+        ]
+        assert dbapi_connection.commit.called
+        assert cursor.close.called
+        assert record.info[PREPARED_INFO_KEY] == {'data_by_id', 'count', 'all'}
+
+        # already prepared on this connection
+        cursor.reset_mock()
+        registry._prepare_on_checkout(dbapi_connection, record, Mock())
+        assert not cursor.execute.called
+
+    def test_prepare_error(self, registry):
+        dbapi_connection = Mock()
+        cursor = dbapi_connection.cursor.return_value
+        cursor.execute.side_effect = Exception('boom')
+        record = Mock(info={})
+
+        with pytest.raises(Exception):
+            registry._prepare_on_checkout(dbapi_connection, record, Mock())
+
+        assert dbapi_connection.rollback.called
+        assert not dbapi_connection.commit.called
+        assert cursor.close.called
+        assert record.info[PREPARED_INFO_KEY] == set()
+
+    def test_execute_prepared(self, registry):
+        connection = Mock(info={PREPARED_INFO_KEY: {'data_by_id', 'all'}})
+
+        registry.execute(connection, 'data_by_id', {'id': 1})
+        registry.execute(connection, 'all')
+
+        assert connection.exec_driver_sql.call_args_list == [
+            call('EXECUTE data_by_id (%s)', (1,)),
+            call('EXECUTE "all"', ()),
+        ]
+
+    def test_execute_on_connection_not_prepared(self, registry):
+        connection = Mock(info={})
+
+        registry.execute(connection, 'data_by_id', {'id': 1})
+
+        assert not connection.exec_driver_sql.called
+        connection.execute.assert_called_once_with(
+            registry.compiled['data_by_id'], {'id': 1})
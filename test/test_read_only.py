@@ -0,0 +1,101 @@
+import pytest
+from sqlalchemy import Column, Integer, String, create_engine, event, select
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from nameko_sqlalchemy.read_only import ReadOnlyError, ReadOnlySession
+
+DeclBase = declarative_base(name='examplebase')
+
+
+class ExampleModel(DeclBase):
+    __tablename__ = 'example'
+    id = Column(Integer, primary_key=True)
+    data = Column('data_column', String)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    DeclBase.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(ExampleModel.__table__.insert(), [
+            {'id': 1, 'data_column': 'spam'},
+            {'id': 2, 'data_column': 'ham'},
+        ])
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    session = sessionmaker(bind=engine, class_=ReadOnlySession)()
+    yield session
+    session.close()
+
+
+def test_overrides_session_options(engine):
+    session = sessionmaker(
+        bind=engine, class_=ReadOnlySession, autoflush=True,
+        expire_on_commit=True)()
+
+    assert not session.autoflush
+    assert not session.expire_on_commit
+
+
+def test_reads_objects(session):
+    example = session.query(ExampleModel).get(1)
+    session.commit()
+
+    # not expired, read without another query
+    assert 'data' in example.__dict__
+    assert example.data == 'spam'
+
+
+@pytest.mark.parametrize('change', ['add', 'modify', 'delete'])
+def test_refuses_to_flush_changes(session, change):
+    if change == 'add':
+        session.add(ExampleModel(id=3))
+    elif change == 'modify':
+        session.query(ExampleModel).get(1).data = 'eggs'
+    else:
+        session.delete(session.query(ExampleModel).get(1))
+
+    with pytest.raises(ReadOnlyError):
+        session.commit()
+    with pytest.raises(ReadOnlyError):
+        session.flush()
+
+
+def test_commits_without_changes(session):
+    session.query(ExampleModel).all()
+    session.flush()
+    session.commit()
+
+
+def test_rows_of_statement(session):
+    rows = session.rows(
+        select(ExampleModel.id, ExampleModel.data)
+        .where(ExampleModel.id > 1))
+
+    assert rows == [(2, 'ham')]
+    assert rows[0].id == 2
+    assert len(session.identity_map) == 0
+
+
+def test_rows_of_mapped_class(session, engine):
+    statements = []
+    event.listen(
+        engine, 'before_cursor_execute',
+        lambda conn, cursor, statement, *args: statements.append(statement))
+
+    rows = session.rows(ExampleModel)
+
+    assert sorted(
+        (row._asdict() for row in rows), key=lambda row: row['id']
+    ) == [
+        {'id': 1, 'data': 'spam'},
+        {'id': 2, 'data': 'ham'},
+    ]
+    assert len(session.identity_map) == 0
+    assert len(statements) == 1
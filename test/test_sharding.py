@@ -0,0 +1,227 @@
+import eventlet
+import pytest
+from mock import Mock
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from nameko_sqlalchemy.sharding import ConnectionLimit, ShardNotFound, ShardRouter
+
+
+@pytest.fixture
+def uris(tmpdir):
+    return {
+        'a': 'sqlite:///{}'.format(tmpdir.join('a.db')),
+        'b': 'sqlite:///{}'.format(tmpdir.join('b.db')),
+    }
+
+
+def make_engine(uri):
+    return create_engine(uri, poolclass=QueuePool, pool_size=2)
+
+
+class OpenConnections(object):
+    """ Counts the DBAPI connections open to the engines it listens to.
+    """
+
+    def __init__(self):
+        self.open = 0
+        self.max_open = 0
+
+    def listen(self, engine):
+        event.listen(engine, 'connect', self._connect)
+        event.listen(engine, 'close', self._close)
+
+    def _connect(self, dbapi_connection, connection_record):
+        self.open += 1
+        self.max_open = max(self.max_open, self.open)
+
+    def _close(self, dbapi_connection, connection_record):
+        self.open -= 1
+
+
+@pytest.fixture
+def open_connections():
+    return OpenConnections()
+
+
+class TestConnectionLimit:
+
+    def make_engines(self, uris, limit, open_connections):
+        engines = [make_engine(uris['a']), make_engine(uris['b'])]
+        for engine in engines:
+            limit.listen(engine)
+            open_connections.listen(engine)
+        return engines
+
+    def test_bounds_connections_across_engines(self, uris, open_connections):
+        limit = ConnectionLimit(2, timeout=0.01)
+        engine_a, engine_b = self.make_engines(uris, limit, open_connections)
+
+        first = engine_a.connect()
+        second = engine_b.connect()
+        assert limit.open_connections == 2
+
+        with pytest.raises(exc.TimeoutError):
+            engine_a.connect()
+        # the failed connection didn't release a slot it never held
+        assert limit.open_connections == 2
+
+        # idle in its pool, still open
+        first.close()
+        assert limit.open_connections == 2
+        assert engine_a.pool.checkedin() == 1
+
+        # closes the idle connection of the other engine
+        third = engine_b.connect()
+        assert engine_a.pool.checkedin() == 0
+        assert limit.open_connections == 2
+        assert open_connections.open == 2
+
+        second.close()
+        third.close()
+        engine_b.dispose()
+        assert limit.open_connections == 0
+        assert open_connections.open == 0
+
+    def test_closing_idle_connections_keeps_pool_limits(
+        self, uris, open_connections
+    ):
+        limit = ConnectionLimit(3, timeout=0.01)
+        engines = [
+            create_engine(
+                uri, poolclass=QueuePool, pool_size=2, max_overflow=0,
+                pool_timeout=0.01)
+            for uri in (uris['a'], uris['b'])
+        ]
+        for engine in engines:
+            limit.listen(engine)
+            open_connections.listen(engine)
+        engine_a, engine_b = engines
+
+        checked_out = engine_a.connect()
+        engine_a.connect().close()
+        other = engine_b.connect()
+        assert engine_a.pool.checkedin() == 1
+
+        # closes the idle connection of engine a
+        engine_b.connect().close()
+
+        assert engine_a.pool.checkedin() == 0
+        assert engine_a.pool.checkedout() == 1
+        # closes the idle connection of engine b
+        second = engine_a.connect()
+        assert engine_a.pool.checkedout() == 2
+        assert limit.open_connections == 3
+
+        # the pool of engine a holds no more than its two connections
+        with pytest.raises(exc.TimeoutError) as exc_info:
+            engine_a.connect()
+        assert 'QueuePool limit' in str(exc_info.value)
+        assert open_connections.open == 3
+        for connection in (checked_out, second, other):
+            connection.close()
+
+    def test_reuses_idle_connections(self, uris, open_connections):
+        limit = ConnectionLimit(1, timeout=0.01)
+        engine_a, _ = self.make_engines(uris, limit, open_connections)
+
+        for _ in range(3):
+            with engine_a.connect() as connection:
+                connection.execute(text('SELECT 1'))
+
+        assert limit.open_connections == 1
+        assert open_connections.max_open == 1
+
+    def test_waits_for_a_close(self, uris, open_connections):
+        limit = ConnectionLimit(1, timeout=1)
+        engine_a, engine_b = self.make_engines(uris, limit, open_connections)
+
+        connection = engine_a.connect()
+        eventlet.spawn_after(0.01, connection.close)
+
+        with engine_b.connect() as other:
+            assert other.execute(text('SELECT 1')).scalar() == 1
+        assert open_connections.max_open == 1
+
+    def test_waiting_workers_hold_no_connection(self, uris, open_connections):
+        limit = ConnectionLimit(1, timeout=1)
+        engines = self.make_engines(uris, limit, open_connections)
+
+        def work(engine):
+            with engine.connect() as connection:
+                eventlet.sleep(0.01)
+                return connection.execute(text('SELECT 1')).scalar()
+
+        pool = eventlet.GreenPool()
+        assert list(pool.imap(work, engines * 2)) == [1] * 4
+        assert open_connections.max_open == 1
+
+    def test_failed_connection_releases_its_slot(self, tmpdir):
+        limit = ConnectionLimit(1, timeout=0.01)
+        engine = make_engine(
+            'sqlite:///{}'.format(tmpdir.join('missing', 'db')))
+        limit.listen(engine)
+
+        with pytest.raises(exc.OperationalError):
+            engine.connect()
+
+        assert limit.open_connections == 0
+
+
+class TestShardRouter:
+
+    @pytest.fixture
+    def create_engine(self):
+        return Mock(side_effect=make_engine)
+
+    @pytest.fixture
+    def router(self, uris, create_engine):
+        return ShardRouter(uris, create_engine, sessionmaker)
+
+    def test_engines_created_lazily(self, router, create_engine, uris):
+        assert router.engines == {}
+
+        Session = router.sessionmaker('a')
+        assert Session.kw['bind'] is router.engines['a']
+        assert router.sessionmaker('a') is Session
+        assert list(router.engines) == ['a']
+        create_engine.assert_called_once_with(uris['a'])
+
+    def test_engines_created_once_concurrently(self, router, create_engine):
+        def slow_create(uri):
+            eventlet.sleep(0.01)
+            return make_engine(uri)
+        create_engine.side_effect = slow_create
+
+        pool = eventlet.GreenPool()
+        results = list(pool.imap(router.sessionmaker, ['b'] * 5))
+
+        assert create_engine.call_count == 1
+        assert all(Session is results[0] for Session in results)
+
+    def test_unknown_shard(self, router, create_engine):
+        assert 'c' not in router
+        with pytest.raises(ShardNotFound):
+            router.sessionmaker('c')
+        assert not create_engine.called
+
+    def test_connection_limit(self, uris, create_engine):
+        router = ShardRouter(
+            uris, create_engine, sessionmaker, max_connections=1,
+            timeout=0.01)
+
+        with router.engine('a').connect():
+            with pytest.raises(exc.TimeoutError):
+                router.engine('b').connect()
+        assert router.limit.open_connections == 1
+
+    def test_dispose(self, router):
+        engine = router.engine('a')
+        engine.dispose = Mock()
+
+        router.dispose()
+
+        assert engine.dispose.called
+        assert router.engines == {}
+        assert router.sessionmakers == {}
@@ -0,0 +1,102 @@
+import pytest
+from sqlalchemy import Column, Integer, String, bindparam, create_engine, select, text
+from sqlalchemy.ext.declarative import declarative_base
+
+from nameko_sqlalchemy.statement_cache import CompiledCacheStats, StatementRegistry
+
+DeclBase = declarative_base(name='examplebase')
+
+
+class ExampleModel(DeclBase):
+    __tablename__ = 'example'
+    id = Column(Integer, primary_key=True)
+    data = Column(String)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://', query_cache_size=10)
+    DeclBase.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(ExampleModel.__table__.insert(), [
+            {'id': 1, 'data': 'one'}, {'id': 2, 'data': 'two'},
+        ])
+    return engine
+
+
+class TestCompiledCacheStats:
+
+    def test_counts_hits_and_misses(self, engine):
+        stats = CompiledCacheStats(engine)
+        assert stats.hit_rate == 0.0
+
+        with engine.connect() as connection:
+            for id_ in (1, 2, 1, 2):
+                connection.execute(
+                    select(ExampleModel.data).where(ExampleModel.id == id_))
+            connection.execute(text('SELECT 1'))
+            connection.exec_driver_sql('SELECT 1')
+
+        assert stats.misses == 2
+        assert stats.hits == 3
+        assert stats.uncached == 1
+        assert stats.hit_rate == 0.6
+        assert stats.capacity == 10
+        assert stats.size >= 1
+        assert stats.as_dict() == {
+            'hits': 3,
+            'misses': 2,
+            'uncached': 1,
+            'hit_rate': 0.6,
+            'size': stats.size,
+            'capacity': 10,
+        }
+
+        stats.reset()
+        assert stats.as_dict()['hits'] == 0
+
+    def test_caching_disabled(self):
+        engine = create_engine('sqlite://', query_cache_size=0)
+        stats = CompiledCacheStats(engine)
+
+        with engine.connect() as connection:
+            connection.execute(select(1))
+
+        assert stats.uncached == 1
+        assert stats.size == 0
+        assert stats.capacity == 0
+
+
+class TestStatementRegistry:
+
+    @pytest.fixture
+    def registry(self, engine):
+        registry = StatementRegistry({
+            'data_by_id': select(ExampleModel.data).where(
+                ExampleModel.id == bindparam('id')),
+            'count': lambda: text('SELECT count(*) FROM example'),
+        })
+        registry.compile(engine.dialect)
+        return registry
+
+    def test_execute(self, engine, registry):
+        with engine.connect() as connection:
+            assert registry.execute(
+                connection, 'data_by_id', {'id': 2}).scalar() == 'two'
+            assert registry.execute(connection, 'count').scalar() == 2
+
+    def test_not_recompiled(self, engine, registry):
+        stats = CompiledCacheStats(engine)
+
+        with engine.connect() as connection:
+            registry.execute(connection, 'data_by_id', {'id': 1})
+
+        assert stats.misses == 0
+        assert stats.uncached == 1
+        assert 'data_by_id' in registry
+        assert 'unknown' not in registry
+
+    def test_unknown_statement(self, engine, registry):
+        with engine.connect() as connection:
+            with pytest.raises(KeyError):
+                registry.execute(connection, 'unknown')
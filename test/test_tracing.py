@@ -0,0 +1,212 @@
+import pytest
+from mock import Mock
+from nameko.containers import ServiceContainer, WorkerContext
+from sqlalchemy import Column, String, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.declarative import declarative_base
+
+from nameko_sqlalchemy import tracing
+from nameko_sqlalchemy.database import DB_URIS_KEY, Database
+from nameko_sqlalchemy.database_session import DatabaseSession
+from nameko_sqlalchemy.transaction_retry import transaction_retry
+
+DeclBase = declarative_base(name='examplebase')
+
+
+class ExampleModel(DeclBase):
+    __tablename__ = 'example'
+    key = Column(String, primary_key=True)
+
+
+@pytest.fixture
+def container(tmpdir):
+    config = {
+        DB_URIS_KEY: {
+            'exampleservice:examplebase': 'sqlite:///{}'.format(
+                tmpdir.join('db').strpath)
+        }
+    }
+    return Mock(
+        spec=ServiceContainer, config=config, service_name='exampleservice')
+
+
+@pytest.fixture
+def tracer():
+    return tracing.InMemoryTracer()
+
+
+@pytest.fixture
+def worker_ctx():
+    return Mock(spec=WorkerContext, call_id='exampleservice.method.0')
+
+
+@pytest.fixture(autouse=True)
+def deactivate():
+    yield
+    tracing.deactivate()
+
+
+class TestSpan:
+
+    def test_noop_without_active_trace(self, tracer):
+        with tracing.span('work') as span:
+            assert span is tracing.NOOP_SPAN
+
+        assert tracer.spans == []
+
+    def test_records_span(self, tracer):
+        tracing.activate(tracer, 'call-id')
+
+        with tracing.span('work', size=1) as span:
+            span.set_attribute('items', 2)
+
+        span, = tracer.spans
+        assert span.name == 'work'
+        assert span.parent_id == 'call-id'
+        assert span.attributes == {'size': 1, 'items': 2}
+        assert span.duration >= 0
+        assert span.error is None
+
+    def test_records_error(self, tracer):
+        tracing.activate(tracer, 'call-id')
+        error = ValueError('boom')
+
+        with pytest.raises(ValueError):
+            with tracing.span('work'):
+                raise error
+
+        assert tracer.spans[0].error is error
+
+
+@pytest.mark.parametrize('provider_cls, get_session', [
+    (Database, lambda db: db.session),
+    (DatabaseSession, lambda session: session),
+])
+def test_provider_spans(
+    container, tracer, worker_ctx, provider_cls, get_session
+):
+    provider = provider_cls(DeclBase, tracer=tracer).bind(container, 'db')
+    provider.setup()
+    DeclBase.metadata.create_all(provider.engine)
+
+    session = get_session(provider.get_dependency(worker_ctx))
+    session.add(ExampleModel(key='spam'))
+    session.commit()
+    with pytest.raises(Exception):
+        session.execute(text('SELECT missing FROM example'))
+    provider.worker_teardown(worker_ctx)
+
+    assert [span.name for span in tracer.spans] == [
+        tracing.CHECKOUT,
+        tracing.STATEMENT,
+        tracing.COMMIT,
+        # the pool resets connections it is given back
+        tracing.ROLLBACK,
+        tracing.CHECKOUT,
+        tracing.STATEMENT,
+        tracing.ROLLBACK,
+        tracing.ROLLBACK,
+    ]
+    assert {span.parent_id for span in tracer.spans} == {worker_ctx.call_id}
+
+    insert = tracer.spans[1]
+    assert insert.attributes['db.statement'].startswith('INSERT')
+    assert insert.attributes['db.rowcount'] == 1
+    assert tracer.spans[5].error is not None
+
+    # spans outside of workers aren't traced
+    assert tracing.active_trace() is None
+    with provider.engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+    assert len(tracer.spans) == 8
+
+
+def test_providers_trace_separately(container, worker_ctx):
+    container.config[DB_URIS_KEY]['exampleservice:otherbase'] = (
+        container.config[DB_URIS_KEY]['exampleservice:examplebase'])
+    OtherBase = declarative_base(name='otherbase')
+    tracer, other_tracer = tracing.InMemoryTracer(), tracing.InMemoryTracer()
+    provider = Database(DeclBase, tracer=tracer).bind(container, 'db')
+    other = DatabaseSession(
+        OtherBase, tracer=other_tracer).bind(container, 'other')
+    provider.setup()
+    other.setup()
+
+    db = provider.get_dependency(worker_ctx)
+    other_session = other.get_dependency(worker_ctx)
+    db.session.execute(text('SELECT 1'))
+    other_session.execute(text('SELECT 2'))
+
+    # each tracer records the statements of its own provider's engine
+    statement, = tracer.spans_named(tracing.STATEMENT)
+    assert statement.attributes['db.statement'] == 'SELECT 1'
+    other_statement, = other_tracer.spans_named(tracing.STATEMENT)
+    assert other_statement.attributes['db.statement'] == 'SELECT 2'
+
+    # tearing one down leaves the other traced
+    provider.worker_teardown(worker_ctx)
+    other_session.execute(text('SELECT 3'))
+    assert len(other_tracer.spans_named(tracing.STATEMENT)) == 2
+    assert len(tracer.spans_named(tracing.STATEMENT)) == 1
+
+    other.worker_teardown(worker_ctx)
+    assert tracing.active_trace() is None
+
+
+def test_span_records_with_every_tracer():
+    tracer, other_tracer = tracing.InMemoryTracer(), tracing.InMemoryTracer()
+    tracing.activate(tracer, 'call-id', owner='db')
+    tracing.activate(other_tracer, 'call-id', owner='other')
+    # a tracer shared by two providers records the span once
+    tracing.activate(tracer, 'call-id', owner='shared')
+
+    with tracing.span('work') as span:
+        span.set_attribute('items', 1)
+
+    assert [span.attributes for span in tracer.spans] == [{'items': 1}]
+    assert [span.attributes for span in other_tracer.spans] == [{'items': 1}]
+
+    tracing.deactivate('db')
+    tracing.deactivate('shared')
+    assert tracing.active_trace() == (other_tracer, 'call-id')
+    assert tracing.active_trace('db') is None
+
+
+def test_checkouts_traced_after_dispose(container, tracer, worker_ctx):
+    provider = Database(DeclBase, tracer=tracer).bind(container, 'db')
+    provider.setup()
+    provider.engine.dispose()
+
+    db = provider.get_dependency(worker_ctx)
+    db.session.execute(text('SELECT 1'))
+
+    assert tracer.spans_named(tracing.CHECKOUT)
+
+
+def test_not_instrumented_by_default(container):
+    provider = Database(DeclBase).bind(container, 'db')
+    provider.setup()
+
+    assert 'do_commit' not in vars(provider.engine.dialect)
+    assert 'connect' not in vars(provider.engine.pool)
+
+
+def test_transaction_retry_attempts(tracer):
+    tracing.activate(tracer, 'call-id')
+    calls = []
+
+    @transaction_retry(total=2)
+    def flaky():
+        calls.append(None)
+        if len(calls) == 1:
+            raise OperationalError(
+                'SELECT 1', {}, Exception(), connection_invalidated=True)
+        return 'ok'
+
+    assert flaky() == 'ok'
+
+    first, second = tracer.spans_named(tracing.RETRY_ATTEMPT)
+    assert first.attributes == {'function': 'flaky', 'attempt': 1}
+    assert isinstance(first.error, OperationalError)
+    assert second.attributes == {'function': 'flaky', 'attempt': 2}
+    assert second.error is None
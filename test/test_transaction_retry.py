@@ -13,7 +13,7 @@ from sqlalchemy.orm import sessionmaker
 
 from nameko_sqlalchemy.database import DB_URIS_KEY, Database
 from nameko_sqlalchemy.database_session import DatabaseSession
-from nameko_sqlalchemy.transaction_retry import transaction_retry
+from nameko_sqlalchemy.transaction_retry import RetryPolicy, retry, transaction_retry
 
 DeclBase = declarative_base(name='examplebase')
 
@@ -392,6 +392,71 @@ def test_retry_configuration(retry_kwargs, call_results,
     assert expected_sleeps == sleeps
 
 
+@pytest.mark.parametrize('kwargs,total,backoffs', [
+    ({}, 1, [0, 0, 0]),
+    ({'total': -1}, 1, [0, 0, 0]),
+    ({'total': 3, 'backoff_factor': 0.5}, 3, [0, 1.0, 2.0]),
+    ({'total': 3, 'backoff_factor': -1}, 3, [0, 0, 0]),
+    ({'backoff_factor': 0.5, 'backoff_max': 1.5}, 1, [0, 1.0, 1.5]),
+    ({'backoff_factor': 0.5, 'backoff_max': -1}, 1, [0, 0, 0]),
+])
+def test_retry_policy(kwargs, total, backoffs):
+    policy = RetryPolicy(**kwargs)
+
+    assert policy.total == total
+    assert [policy.backoff(errors) for errors in (1, 2, 3)] == backoffs
+
+
+def test_rolls_back_invalidated_session_before_retrying(monkeypatch):
+    monkeypatch.setattr(
+        sys.modules['nameko_sqlalchemy.transaction_retry'], 'sleep', Mock())
+    session = Mock()
+    mocked_fcn = Mock(side_effect=[
+        _op_exc(connection_invalidated=True), _op_exc(), 3])
+
+    decorated = transaction_retry(mocked_fcn, session=session, total=2)
+
+    assert decorated(1, key='value') == 3
+    assert session.rollback.call_count == 1
+    assert mocked_fcn.call_count == 3
+    mocked_fcn.assert_called_with(1, key='value')
+
+
+def test_rolls_back_session_of_instance(monkeypatch):
+    monkeypatch.setattr(
+        sys.modules['nameko_sqlalchemy.transaction_retry'], 'sleep', Mock())
+    calls = []
+
+    class Service(object):
+        session = Mock()
+
+        @transaction_retry(session=operator.attrgetter('session'))
+        def method(self):
+            calls.append(self)
+            if len(calls) == 1:
+                raise _op_exc(connection_invalidated=True)
+            return len(calls)
+
+    service = Service()
+
+    assert service.method() == 2
+    assert calls == [service, service]
+    assert service.session.rollback.call_count == 1
+
+
+def test_retry(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(
+        sys.modules['nameko_sqlalchemy.transaction_retry'], 'sleep',
+        sleeps.append)
+    mocked_fcn = Mock(side_effect=[ValueError(), ValueError(), 3])
+
+    decorated = retry(2, 0.5, None, ValueError)(mocked_fcn)
+
+    assert decorated() == 3
+    assert sleeps == [0, 1.0]
+
+
 def test_multiple_retries_with_disabled_connection(
     toxiproxy_db_session, toxiproxy, disconnect
 ):
@@ -0,0 +1,178 @@
+import time
+
+import pytest
+from mock import Mock, patch
+from nameko.containers import WorkerContext
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from nameko_sqlalchemy.database import DatabaseWrapper, Session
+from nameko_sqlalchemy.watchdog import SessionWatchdog
+
+
+@pytest.fixture
+def engine(tmpdir):
+    return create_engine(
+        'sqlite:///{}'.format(tmpdir.join('db').strpath),
+        poolclass=QueuePool)
+
+
+@pytest.fixture
+def callback():
+    return Mock()
+
+
+@pytest.fixture
+def watchdog(engine, callback):
+    return SessionWatchdog(
+        max_session_time=10, max_transaction_time=5, callback=callback)
+
+
+@pytest.fixture
+def Session_(engine, watchdog):
+    factory = sessionmaker(bind=engine, class_=Session)
+    watchdog.watch_engine(engine)
+    watchdog.watch_sessions(factory)
+    return factory
+
+
+@pytest.fixture
+def worker_ctx():
+    return Mock(spec=WorkerContext, call_id='service.method.0')
+
+
+@pytest.fixture
+def db(Session_):
+    return DatabaseWrapper(Session_)
+
+
+@pytest.fixture
+def dbs(worker_ctx, db):
+    return {worker_ctx: db}
+
+
+def check_later(watchdog, dbs, seconds):
+    with patch('nameko_sqlalchemy.watchdog.time') as time_:
+        time_.time.return_value = time.time() + seconds
+        return watchdog.check(dbs)
+
+
+def test_ignores_idle_sessions(watchdog, callback, db, dbs):
+    db.session
+    db.get_session()
+
+    check_later(watchdog, dbs, 60)
+
+    assert not callback.called
+
+
+def test_reports_long_transaction(watchdog, callback, worker_ctx, db, dbs):
+    db.session.execute(text('SELECT 1'))
+
+    check_later(watchdog, dbs, 1)
+    assert not callback.called
+
+    check_later(watchdog, dbs, 6)
+    callback.assert_called_once_with(
+        worker_ctx, 'transaction', pytest.approx(6, abs=1))
+
+    # only once per transaction
+    check_later(watchdog, dbs, 7)
+    assert callback.call_count == 1
+
+    db.session.commit()
+    db.session.execute(text('SELECT 1'))
+    check_later(watchdog, dbs, 6)
+    assert callback.call_count == 2
+
+
+def test_reports_long_session(watchdog, callback, worker_ctx, db, dbs):
+    with db.get_session() as session:
+        session.execute(text('SELECT 1'))
+
+        check_later(watchdog, dbs, 11)
+
+    assert [call[0][1] for call in callback.call_args_list] == [
+        'session', 'transaction']
+
+
+def test_abort(watchdog, engine, db, dbs):
+    watchdog.abort = True
+    db.session.execute(text('SELECT 1'))
+    assert engine.pool.checkedout() == 1
+
+    assert check_later(watchdog, dbs, 6) == 1
+
+    assert engine.pool.checkedout() == 0
+    # only once
+    assert check_later(watchdog, dbs, 7) == 0
+
+
+def test_aborted_session_raises_until_rolled_back(watchdog, engine, db, dbs):
+    watchdog.abort = True
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE example (key TEXT)'))
+    insert = text('INSERT INTO example VALUES (:key)')
+
+    db.session.execute(insert, {'key': 'A'})
+    check_later(watchdog, dbs, 6)
+
+    with pytest.raises(InvalidRequestError) as exc_info:
+        db.session.execute(insert, {'key': 'B'})
+    assert 'aborted by watchdog' in str(exc_info.value)
+    with pytest.raises(InvalidRequestError):
+        db.session.commit()
+
+    db.session.rollback()
+    db.session.execute(insert, {'key': 'C'})
+    db.session.commit()
+
+    with engine.connect() as connection:
+        assert connection.execute(
+            text('SELECT key FROM example')).scalars().all() == ['C']
+
+
+def test_no_abort_while_executing(watchdog, engine, db, dbs):
+    watchdog.abort = True
+    connection = db.session.connection()
+
+    aborted = []
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def check(*args):
+        aborted.append(check_later(watchdog, dbs, 6))
+
+    db.session.execute(text('SELECT 1'))
+
+    assert aborted == [0]
+    assert connection.in_transaction()
+
+
+def test_no_abort_while_committing(watchdog, Session_, db, dbs):
+    watchdog.abort = True
+    db.session.execute(text('SELECT 1'))
+
+    aborted = []
+
+    @event.listens_for(Session_, 'before_commit')
+    def check(session):
+        aborted.append(check_later(watchdog, dbs, 6))
+
+    db.session.commit()
+
+    assert aborted == [0]
+
+
+def test_no_abort_while_streaming(watchdog, engine, db, dbs):
+    watchdog.abort = True
+    result = db.session.execute(
+        text('SELECT 1'), execution_options={'stream_results': True})
+
+    assert check_later(watchdog, dbs, 6) == 0
+    assert result.scalar() == 1
+
+    db.session.commit()
+    db.session.execute(text('SELECT 1'))
+    assert check_later(watchdog, dbs, 6) == 1
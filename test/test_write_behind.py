@@ -0,0 +1,224 @@
+import eventlet
+import pytest
+from mock import Mock
+from sqlalchemy import Column, Integer, String, create_engine, event
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from nameko_sqlalchemy.write_behind import WriteBehind, WriteBehindFull
+
+DeclBase = declarative_base(name='examplebase')
+
+
+class AuditLog(DeclBase):
+    __tablename__ = 'audit_log'
+    id = Column(Integer, primary_key=True)
+    action = Column(String, nullable=False)
+
+
+class Counter(DeclBase):
+    __tablename__ = 'counter'
+    key = Column(String, primary_key=True)
+    count = Column(Integer)
+
+
+# writes of the same statement object are batched together
+INSERT = AuditLog.__table__.insert()
+INCREMENT = Counter.__table__.update().values(count=Counter.count + 1)
+
+
+@pytest.fixture
+def engine(tmpdir):
+    engine = create_engine('sqlite:///{}'.format(tmpdir.join('db.sqlite')))
+    DeclBase.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def Session(engine):
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def statements(engine):
+    statements = []
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, executemany))
+
+    return statements
+
+
+def logged_actions(Session):
+    return [action for action, in Session().query(AuditLog.action)]
+
+
+def test_batches_writes(Session, statements):
+    writer = WriteBehind(Session, interval=0)
+    for index in range(10):
+        writer.write(INSERT, {'action': str(index)})
+
+    writer.stop()
+    writer.run()
+
+    assert logged_actions(Session) == [str(index) for index in range(10)]
+    assert [
+        executemany for statement, executemany in statements
+        if statement.startswith('INSERT')
+    ] == [True]
+    assert writer.as_dict() == {
+        'queued': 10, 'written': 10, 'failed': 0, 'rejected': 0,
+        'pending': 0, 'batches': 1, 'fallbacks': 0, 'blocked_time': 0.0}
+
+
+def test_groups_consecutive_writes(Session, statements):
+    writer = WriteBehind(Session, interval=0)
+    with Session.begin() as session:
+        session.add(Counter(key='calls', count=0))
+    del statements[:]
+
+    writer.write(INSERT, {'action': 'spam'})
+    writer.write(INSERT, {'action': 'ham'})
+    writer.write(INSERT, {'action': 'eggs', 'id': 10})
+    writer.write(INCREMENT)
+    writer.write(INCREMENT)
+    writer.write(INSERT, {'action': 'bacon'})
+    writer.stop()
+    writer.run()
+
+    assert logged_actions(Session) == ['spam', 'ham', 'eggs', 'bacon']
+    assert Session().query(Counter.count).scalar() == 2
+    assert writer.batches == 1
+    # the inserts without an id, with one, the counter updates and the
+    # last insert
+    assert [
+        executemany for statement, executemany in statements
+        if statement.startswith(('INSERT', 'UPDATE'))
+    ] == [True, False, True, False]
+
+
+def test_keeps_interleaved_writes_in_order(Session):
+    writer = WriteBehind(Session, interval=0)
+    insert_counter = Counter.__table__.insert()
+
+    writer.write(insert_counter, {'key': 'spam', 'count': 0})
+    writer.write(INCREMENT)
+    writer.write(insert_counter, {'key': 'ham', 'count': 0})
+    writer.stop()
+    writer.run()
+
+    assert writer.batches == 1
+    assert dict(Session().query(Counter.key, Counter.count)) == {
+        'spam': 1, 'ham': 0}
+
+
+def test_max_batch(Session):
+    writer = WriteBehind(Session, max_batch=4, interval=0)
+    for index in range(10):
+        writer.write(INSERT, {'action': str(index)})
+    writer.stop()
+    writer.run()
+
+    assert len(logged_actions(Session)) == 10
+    assert writer.batches == 3
+
+
+def test_drops_failing_writes(Session):
+    writer = WriteBehind(Session, interval=0)
+    writer.write(INSERT, {'action': 'spam'})
+    writer.write(INSERT, {'action': None})
+    writer.write(INSERT, {'action': 'ham'})
+
+    writer.stop()
+    writer.run()
+
+    assert logged_actions(Session) == ['spam', 'ham']
+    assert writer.as_dict()['written'] == 2
+    assert writer.as_dict()['failed'] == 1
+    assert writer.as_dict()['fallbacks'] == 1
+
+
+def test_blocks_while_full(Session):
+    writer = WriteBehind(Session, max_size=2, interval=0)
+    for index in range(2):
+        writer.write(INSERT, {'action': str(index)})
+
+    blocked = eventlet.spawn(
+        writer.write, INSERT, {'action': '2'})
+    eventlet.sleep(0.01)
+    assert not blocked.dead
+
+    gt = eventlet.spawn(writer.run)
+    blocked.wait()
+    writer.stop()
+    gt.wait()
+
+    assert logged_actions(Session) == ['0', '1', '2']
+    assert writer.blocked_time > 0
+
+
+def test_raises_when_full_for_timeout(Session):
+    writer = WriteBehind(Session, max_size=1, timeout=0.01)
+    writer.write(INSERT, {'action': 'spam'})
+
+    with pytest.raises(WriteBehindFull):
+        writer.write(INSERT, {'action': 'ham'})
+
+    assert writer.as_dict()['queued'] == 1
+    assert writer.as_dict()['rejected'] == 1
+    assert writer.as_dict()['pending'] == 1
+
+
+def test_failing_rollback_drops_batch():
+    session = Mock()
+    session.commit.side_effect = ValueError('boom')
+    session.rollback.side_effect = RuntimeError('rollback failed')
+    writer = WriteBehind(Mock(return_value=session), interval=0)
+    writer.write(INSERT, {'action': 'spam'})
+    writer.write(INSERT, {'action': 'ham'})
+    writer.stop()
+
+    writer.run()
+
+    assert writer.as_dict()['written'] == 0
+    assert writer.as_dict()['failed'] == 2
+
+
+def test_failing_rollback_of_one_write_in_fallback(Session):
+    sessions = []
+
+    def make_session():
+        session = Session()
+        if len(sessions) == 1:
+            # the fallback session of the first write
+            session.rollback = Mock(side_effect=RuntimeError('failed'))
+        sessions.append(session)
+        return session
+
+    writer = WriteBehind(make_session, interval=0)
+    writer.write(INSERT, {'action': None})
+    writer.write(INSERT, {'action': 'ham'})
+    writer.stop()
+
+    writer.run()
+
+    assert logged_actions(Session) == ['ham']
+    assert writer.as_dict()['written'] == 1
+    assert writer.as_dict()['failed'] == 1
+    assert writer.as_dict()['fallbacks'] == 1
+
+
+def test_failing_close_keeps_running():
+    session = Mock()
+    session.close.side_effect = RuntimeError('close failed')
+    writer = WriteBehind(Mock(return_value=session), max_batch=1, interval=0)
+    writer.write(INSERT, {'action': 'spam'})
+    writer.write(INSERT, {'action': 'ham'})
+    writer.stop()
+
+    writer.run()
+
+    assert session.commit.call_count == 2
+    assert writer.as_dict()['written'] == 2
+    assert writer.as_dict()['failed'] == 0